@@ -0,0 +1,46 @@
+from celery import shared_task
+from .services.gemini_service import GeminiService
+from .models import AIRequestLog
+from people.models import LabTest, RadiologyTest, Operation
+import logging
+
+logger = logging.getLogger(__name__)
+
+# report_type -> (model, file field, summariser), as accepted by SummarizeReportView
+REPORT_TYPES = {
+    'LAB': (LabTest, 'report_file', GeminiService.summarize_lab_report),
+    'RADIOLOGY': (RadiologyTest, 'report_file', GeminiService.summarize_lab_report),
+    'OPERATION': (Operation, 'post_op_file', GeminiService.summarize_operation_report),
+}
+
+
+@shared_task
+def summarize_report(report_type, report_id, user_id=None):
+    """Celery task: generate and store the AI summary for an uploaded report."""
+    model, file_attr, summary_method = REPORT_TYPES[report_type]
+    obj = model.objects.filter(pk=report_id).first()
+    if obj is None or not getattr(obj, file_attr):
+        return {"status": "skipped", "report_id": report_id}
+
+    log_entry = AIRequestLog.objects.create(
+        user_id=user_id,
+        filename=f"{report_type}_{report_id}",
+        status='processing'
+    )
+    try:
+        with getattr(obj, file_attr).open('rb') as f:
+            summary = summary_method(file_obj=f)
+
+        model.objects.filter(pk=report_id).update(ai_summary=summary)
+
+        log_entry.status = 'success'
+        log_entry.summary_generated = summary
+        log_entry.save()
+        return {"status": "success", "report_id": report_id}
+
+    except Exception as e:
+        logger.error(f"Error summarizing {report_type} report {report_id}: {e}")
+        log_entry.status = 'failed'
+        log_entry.error_message = str(e)
+        log_entry.save()
+        return {"status": "failed", "report_id": report_id, "error": str(e)}
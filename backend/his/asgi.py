@@ -2,6 +2,9 @@
 ASGI config for his project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the project through it (e.g. ``uvicorn his.asgi:application``) so the
+notification stream (/api/notifications/stream/, an async view) holds open
+connections without tying up a worker thread each.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
@@ -14,6 +14,7 @@ from pathlib import Path
 from dotenv import load_dotenv
 import os
 from datetime import timedelta
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -116,6 +117,19 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared by every web process and Celery worker: the unread-notification
+# counters (people/inbox.py), the formulary and pharmacy queue versions and
+# the stream ticket markers are only correct when all processes see one cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/3'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -168,6 +182,34 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Report downloads (people/report_views.py). Set REPORT_SENDFILE to 'nginx'
+# (X-Accel-Redirect to an `internal` location aliased to MEDIA_ROOT) or
+# 'apache' (mod_xsendfile) to let the web server send the file body.
+REPORT_SENDFILE = os.getenv('REPORT_SENDFILE') or None
+REPORT_SENDFILE_PREFIX = '/protected-media/'
+REPORT_URL_MAX_AGE = 60 * 60
+
+# Staff account recorded on automatic stock movements (expiry write-offs).
+# Defaults to the first active admin.
+PHARMACY_SYSTEM_STAFF_EMAIL = os.getenv('PHARMACY_SYSTEM_STAFF_EMAIL') or None
+
+# Reorder suggestions (people/reorder.py): supplier lead time and the stock
+# cover a purchase should restore, in days.
+REORDER_LEAD_TIME_DAYS = 7
+REORDER_COVER_DAYS = 30
+
+# Notification push (people/push.py): 'redis' shares channels between web
+# processes and Celery workers; 'memory' only reaches streams in this process.
+NOTIFICATION_PUSH_BACKEND = os.getenv('NOTIFICATION_PUSH_BACKEND', 'redis')
+NOTIFICATION_PUSH_REDIS_URL = os.getenv('NOTIFICATION_PUSH_REDIS_URL', 'redis://localhost:6379/2')
+
+# Read notifications older than this many days are moved to
+# ArchivedNotification (people/inbox.py).
+NOTIFICATION_RETENTION_DAYS = 90
+
+# Pharmacy pending queue page cache (people/pharmacy_queue.py), in seconds.
+PHARMACY_QUEUE_CACHE_SECONDS = 5
+
 CORS_ALLOW_ALL_ORIGINS = True
 
 # Celery Configuration Options
@@ -176,4 +218,30 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/1'
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = TIME_ZONE
\ No newline at end of file
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'sweep-expired-stock': {
+        'task': 'people.tasks.sweep_expired_stock',
+        'schedule': crontab(hour=0, minute=5),
+    },
+    'snapshot-stock-levels': {
+        'task': 'people.tasks.snapshot_stock_levels',
+        'schedule': crontab(hour=0, minute=15),
+    },
+    'compute-reorder-suggestions': {
+        'task': 'people.tasks.compute_reorder_suggestions',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    'sweep-notification-outbox': {
+        'task': 'people.tasks.sweep_notification_outbox',
+        'schedule': crontab(),
+    },
+    'archive-old-notifications': {
+        'task': 'people.tasks.archive_old_notifications',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    'sweep-report-blobs': {
+        'task': 'people.tasks.sweep_report_blobs',
+        'schedule': crontab(hour=2, minute=0),
+    },
+}
@@ -3,9 +3,6 @@ from django.urls import path, include
 from rest_framework_simplejwt.views import TokenRefreshView
 from people.views import CustomTokenObtainPairView
 
-from django.conf import settings
-from django.conf.urls.static import static
-
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('people.urls')),
@@ -13,4 +10,7 @@ urlpatterns = [
     path('api/ml/', include('ml_module.urls')),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+# Report files are not exposed under MEDIA_URL; they are served by the
+# authenticated /api/reports/<kind>/<pk>/ view (see people/report_views.py).
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
-from .models import  Bill, BillItem, InsuranceClaim ,Patient, Staff, Visit, Bed, Admission, Vital, ClinicalNote, Order, LabTest, RadiologyTest, Medicine, MedicineBatch, StockTransaction, Prescription, PrescriptionDispense, Operation
+from .models import  Bill, BillItem, InsuranceClaim ,Patient, Staff, Visit, Bed, Admission, Vital, ClinicalNote, Order, LabTest, RadiologyTest, Medicine, MedicineBatch, StockTransaction, Prescription, PrescriptionDispense, Operation, OrderSet
 
 
 class StaffAdminForm(forms.ModelForm):
@@ -139,6 +139,12 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'visit', 'doctor', 'order_type', 'status', 'ordered_at')
     list_filter = ('order_type', 'status')
 
+@admin.register(OrderSet)
+class OrderSetAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'is_active', 'created_by', 'created_at')
+    list_filter = ('is_active',)
+    search_fields = ('name',)
+
 @admin.register(LabTest)
 class LabTestAdmin(admin.ModelAdmin):
     list_display = ('id', 'test_name', 'order', 'status', 'result', 'price', 'completed_at')
@@ -160,6 +166,9 @@ class MedicineAdmin(admin.ModelAdmin):
     search_fields = ('name', 'generic_name')
     inlines = [MedicineBatchInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stock()
+
 @admin.register(MedicineBatch)
 class MedicineBatchAdmin(admin.ModelAdmin):
     list_display = ('batch_number', 'medicine', 'stock_qty', 'expiry_date', 'unit_price', 'is_recalled')
@@ -0,0 +1,133 @@
+"""
+Patient chart projection.
+
+DoctorPatientProfileView reads a single PatientChart row instead of walking
+visits, notes and vitals per request. Each section below is rebuilt with one
+or two queries when its source rows change (see people/signals.py).
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Allergy, ClinicalNote, PatientChart, Prescription, Visit, Vital
+
+ACTIVE_PRESCRIPTION_STATUSES = ('PENDING', 'PARTIALLY_DISPENSED')
+
+
+def build_visit_history(patient_id):
+    visits = list(
+        Visit.objects.filter(patient_id=patient_id)
+        .order_by('-visit_date', '-id')
+        .values('id', 'visit_date', 'status', 'chief_complaint')
+    )
+
+    # Diagnosis comes from the first clinical note on each visit.
+    first_note = {}
+    notes = (
+        ClinicalNote.objects.filter(visit__patient_id=patient_id)
+        .order_by('visit_id', 'note_id')
+        .values_list('visit_id', 'diagnosis')
+    )
+    for visit_id, diagnosis in notes:
+        first_note.setdefault(visit_id, diagnosis)
+
+    history = []
+    for v in visits:
+        diagnosis = v['chief_complaint'] or 'Routine Checkup'
+        if v['id'] in first_note:
+            diagnosis = first_note[v['id']]
+        history.append({
+            'date': v['visit_date'].isoformat(),
+            'diagnosis': diagnosis,
+            'status': v['status'],
+            'visit_id': v['id'],
+        })
+    return history
+
+
+def build_latest_vitals(patient_id):
+    vital = Vital.objects.filter(visit__patient_id=patient_id).order_by('-recorded_at').first()
+    if not vital:
+        return {'bp': 'N/A', 'hr': 'N/A', 'temp': 'N/A', 'weight': 'N/A'}
+    return {
+        'bp': f"{vital.bp_systolic}/{vital.bp_diastolic}",
+        'hr': vital.pulse,
+        'temp': str(vital.temperature),
+        'spo2': vital.spo2,
+        'early_warning_score': vital.early_warning_score,
+        'recorded_at': vital.recorded_at.isoformat(),
+        'weight': 'N/A',
+    }
+
+
+def build_allergies(patient_id):
+    return list(
+        Allergy.objects.filter(patient_id=patient_id)
+        .order_by('-created_at')
+        .values('id', 'allergen', 'severity', 'reaction')
+    )
+
+
+def build_active_prescriptions(patient_id):
+    prescriptions = (
+        Prescription.objects.filter(visit__patient_id=patient_id, status__in=ACTIVE_PRESCRIPTION_STATUSES)
+        .order_by('-created_at')
+        .values(
+            'prescription_id', 'visit_id', 'medicine__name', 'dosage_per_day',
+            'duration', 'quantity', 'status',
+        )
+    )
+    return [
+        {
+            'prescription_id': p['prescription_id'],
+            'visit_id': p['visit_id'],
+            'medicine': p['medicine__name'],
+            'dosage_per_day': p['dosage_per_day'],
+            'duration': p['duration'],
+            'quantity': p['quantity'],
+            'status': p['status'],
+        }
+        for p in prescriptions
+    ]
+
+
+SECTION_BUILDERS = {
+    'visit_history': build_visit_history,
+    'latest_vitals': build_latest_vitals,
+    'allergies': build_allergies,
+    'active_prescriptions': build_active_prescriptions,
+}
+
+
+def build_chart(patient_id):
+    """Build (or rebuild) every section and return the saved PatientChart."""
+    values = {name: builder(patient_id) for name, builder in SECTION_BUILDERS.items()}
+    chart, created = PatientChart.objects.get_or_create(patient_id=patient_id, defaults=values)
+    if not created:
+        for name, value in values.items():
+            setattr(chart, name, value)
+        chart.version += 1
+        chart.save()
+    return chart
+
+
+def refresh_chart(patient_ids, *sections):
+    """
+    Rebuild the given sections for charts that already exist and bump their
+    version. Charts that were never built are left alone; the profile view
+    builds them on first read.
+    """
+    if isinstance(patient_ids, int):
+        patient_ids = [patient_ids]
+    existing = PatientChart.objects.filter(patient_id__in=patient_ids).values_list('patient_id', flat=True)
+    for patient_id in existing:
+        values = {name: SECTION_BUILDERS[name](patient_id) for name in sections}
+        PatientChart.objects.filter(patient_id=patient_id).update(
+            version=F('version') + 1, updated_at=timezone.now(), **values
+        )
+
+
+def touch_chart(patient_id):
+    """Bump the version (and so the ETag) without rebuilding any section."""
+    PatientChart.objects.filter(patient_id=patient_id).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
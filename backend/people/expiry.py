@@ -0,0 +1,155 @@
+"""
+Nightly expiry handling.
+
+sweep_expired() writes lapsed batches off the shelf: one EXPIRED
+StockTransaction per batch, created in bulk, stock_qty set to zero and any
+prescription reservations on them released, in the same transaction. refresh_expiry_buckets() rebuilds ExpiryBucketSummary from
+one grouped query so the pharmacy dashboard reads counts instead of scanning
+every batch on each request; refresh_medicine_buckets() keeps it current for
+medicines whose batches are added or edited during the day.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Count, DecimalField, F, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ExpiryBucketSummary, MedicineBatch, Staff, StockTransaction
+from .reservations import BATCH_LOCK_ORDER, release_batches
+
+logger = logging.getLogger(__name__)
+
+EXPIRING_SOON_DAYS = 30
+EXPIRING_LATER_DAYS = 90
+
+
+def system_performer():
+    """
+    Staff recorded as performer of automatic stock movements: the account named by
+    PHARMACY_SYSTEM_STAFF_EMAIL, otherwise the first active admin.
+    """
+    email = getattr(settings, 'PHARMACY_SYSTEM_STAFF_EMAIL', None)
+    if email:
+        return Staff.objects.filter(user_email=email).first()
+    return Staff.objects.filter(role='ADMIN', is_active=True).order_by('pk').first()
+
+
+def sweep_expired(today=None, performer=None):
+    """Write off remaining stock of batches that expired before `today`. Returns the number of batches."""
+    today = today or timezone.localdate()
+    performer = performer or system_performer()
+    if performer is None:
+        raise ValueError('No staff account to record the expiry write-off; set PHARMACY_SYSTEM_STAFF_EMAIL')
+
+    with transaction.atomic():
+        lapsed = list(
+            MedicineBatch.objects.select_for_update()
+            .filter(expiry_date__lt=today, stock_qty__gt=0)
+            .order_by(*BATCH_LOCK_ORDER)
+        )
+        if not lapsed:
+            return 0
+        StockTransaction.objects.bulk_create([
+            StockTransaction(
+                batch=batch,
+                transaction_type='EXPIRED',
+                quantity=-batch.stock_qty,
+                reference_id=f"EXP-{today.isoformat()}",
+                performed_by=performer,
+                notes=f"Expired on {batch.expiry_date.isoformat()}",
+            )
+            for batch in lapsed
+        ])
+        MedicineBatch.objects.filter(pk__in=[batch.pk for batch in lapsed]).update(stock_qty=0)
+        release_batches([batch.pk for batch in lapsed])
+    return len(lapsed)
+
+
+def bucket_expression(today):
+    return Case(
+        When(expiry_date__lt=today, then=Value('EXPIRED')),
+        When(expiry_date__lte=today + timedelta(days=EXPIRING_SOON_DAYS), then=Value('DAYS_30')),
+        When(expiry_date__lte=today + timedelta(days=EXPIRING_LATER_DAYS), then=Value('DAYS_90')),
+        default=Value('BEYOND_90'),
+        output_field=CharField(),
+    )
+
+
+def _summary_rows(batches, today):
+    grouped = (
+        batches.order_by()
+        .annotate(bucket=bucket_expression(today))
+        .values('medicine_id', 'bucket')
+        .annotate(
+            batch_count=Count('pk'),
+            qty=Coalesce(Sum('stock_qty'), 0),
+            value=Coalesce(
+                Sum(F('stock_qty') * F('unit_price'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+                Value(0, output_field=DecimalField(max_digits=14, decimal_places=2)),
+            ),
+        )
+    )
+    rows = [
+        ExpiryBucketSummary(
+            medicine_id=row['medicine_id'], bucket=row['bucket'], batch_count=row['batch_count'],
+            stock_qty=row['qty'], stock_value=row['value'], as_of=today,
+        )
+        for row in grouped
+    ]
+    return rows
+
+
+def refresh_expiry_buckets(today=None):
+    """Rebuild ExpiryBucketSummary for `today`. Returns the number of rows written."""
+    today = today or timezone.localdate()
+    rows = _summary_rows(MedicineBatch.objects.all(), today)
+    with transaction.atomic():
+        ExpiryBucketSummary.objects.all().delete()
+        ExpiryBucketSummary.objects.bulk_create(rows)
+    return len(rows)
+
+
+def refresh_medicine_buckets(medicine_ids, today=None):
+    """
+    Recompute today's summary rows for these medicines after their batches change
+    (GRN, manual entry), so bucket_totals() does not miss them until the nightly
+    rebuild. Nothing to do when the summary is not from today: bucket_totals()
+    counts live then. Returns the number of rows written.
+    """
+    today = today or timezone.localdate()
+    medicine_ids = set(medicine_ids)
+    if not medicine_ids or not ExpiryBucketSummary.objects.filter(as_of=today).exists():
+        return 0
+    rows = _summary_rows(MedicineBatch.objects.filter(medicine_id__in=medicine_ids), today)
+    with transaction.atomic():
+        ExpiryBucketSummary.objects.filter(medicine_id__in=medicine_ids).delete()
+        # Upsert, in case a concurrent refresh of the same medicine got there first.
+        ExpiryBucketSummary.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['medicine', 'bucket'],
+            update_fields=['batch_count', 'stock_qty', 'stock_value', 'as_of'],
+        )
+    return len(rows)
+
+
+def bucket_totals(today=None):
+    """
+    Batch counts per bucket as {bucket: count}, from the summary table when it is
+    current and from a live aggregate otherwise.
+    """
+    today = today or timezone.localdate()
+    rows = list(
+        ExpiryBucketSummary.objects.filter(as_of=today)
+        .values('bucket').annotate(total=Sum('batch_count')).values_list('bucket', 'total')
+    )
+    if not rows:
+        rows = (
+            MedicineBatch.objects.order_by()
+            .annotate(bucket=bucket_expression(today))
+            .values('bucket').annotate(total=Count('pk')).values_list('bucket', 'total')
+        )
+    totals = {bucket: 0 for bucket, _ in ExpiryBucketSummary.BUCKET_CHOICES}
+    totals.update(rows)
+    return totals
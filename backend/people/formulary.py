@@ -0,0 +1,173 @@
+"""
+Formulary index for brand substitution.
+
+Medicines are grouped in memory by normalized (generic_name, category), so
+the equivalents of a prescribed medicine are a dict lookup. Medicine
+post_save/post_delete keep the local index current; bulk writes (GRN intake)
+call medicines_changed() instead. Every change also bumps a version in the
+shared cache, and other processes rebuild their copy (one query) when they
+see a newer version, so gunicorn/celery workers do not drift apart. As a
+backstop for a lost version bump, a copy older than LOCAL_COPY_SECONDS is
+rebuilt, and so is one that does not know a medicine the database has.
+While the cache is unreachable every lookup rebuilds the copy.
+"""
+import logging
+import re
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import F, Min, Sum
+from django.utils import timezone
+
+from .models import Medicine, MedicineBatch
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION_KEY = 'formulary_index_version'
+LOCAL_COPY_SECONDS = 5 * 60
+
+
+def normalize(value):
+    return re.sub(r'\s+', ' ', (value or '').strip().lower())
+
+
+def formulary_key(generic_name, category):
+    """(generic, category) group of a medicine, or None when it has no generic name."""
+    generic = normalize(generic_name)
+    return (generic, normalize(category)) if generic else None
+
+
+class FormularyIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups = {}  # key -> set of medicine ids
+        self._keys = {}  # medicine id -> key (None when not substitutable)
+        self._version = None
+        self._built_at = None
+
+    def _current_version(self):
+        """The shared version, or None when the cache is unreachable."""
+        try:
+            return cache.get_or_set(INDEX_VERSION_KEY, time.time_ns, timeout=None)
+        except Exception as e:
+            logger.error(f"Formulary version unavailable, rebuilding the index: {e}")
+            return None
+
+    def _rebuild(self, version):
+        groups, keys = {}, {}
+        for pk, generic_name, category in Medicine.objects.values_list('pk', 'generic_name', 'category'):
+            key = formulary_key(generic_name, category)
+            keys[pk] = key
+            if key:
+                groups.setdefault(key, set()).add(pk)
+        self._groups, self._keys, self._version = groups, keys, version
+        self._built_at = time.monotonic()
+
+    def _is_current(self, version):
+        return version is not None and version == self._version and time.monotonic() - self._built_at < LOCAL_COPY_SECONDS
+
+    def _ensure_current(self):
+        version = self._current_version()
+        if not self._is_current(version):
+            with self._lock:
+                if not self._is_current(version):
+                    self._rebuild(version)
+
+    def _place(self, pk, key):
+        old = self._keys.get(pk)
+        if old and old != key:
+            group = self._groups.get(old, set())
+            group.discard(pk)
+            if not group:
+                self._groups.pop(old, None)
+        self._keys[pk] = key
+        if key:
+            self._groups.setdefault(key, set()).add(pk)
+
+    def update(self, medicines):
+        """Apply saved medicines to this process's index and tell the other processes."""
+        self._apply([(medicine.pk, formulary_key(medicine.generic_name, medicine.category)) for medicine in medicines])
+
+    def remove(self, medicine_id):
+        self._apply([(medicine_id, None)], delete=True)
+
+    def _apply(self, changes, delete=False):
+        with self._lock:
+            version = None
+            try:
+                try:
+                    version = cache.incr(INDEX_VERSION_KEY)
+                except ValueError:
+                    cache.set(INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+            except Exception as e:
+                logger.error(f"Could not bump the formulary version: {e}")
+            if version is None or self._version is None or version != self._version + 1:
+                # Another process changed the formulary since our last build; rebuild on next lookup.
+                self._version = None
+                return
+            for pk, key in changes:
+                self._place(pk, key)
+                if delete:
+                    self._keys.pop(pk, None)
+            self._version = version
+
+    def key_of(self, medicine_id):
+        """Returns (found, key)."""
+        self._ensure_current()
+        if medicine_id not in self._keys and Medicine.objects.filter(pk=medicine_id).exists():
+            # Created by another process whose version bump we missed.
+            with self._lock:
+                self._rebuild(self._current_version())
+        return medicine_id in self._keys, self._keys.get(medicine_id)
+
+    def equivalents(self, medicine_id):
+        """Ids of other medicines in the same (generic, category) group."""
+        self._ensure_current()
+        key = self._keys.get(medicine_id)
+        return sorted(self._groups.get(key, set()) - {medicine_id}) if key else []
+
+
+formulary = FormularyIndex()
+
+
+def medicines_changed(medicines):
+    formulary.update(medicines)
+
+
+def substitutes(medicine_id, today=None):
+    """
+    In-stock equivalents of a medicine with unreserved quantity and nearest
+    expiry, from one grouped query. Returns None for an unknown medicine.
+    """
+    found, key = formulary.key_of(medicine_id)
+    if not found:
+        return None
+    today = today or timezone.localdate()
+    rows = (
+        MedicineBatch.objects.filter(
+            medicine_id__in=formulary.equivalents(medicine_id),
+            is_recalled=False, expiry_date__gt=today, stock_qty__gt=F('reserved_qty'),
+        )
+        .order_by()
+        .values('medicine_id', 'medicine__name', 'medicine__manufacturer')
+        .annotate(available_stock=Sum(F('stock_qty') - F('reserved_qty')), nearest_expiry=Min('expiry_date'))
+    )
+    return {
+        'medicine_id': medicine_id,
+        'generic_name': key[0] if key else None,
+        'category': (key[1] or None) if key else None,
+        'substitutes': sorted(
+            (
+                {
+                    'medicine_id': row['medicine_id'],
+                    'name': row['medicine__name'],
+                    'manufacturer': row['medicine__manufacturer'],
+                    'available_stock': row['available_stock'],
+                    'nearest_expiry': row['nearest_expiry'],
+                }
+                for row in rows
+            ),
+            key=lambda item: (item['nearest_expiry'], item['name']),
+        ),
+    }
@@ -0,0 +1,166 @@
+"""
+Goods receipt (GRN) intake.
+
+A whole supplier invoice is booked in one transaction: invoice lines are
+matched to medicines by name or generic name (case-insensitive, one locking query),
+unknown medicines are created, and every line becomes a MedicineBatch plus
+its PURCHASE StockTransaction via bulk_create.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .models import Medicine, MedicineBatch, StockTransaction
+from .expiry import refresh_medicine_buckets
+from .formulary import medicines_changed
+from .pharmacy_queue import invalidate_queue
+
+MAX_GRN_LINES = 500
+
+# Filled on an existing medicine only when it has no value yet.
+MEDICINE_DETAIL_FIELDS = ('generic_name', 'category', 'manufacturer')
+
+
+def _key(value):
+    return (value or '').strip().lower()
+
+
+def match_medicines(lines):
+    """
+    Resolve each line to a Medicine: explicit medicine_id, then exact name, then
+    generic name. Returns ({line index: Medicine}, [indexes of unmatched lines]).
+    The candidates are locked, so call this inside a transaction.
+    """
+    ids = {line['medicine_id'] for line in lines if line.get('medicine_id')}
+    names = {_key(line.get('medicine_name')) for line in lines} - {''}
+    generics = {_key(line.get('generic_name')) for line in lines} - {''}
+
+    candidates = list(
+        Medicine.objects.select_for_update()
+        .annotate(name_key=Lower('name'), generic_key=Lower('generic_name'))
+        .filter(Q(pk__in=ids) | Q(name_key__in=names) | Q(generic_key__in=generics | names))
+        .order_by('pk')
+    )
+    by_id = {m.pk: m for m in candidates}
+    by_name, by_generic = {}, {}
+    for medicine in candidates:
+        by_name.setdefault(medicine.name_key, medicine)
+        if medicine.generic_key:
+            by_generic.setdefault(medicine.generic_key, medicine)
+
+    matched, unmatched = {}, []
+    for index, line in enumerate(lines):
+        name, generic = _key(line.get('medicine_name')), _key(line.get('generic_name'))
+        medicine = (
+            by_id.get(line.get('medicine_id'))
+            or by_name.get(name)
+            or by_generic.get(generic)
+            or by_generic.get(name)
+        )
+        if medicine is None and line.get('medicine_id'):
+            raise ValueError(f"Line {index + 1}: medicine {line['medicine_id']} does not exist")
+        if medicine is None:
+            unmatched.append(index)
+        else:
+            matched[index] = medicine
+    return matched, unmatched
+
+
+def receive_goods(invoice, performed_by):
+    """
+    Book a validated invoice ({"invoice_number", "supplier", "lines": [...]}).
+    Raises ValueError (nothing written) for unknown medicine ids or batches that already exist.
+    """
+    lines = invoice['lines']
+    reference = f"GRN-{invoice['invoice_number']}"
+    notes = f"Supplier: {invoice['supplier']}" if invoice.get('supplier') else ''
+
+    with transaction.atomic():
+        matched, unmatched = match_medicines(lines)
+
+        # Unknown medicines: one new Medicine per distinct name on the invoice.
+        new_medicines = {}
+        for index in unmatched:
+            line = lines[index]
+            key = _key(line['medicine_name'])
+            if key not in new_medicines:
+                new_medicines[key] = Medicine(
+                    name=line['medicine_name'].strip(),
+                    **{field: line.get(field) or None for field in MEDICINE_DETAIL_FIELDS},
+                )
+        Medicine.objects.bulk_create(new_medicines.values())
+        for index in unmatched:
+            matched[index] = new_medicines[_key(lines[index]['medicine_name'])]
+
+        filled = {}
+        for index in sorted(matched.keys() - set(unmatched)):
+            medicine = matched[index]
+            for field in MEDICINE_DETAIL_FIELDS:
+                if lines[index].get(field) and not getattr(medicine, field):
+                    setattr(medicine, field, lines[index][field])
+                    filled[medicine.pk] = medicine
+        if filled:
+            Medicine.objects.bulk_update(filled.values(), list(MEDICINE_DETAIL_FIELDS))
+
+        # The matched medicines are locked by match_medicines(), so a concurrent GRN for
+        # the same batch waits here and then finds this one's batches.
+        wanted = {(matched[i].pk, lines[i]['batch_number'].strip()) for i in range(len(lines))}
+        if len(wanted) != len(lines):
+            raise ValueError('The invoice lists the same batch of a medicine more than once')
+        existing = (
+            MedicineBatch.objects.filter(
+                medicine_id__in={pk for pk, _ in wanted},
+                batch_number__in={number for _, number in wanted},
+            )
+            .values_list('medicine_id', 'batch_number')
+        )
+        duplicates = sorted(number for pk, number in existing if (pk, number) in wanted)
+        if duplicates:
+            raise ValueError(f"Batches already received: {', '.join(duplicates)}")
+
+        batches = MedicineBatch.objects.bulk_create([
+            MedicineBatch(
+                medicine=matched[index],
+                batch_number=line['batch_number'].strip(),
+                expiry_date=line['expiry_date'],
+                stock_qty=line['quantity'],
+                received_qty=line['quantity'],
+                purchase_price=line.get('purchase_price') or 0,
+                unit_price=line['unit_price'],
+            )
+            for index, line in enumerate(lines)
+        ])
+        ledger = StockTransaction.objects.bulk_create([
+            StockTransaction(
+                batch=batch,
+                transaction_type='PURCHASE',
+                quantity=batch.received_qty,
+                reference_id=reference,
+                performed_by=performed_by,
+                notes=notes,
+            )
+            for batch in batches
+        ])
+        transaction.on_commit(invalidate_queue)
+        # bulk_create skips the MedicineBatch signals that keep the expiry summary current.
+        received = {batch.medicine_id for batch in batches}
+        transaction.on_commit(lambda: refresh_medicine_buckets(received))
+        # bulk_create/bulk_update skip the Medicine signals that maintain the formulary index.
+        changed = list(new_medicines.values()) + list(filled.values())
+        if changed:
+            transaction.on_commit(lambda: medicines_changed(changed))
+
+    return {
+        'invoice_number': invoice['invoice_number'],
+        'reference_id': reference,
+        'medicines_created': [medicine.pk for medicine in new_medicines.values()],
+        'lines': [
+            {
+                'line': index + 1,
+                'medicine_id': batch.medicine_id,
+                'batch_id': batch.pk,
+                'transaction_id': txn.pk,
+            }
+            for index, (batch, txn) in enumerate(zip(batches, ledger))
+        ],
+    }
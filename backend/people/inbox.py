@@ -0,0 +1,136 @@
+"""
+Notification inbox bookkeeping: unread counters and retention.
+
+The bell asks GET /api/notifications/unread_count/, which reads a per-audience
+counter from the cache instead of counting rows. A missing counter is rebuilt
+from the (recipient|patient, is_read, created_at) index. New notifications
+increment it and mark-read decrements it, after the transaction commits. A
+counter that is not cached is left alone, because the next read rebuilds it.
+Counters expire after UNREAD_COUNTER_SECONDS, which bounds any drift from a
+rebuild racing a write. The cache is best effort: when it is unreachable the
+count comes from the index, and a counter that could not be adjusted is
+dropped so the next read rebuilds it.
+
+archive_read() moves read notifications older than the retention period into
+ArchivedNotification in chunks, so the live table only grows with what users
+still look at.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedNotification, Notification, Patient, Staff
+
+logger = logging.getLogger(__name__)
+
+UNREAD_COUNTER_SECONDS = 60 * 60
+ARCHIVE_CHUNK_SIZE = 1000
+
+
+def audience_for(user):
+    """Filter for a logged-in user's notifications: their Staff row, else their Patient record."""
+    staff_id = Staff.objects.filter(user_email=user.username).values_list('pk', flat=True).first()
+    if staff_id:
+        return {'recipient_id': staff_id}
+    patients = Patient.objects.all()
+    if user.username.startswith('p_'):
+        patient_id = patients.filter(uhid=user.username[2:]).values_list('pk', flat=True).first()
+    else:
+        patient_id = patients.filter(email=user.email).values_list('pk', flat=True).first() if user.email else None
+    return {'patient_id': patient_id} if patient_id else None
+
+
+def _counter_key(recipient_id=None, patient_id=None):
+    if recipient_id:
+        return f"notif_unread:staff:{recipient_id}"
+    return f"notif_unread:patient:{patient_id}"
+
+
+def unread_count(audience):
+    key = _counter_key(**audience)
+    try:
+        count = cache.get(key)
+    except Exception as e:
+        logger.error(f"Unread counter unavailable, counting rows: {e}")
+        return Notification.objects.filter(is_read=False, **audience).count()
+    if count is None or count < 0:
+        count = Notification.objects.filter(is_read=False, **audience).count()
+        try:
+            cache.set(key, count, UNREAD_COUNTER_SECONDS)
+        except Exception as e:
+            logger.error(f"Could not cache unread counter {key}: {e}")
+    return count
+
+
+def _forget(key):
+    try:
+        cache.delete(key)
+    except Exception as e:
+        logger.error(f"Could not drop unread counter {key}; it expires within the hour: {e}")
+
+
+def _adjust(deltas):
+    for key, delta in deltas.items():
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass  # Not cached; rebuilt on the next read.
+        except Exception as e:
+            logger.error(f"Could not adjust unread counter {key}: {e}")
+            _forget(key)
+
+
+def notifications_added(notifications):
+    """Count new unread notifications once the surrounding transaction commits."""
+    deltas = Counter(
+        _counter_key(n.recipient_id, n.patient_id)
+        for n in notifications if not n.is_read and (n.recipient_id or n.patient_id)
+    )
+    if deltas:
+        transaction.on_commit(lambda: _adjust(deltas))
+
+
+def notifications_read(audience, count):
+    """Take `count` newly read notifications off the audience's counter after commit."""
+    if count:
+        key = _counter_key(**audience)
+        transaction.on_commit(lambda: _adjust({key: -count}))
+
+
+def reset_unread(audience):
+    key = _counter_key(**audience)
+    transaction.on_commit(lambda: _forget(key))
+
+
+def archive_read(older_than_days=None, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """Move read notifications older than the retention period to the archive. Returns the number moved."""
+    days = older_than_days if older_than_days is not None else settings.NOTIFICATION_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+                .order_by('pk')
+                .values('pk', 'recipient_id', 'patient_id', 'title', 'message', 'type', 'created_at')[:chunk_size]
+            )
+            if not rows:
+                break
+            ArchivedNotification.objects.bulk_create(
+                [
+                    ArchivedNotification(
+                        notification_id=row['pk'], recipient_id=row['recipient_id'], patient_id=row['patient_id'],
+                        title=row['title'], message=row['message'], type=row['type'], created_at=row['created_at'],
+                    )
+                    for row in rows
+                ],
+                ignore_conflicts=True,
+            )
+            Notification.objects.filter(pk__in=[row['pk'] for row in rows], is_read=True).delete()
+        moved += len(rows)
+    return moved
@@ -0,0 +1,242 @@
+"""
+Pharmacy stock allocation.
+
+Dispensing takes row locks on the prescriptions and on the candidate batches
+(select_for_update, in a fixed order so concurrent dispenses lock in the
+same sequence), splits each quantity across batches First-Expiry-First-Out,
+and writes the stock movements with bulk_update/bulk_create in one
+transaction. A single dispense and a whole discharge queue go through the
+same code path. Each prescription may use its own reservations
+(people/reservations.py) but not stock reserved for others, and its holds
+are consumed or released as it is dispensed.
+"""
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .chart import refresh_chart
+from .models import MedicineBatch, Prescription, PrescriptionDispense, PrescriptionReservation, StockTransaction
+from .pharmacy_queue import invalidate_queue
+from .reservations import BATCH_LOCK_ORDER
+
+MAX_BATCH_DISPENSE = 200
+
+
+class DispenseError(Exception):
+    """Raised when a dispense cannot be fulfilled; `detail` is returned to the client."""
+
+    def __init__(self, message, **extra):
+        super().__init__(message)
+        self.detail = {'error': message, **extra}
+
+
+def _allocate(batches, quantity, batch_id=None, held=None):
+    """
+    Pick (batch, qty) pairs from `batches` (locked, earliest expiry first)
+    for `quantity` units, without touching stock. Units reserved for other
+    prescriptions are not available; `held` ({batch_id: qty}) is what this
+    prescription reserved itself. Raises DispenseError.
+    """
+    held = held or {}
+    if batch_id:
+        batches = [batch for batch in batches if str(batch.pk) == str(batch_id)]
+
+    def free(batch):
+        return min(batch.stock_qty, batch.available_qty + held.get(batch.pk, 0))
+
+    allocations = []
+    remaining = quantity
+    for batch in batches:
+        if remaining == 0:
+            break
+        take = min(remaining, free(batch))
+        if take > 0:
+            allocations.append((batch, take))
+            remaining -= take
+
+    if remaining > 0:
+        available = sum(free(batch) for batch in batches)
+        if batch_id:
+            raise DispenseError(
+                'Selected batch is expired, recalled, or has insufficient stock',
+                available=available, required=quantity,
+            )
+        raise DispenseError('Insufficient stock across valid batches', available=available, required=quantity)
+    return allocations
+
+
+def _consume_reservations(held, allocations, outstanding_after, batches_by_id):
+    """
+    Apply a dispense to the prescription's own reservations (held: {batch_id:
+    PrescriptionReservation}): units taken from a reserved batch come out of its
+    hold, and holds beyond what is still outstanding are released, latest expiry first.
+    """
+    for batch, qty in allocations:
+        reservation = held.get(batch.pk)
+        if reservation:
+            used = min(qty, reservation.quantity)
+            reservation.quantity -= used
+            batch.reserved_qty -= used
+
+    excess = sum(r.quantity for r in held.values()) - outstanding_after
+    latest_first = sorted(
+        held.values(), key=lambda r: (batches_by_id[r.batch_id].expiry_date, r.batch_id), reverse=True,
+    )
+    for reservation in latest_first:
+        if excess <= 0:
+            break
+        drop = min(excess, reservation.quantity)
+        reservation.quantity -= drop
+        batches_by_id[reservation.batch_id].reserved_qty -= drop
+        excess -= drop
+
+
+def dispense_many(items, pharmacist, notes=''):
+    """
+    Dispense several prescriptions in one locked transaction.
+    items: [{"prescription_id": id, "quantity": n (optional, default outstanding),
+             "batch_id": id (optional)}, ...]
+    Each item succeeds or fails on its own; returns one result per item.
+    """
+    ids = [item.get('prescription_id') for item in items]
+    today = timezone.localdate()
+    now = timezone.now()
+
+    with transaction.atomic():
+        prescriptions = Prescription.objects.select_for_update().filter(pk__in=[i for i in ids if str(i).isdigit()])
+        prescriptions = {str(p.pk): p for p in prescriptions.order_by('pk')}
+        already = dict(
+            PrescriptionDispense.objects.filter(prescription_id__in=[p.pk for p in prescriptions.values()])
+            .values('prescription_id').annotate(total=Sum('quantity_dispensed'))
+            .values_list('prescription_id', 'total')
+        )
+
+        reservations = {}
+        for reservation in PrescriptionReservation.objects.filter(prescription_id__in=[p.pk for p in prescriptions.values()]):
+            reservations.setdefault(reservation.prescription_id, {})[reservation.batch_id] = reservation
+
+        stock, batches_by_id = {}, {}
+        dispensable = Q(is_recalled=False, expiry_date__gt=today, stock_qty__gt=0)
+        locked_batches = (
+            MedicineBatch.objects.select_for_update()
+            .filter(
+                Q(medicine_id__in={p.medicine_id for p in prescriptions.values()}) & dispensable
+                # Held batches are locked too, so holds on them can be released.
+                | Q(pk__in={batch_id for held in reservations.values() for batch_id in held})
+            )
+            .order_by(*BATCH_LOCK_ORDER)
+        )
+        for batch in locked_batches:
+            batches_by_id[batch.pk] = batch
+            if not batch.is_recalled and batch.expiry_date > today and batch.stock_qty > 0:
+                stock.setdefault(batch.medicine_id, []).append(batch)
+
+        results = []
+        touched_batches = {}
+        touched_reservations = []
+        transactions, dispenses, completed = [], [], []
+        for item in items:
+            key = str(item.get('prescription_id'))
+            prescription = prescriptions.get(key)
+            try:
+                if prescription is None:
+                    raise DispenseError('Prescription not found')
+                if any(p is prescription for p in completed):
+                    raise DispenseError('Prescription listed more than once')
+                if prescription.status == 'DISPENSED':
+                    raise DispenseError('Prescription has already been dispensed')
+                if prescription.status == 'CANCELLED':
+                    raise DispenseError('Cannot dispense cancelled prescription')
+
+                dispensed_before = already.get(prescription.pk, 0)
+                outstanding = prescription.quantity - dispensed_before
+                try:
+                    quantity = outstanding if item.get('quantity') in (None, '') else int(item['quantity'])
+                except (TypeError, ValueError):
+                    raise DispenseError('Quantity must be a whole number')
+                if quantity <= 0 or quantity > outstanding:
+                    raise DispenseError('Quantity must be between 1 and the outstanding amount', outstanding=outstanding)
+
+                held = reservations.get(prescription.pk, {})
+                allocations = _allocate(
+                    stock.get(prescription.medicine_id, []), quantity, item.get('batch_id'),
+                    held={batch_id: r.quantity for batch_id, r in held.items()},
+                )
+            except DispenseError as e:
+                results.append({'prescription_id': item.get('prescription_id'), 'ok': False, **e.detail})
+                continue
+
+            _consume_reservations(held, allocations, outstanding - quantity, batches_by_id)
+            for reservation in held.values():
+                touched_batches[reservation.batch_id] = batches_by_id[reservation.batch_id]
+                touched_reservations.append(reservation)
+
+            for batch, qty in allocations:
+                # Rows are locked, so the in-memory balance is authoritative.
+                batch.stock_qty -= qty
+                touched_batches[batch.pk] = batch
+                transactions.append(StockTransaction(
+                    batch=batch,
+                    transaction_type='DISPENSE',
+                    quantity=-qty,
+                    reference_id=f"Presc-{prescription.prescription_id}",
+                    performed_by=pharmacist,
+                    notes=notes,
+                ))
+                dispenses.append(PrescriptionDispense(
+                    prescription=prescription,
+                    medicine_id=prescription.medicine_id,
+                    batch=batch,
+                    quantity_dispensed=qty,
+                    dispensed_by=pharmacist,
+                    notes=notes,
+                ))
+
+            prescription.status = (
+                'DISPENSED' if dispensed_before + quantity >= prescription.quantity else 'PARTIALLY_DISPENSED'
+            )
+            prescription.dispensed_at = now
+            prescription.dispensed_by = pharmacist
+            completed.append(prescription)
+            results.append({
+                'prescription_id': prescription.pk,
+                'ok': True,
+                'status': prescription.status,
+                'dispensed': quantity,
+                'batches': [{'batch_id': b.pk, 'batch_number': b.batch_number, 'quantity': q} for b, q in allocations],
+            })
+
+        if completed:
+            MedicineBatch.objects.bulk_update(touched_batches.values(), ['stock_qty', 'reserved_qty'])
+            if touched_reservations:
+                PrescriptionReservation.objects.filter(
+                    pk__in=[r.pk for r in touched_reservations if r.quantity == 0]
+                ).delete()
+                PrescriptionReservation.objects.bulk_update(
+                    [r for r in touched_reservations if r.quantity > 0], ['quantity']
+                )
+            StockTransaction.objects.bulk_create(transactions)
+            PrescriptionDispense.objects.bulk_create(dispenses)
+            Prescription.objects.bulk_update(completed, ['status', 'dispensed_at', 'dispensed_by'])
+            # bulk_update skips the post_save signal that keeps patient charts current.
+            patient_ids = set(
+                Prescription.objects.filter(pk__in=[p.pk for p in completed])
+                .values_list('visit__patient_id', flat=True)
+            )
+            refresh_chart(list(patient_ids), 'active_prescriptions')
+            transaction.on_commit(invalidate_queue)
+
+    return results
+
+
+def dispense_prescription(prescription_id, pharmacist, quantity=None, batch_id=None, notes=''):
+    """
+    Dispense (part of) one prescription. Returns the updated Prescription.
+    Raises DispenseError if the prescription or stock does not allow it.
+    """
+    item = {'prescription_id': prescription_id, 'quantity': quantity, 'batch_id': batch_id}
+    result = dispense_many([item], pharmacist, notes=notes)[0]
+    if not result['ok']:
+        detail = {k: v for k, v in result.items() if k not in ('prescription_id', 'ok', 'error')}
+        raise DispenseError(result['error'], **detail)
+    return Prescription.objects.get(pk=prescription_id)
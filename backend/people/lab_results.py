@@ -0,0 +1,131 @@
+"""
+Batch lab result upload.
+
+An analyzer run exports many report files at once. The upload endpoint hands
+them here with a manifest mapping each file to a LabTest; files are streamed
+to storage and every test is completed in a single transaction. AI summaries
+are fanned out to Celery workers after commit instead of running inline.
+"""
+import json
+import logging
+import os
+import zipfile
+
+from celery import group
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import LabTest
+
+logger = logging.getLogger(__name__)
+
+RESULT_VALUES = {choice for choice, _ in LabTest.RESULT_CHOICES}
+
+
+def parse_manifest(raw):
+    """
+    Accepts a JSON list of {"file", "lab_test_id", "result"?} entries, or a
+    JSON object mapping file name -> lab_test_id. Ids are returned as ints.
+    """
+    data = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+    if isinstance(data, dict):
+        data = [{'file': name, 'lab_test_id': test_id} for name, test_id in data.items()]
+    if not isinstance(data, list):
+        raise ValueError('manifest must be a list or an object')
+    entries = []
+    for index, entry in enumerate(data):
+        if not isinstance(entry, dict):
+            raise ValueError(f'manifest entry {index} must be an object with file and lab_test_id')
+        test_id = entry.get('lab_test_id')
+        if isinstance(test_id, str):
+            try:
+                test_id = int(test_id)
+            except ValueError:
+                pass
+        if isinstance(test_id, bool) or not isinstance(test_id, int):
+            raise ValueError(f'manifest entry {index} needs an integer lab_test_id')
+        entries.append({**entry, 'lab_test_id': test_id})
+    return entries
+
+
+def collect_files(archive=None, files=()):
+    """Map base file name -> file-like object from a ZIP archive and/or uploaded files."""
+    found = {}
+    if archive is not None:
+        bundle = zipfile.ZipFile(archive)
+        for info in bundle.infolist():
+            if not info.is_dir():
+                found[os.path.basename(info.filename)] = File(bundle.open(info), name=info.filename)
+    for upload in files:
+        found[os.path.basename(upload.name)] = upload
+    return found
+
+
+def apply_lab_results(entries, files, summarize=False, user_id=None):
+    """
+    Attach report files to LabTests and mark them COMPLETED.
+    Returns {'completed': [ids], 'errors': [...], 'summaries_queued': n}.
+    """
+    errors = []
+    wanted = {}
+    for entry in entries:
+        name = os.path.basename(str(entry.get('file', '')))
+        test_id = entry.get('lab_test_id')
+        result = entry.get('result')
+        if test_id in wanted:
+            errors.append({'file': name, 'lab_test_id': test_id, 'error': 'Lab test listed more than once'})
+        elif name not in files:
+            errors.append({'file': name, 'lab_test_id': test_id, 'error': 'File not found in upload'})
+        elif result and result not in RESULT_VALUES:
+            errors.append({'file': name, 'lab_test_id': test_id, 'error': f'Invalid result {result}'})
+        else:
+            wanted[test_id] = (name, result)
+
+    tests = LabTest.objects.in_bulk(list(wanted))
+
+    to_update = []
+    now = timezone.now()
+    for test_id, (name, result) in wanted.items():
+        test = tests.get(test_id)
+        if test is None:
+            errors.append({'file': name, 'lab_test_id': test_id, 'error': 'Lab test not found'})
+            continue
+        if test.status == 'CANCELLED':
+            errors.append({'file': name, 'lab_test_id': test_id, 'error': 'Lab test is cancelled'})
+            continue
+
+        # FieldFile.save streams the upload to storage in chunks.
+        test.report_file.save(name, files[name], save=False)
+        test.status = 'COMPLETED'
+        test.completed_at = now
+        if result:
+            test.result = result
+        to_update.append(test)
+
+    try:
+        with transaction.atomic():
+            LabTest.objects.bulk_update(to_update, ['report_file', 'status', 'completed_at', 'result'])
+            if summarize and to_update:
+                ids = [test.pk for test in to_update]
+                transaction.on_commit(lambda: _queue_summaries(ids, user_id))
+    except Exception:
+        # Report blobs may be shared, so this leaves them to the orphan sweep
+        # (people/report_storage.py); other storages delete right away.
+        for test in to_update:
+            test.report_file.delete(save=False)
+        raise
+
+    return {
+        'completed': [test.pk for test in to_update],
+        'errors': errors,
+        'summaries_queued': len(to_update) if summarize else 0,
+    }
+
+
+def _queue_summaries(lab_test_ids, user_id):
+    from ai_services.tasks import summarize_report
+    try:
+        group(summarize_report.s('LAB', test_id, user_id) for test_id in lab_test_ids).apply_async()
+    except Exception as e:
+        logger.error(f"Could not queue AI summaries for lab tests {lab_test_ids}: {e}")
@@ -0,0 +1,74 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from people.models import Patient, Staff, Visit
+from people.vitals import INGEST_CHUNK_SIZE, ingest_readings
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark bulk vitals ingestion throughput. All data written is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readings', type=int, default=20000, help="Readings per run")
+        parser.add_argument('--visits', type=int, default=50, help="Distinct visits the readings spread over")
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--chunk-size', type=int, default=INGEST_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(**options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, readings, visits, runs, chunk_size, **options):
+        stamp = int(time.time())
+        doctor = Staff.objects.create(
+            user_email=f"bench_doc_{stamp}@example.com", name="Bench Doctor", role="DOCTOR",
+            department="IPD", password_hash="x", fee=0,
+        )
+        nurse = Staff.objects.create(
+            user_email=f"bench_nurse_{stamp}@example.com", name="Bench Monitor", role="NURSE",
+            department="IPD", password_hash="x",
+        )
+        visit_ids = []
+        for i in range(visits):
+            patient = Patient.objects.create(
+                name=f"Bench Patient {i}", age=50, gender="Other", phone=f"8{stamp % 10**6:06d}{i:03d}"[:10],
+            )
+            visit_ids.append(Visit.objects.create(
+                patient=patient, doctor=doctor, visit_type="IPD", visit_date=timezone.localdate(),
+            ).id)
+
+        start = timezone.now() - timedelta(days=1)
+        payload = [
+            {
+                'visit': visit_ids[i % visits],
+                'bp_systolic': random.randint(90, 160),
+                'bp_diastolic': random.randint(60, 100),
+                'pulse': random.randint(55, 130),
+                'temperature': round(random.uniform(97.0, 102.0), 1),
+                'spo2': random.randint(88, 100),
+                'recorded_at': (start + timedelta(seconds=i)).isoformat(),
+            }
+            for i in range(readings)
+        ]
+
+        for run in range(1, runs + 1):
+            began = time.perf_counter()
+            result = ingest_readings(payload, nurse, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - began
+            self.stdout.write(
+                f"run {run}: {len(result['ids'])} readings in {elapsed:.3f}s "
+                f"({len(result['ids']) / elapsed:,.0f} readings/s, {len(result['errors'])} errors)"
+            )
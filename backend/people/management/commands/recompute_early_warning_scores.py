@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from people.models import Vital
+from people.news2 import early_warning_scores
+
+
+class Command(BaseCommand):
+    help = "Recompute Vital.early_warning_score for historical readings in primary-key chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--missing-only', action='store_true',
+            help="Only score readings that have no early warning score yet",
+        )
+
+    def handle(self, *args, chunk_size, missing_only, **options):
+        queryset = Vital.objects.order_by('pk')
+        if missing_only:
+            queryset = queryset.filter(early_warning_score__isnull=True)
+
+        last_pk = 0
+        total = 0
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=last_pk)
+                .values_list('pk', 'bp_systolic', 'pulse', 'temperature', 'spo2')[:chunk_size]
+            )
+            if not rows:
+                break
+
+            pks, systolic, pulse, temperature, spo2 = zip(*rows)
+            scores = early_warning_scores(systolic, pulse, [float(t) for t in temperature], spo2)
+            Vital.objects.bulk_update(
+                [Vital(pk=pk, early_warning_score=int(score)) for pk, score in zip(pks, scores)],
+                ['early_warning_score'],
+                batch_size=1000,
+            )
+
+            last_pk = pks[-1]
+            total += len(rows)
+            self.stdout.write(f"Scored {total} readings (up to id {last_pk})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. {total} readings scored."))
@@ -0,0 +1,22 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from people.stock_ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Store daily closing stock snapshots per batch (what the nightly Celery task does), optionally backfilling."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', dest='day', help="Last day to snapshot (YYYY-MM-DD); defaults to yesterday")
+        parser.add_argument('--days', type=int, default=1, help="Number of days ending at --date to snapshot")
+
+    def handle(self, *args, day=None, days=1, **options):
+        last_day = date.fromisoformat(day) if day else timezone.localdate() - timedelta(days=1)
+        # Oldest first, so each day's as-of query can start from the previous snapshot.
+        for offset in range(days - 1, -1, -1):
+            snapshot_day = last_day - timedelta(days=offset)
+            count = take_snapshots(snapshot_day)
+            self.stdout.write(f"{snapshot_day}: {count} batch snapshots")
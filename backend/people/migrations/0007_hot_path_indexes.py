@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0006_notification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['status', 'created_at'], name='bill_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billitem',
+            index=models.Index(fields=['service_type', 'service_ref_id'], name='billitem_service_ref_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='labtest',
+            index=models.Index(fields=['status'], name='labtest_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicinebatch',
+            index=models.Index(fields=['medicine', 'expiry_date'], name='batch_medicine_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'is_read', 'created_at'], name='notif_recipient_read_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['doctor', 'visit_date', 'slot_booked'], name='visit_doctor_date_slot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['created_at'], name='visit_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vital',
+            index=models.Index(fields=['visit', 'recorded_at'], name='vital_visit_recorded_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vital',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
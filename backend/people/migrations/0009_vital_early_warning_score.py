@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0008_vital_recorded_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vital',
+            name='early_warning_score',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0009_vital_early_warning_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientChart',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='chart', serialize=False, to='people.patient')),
+                ('visit_history', models.JSONField(blank=True, default=list)),
+                ('latest_vitals', models.JSONField(blank=True, default=dict)),
+                ('allergies', models.JSONField(blank=True, default=list)),
+                ('active_prescriptions', models.JSONField(blank=True, default=list)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:11
+
+import people.report_storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0010_patient_chart'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='labtest',
+            name='report_file',
+            field=models.FileField(blank=True, null=True, storage=people.report_storage.get_report_storage, upload_to='lab_reports/'),
+        ),
+        migrations.AlterField(
+            model_name='operation',
+            name='post_op_file',
+            field=models.FileField(blank=True, null=True, storage=people.report_storage.get_report_storage, upload_to='operation_reports/'),
+        ),
+        migrations.AlterField(
+            model_name='radiologytest',
+            name='report_file',
+            field=models.FileField(blank=True, null=True, storage=people.report_storage.get_report_storage, upload_to='radiology_reports/'),
+        ),
+    ]
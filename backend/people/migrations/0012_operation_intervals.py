@@ -0,0 +1,101 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:13
+
+import logging
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+OVERLAP_CONSTRAINT_SQL = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+ALTER TABLE people_operation ADD CONSTRAINT operation_ot_room_no_overlap
+    EXCLUDE USING gist (ot_room WITH =, tstzrange(scheduled_time, scheduled_end, '[)') WITH &&)
+    WHERE (status IN ('SCHEDULED', 'IN_PROGRESS') AND ot_room IS NOT NULL AND scheduled_time IS NOT NULL);
+"""
+
+
+def backfill_scheduled_end(apps, schema_editor):
+    Operation = apps.get_model('people', 'Operation')
+    Operation.objects.filter(scheduled_time__isnull=False, scheduled_end__isnull=True).update(
+        scheduled_end=F('scheduled_time') + timedelta(hours=2)
+    )
+
+
+def _postpone_overlaps(Operation):
+    """
+    Nothing checked OT room overlaps before this migration, so legacy double
+    bookings would make the exclusion constraint fail. Per room, the earliest
+    booking of an overlapping run is kept and later SCHEDULED ones are moved to
+    POSTPONED to be rebooked. Returns the postponed ids. Raises RuntimeError if
+    the later booking is already IN_PROGRESS.
+    """
+    active = (
+        Operation.objects.filter(
+            status__in=('SCHEDULED', 'IN_PROGRESS'), ot_room__isnull=False, scheduled_time__isnull=False,
+        )
+        .order_by('ot_room', 'scheduled_time', 'pk')
+        .values_list('pk', 'ot_room', 'status', 'scheduled_time', 'scheduled_end')
+    )
+    postponed, unresolved = [], []
+    room = busy_until = None
+    for pk, ot_room, status, start, end in active.iterator():
+        if ot_room != room:
+            room, busy_until = ot_room, None
+        if busy_until is not None and start < busy_until:
+            if status == 'IN_PROGRESS':
+                unresolved.append(f"operation {pk} in {ot_room} at {start.isoformat()}")
+            else:
+                postponed.append(pk)
+                continue
+        busy_until = end if busy_until is None else max(busy_until, end)
+
+    if unresolved:
+        raise RuntimeError(
+            "Cannot add the OT room overlap constraint: these in-progress operations overlap an "
+            "earlier booking. Reschedule or cancel one side, then migrate again:\n  " + "\n  ".join(unresolved)
+        )
+    if postponed:
+        Operation.objects.filter(pk__in=postponed).update(status='POSTPONED')
+        logger.warning(f"Postponed {len(postponed)} overlapping OT bookings: {', '.join(map(str, postponed))}")
+    return postponed
+
+
+def postpone_overlapping_bookings(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _postpone_overlaps(apps.get_model('people', 'Operation'))
+
+
+def add_overlap_constraint(apps, schema_editor):
+    # Range types and exclusion constraints are PostgreSQL-only; other
+    # backends rely on the application-level check in people/scheduling.py.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(OVERLAP_CONSTRAINT_SQL)
+
+
+def drop_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE people_operation DROP CONSTRAINT IF EXISTS operation_ot_room_no_overlap;')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0011_report_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='operation',
+            name='scheduled_end',
+            field=models.DateTimeField(blank=True, help_text='Defaults to scheduled_time + 2h', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='operation',
+            index=models.Index(fields=['ot_room', 'scheduled_time'], name='operation_room_start_idx'),
+        ),
+        migrations.RunPython(backfill_scheduled_end, migrations.RunPython.noop),
+        migrations.RunPython(postpone_overlapping_bookings, migrations.RunPython.noop),
+        migrations.RunPython(add_overlap_constraint, drop_overlap_constraint),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0014_stock_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchRecall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.TextField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('artifact_format', models.CharField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')], default='csv', max_length=10)),
+                ('artifact', models.FileField(blank=True, null=True, upload_to='recalls/')),
+                ('affected_dispenses', models.IntegerField(default=0)),
+                ('affected_patients', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='prescriptiondispense',
+            index=models.Index(fields=['batch', 'dispensed_at'], name='dispense_batch_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='batchrecall',
+            name='batches',
+            field=models.ManyToManyField(related_name='recalls', to='people.medicinebatch'),
+        ),
+        migrations.AddField(
+            model_name='batchrecall',
+            name='initiated_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='batch_recalls', to='people.staff'),
+        ),
+    ]
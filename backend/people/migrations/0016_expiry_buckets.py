@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0015_batch_recalls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpiryBucketSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(choices=[('EXPIRED', 'Expired'), ('DAYS_30', 'Expiring within 30 days'), ('DAYS_90', 'Expiring within 90 days'), ('BEYOND_90', 'More than 90 days')], max_length=20)),
+                ('batch_count', models.IntegerField(default=0)),
+                ('stock_qty', models.IntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('as_of', models.DateField()),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expiry_buckets', to='people.medicine')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('medicine', 'bucket'), name='unique_expiry_bucket_per_medicine')],
+            },
+        ),
+    ]
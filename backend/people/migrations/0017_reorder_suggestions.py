@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0016_expiry_buckets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('computed_on', models.DateField()),
+                ('daily_velocity', models.FloatField(default=0)),
+                ('peak_daily_velocity', models.FloatField(default=0)),
+                ('demand_std', models.FloatField(default=0)),
+                ('usable_stock', models.IntegerField(default=0)),
+                ('days_of_cover', models.FloatField(blank=True, null=True)),
+                ('reorder_point', models.IntegerField(default=0)),
+                ('suggested_qty', models.IntegerField(default=0)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestions', to='people.medicine')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['computed_on', 'suggested_qty'], name='reorder_day_qty_idx')],
+                'constraints': [models.UniqueConstraint(fields=('medicine', 'computed_on'), name='unique_reorder_suggestion_per_day')],
+            },
+        ),
+    ]
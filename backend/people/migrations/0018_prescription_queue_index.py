@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0017_reorder_suggestions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['status', '-created_at'], name='presc_status_created_idx'),
+        ),
+    ]
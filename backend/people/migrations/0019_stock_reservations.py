@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0018_prescription_queue_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrescriptionReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='medicinebatch',
+            name='reserved_qty',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='medicinebatch',
+            constraint=models.CheckConstraint(condition=models.Q(('reserved_qty__gte', 0)), name='batch_reserved_qty_non_negative'),
+        ),
+        migrations.AddField(
+            model_name='prescriptionreservation',
+            name='batch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='people.medicinebatch'),
+        ),
+        migrations.AddField(
+            model_name='prescriptionreservation',
+            name='prescription',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='people.prescription'),
+        ),
+        migrations.AddConstraint(
+            model_name='prescriptionreservation',
+            constraint=models.UniqueConstraint(fields=('prescription', 'batch'), name='unique_reservation_per_batch'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0019_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('type', models.CharField(choices=[('RESCHEDULE', 'Reschedule'), ('ALERT', 'Alert'), ('INFO', 'Info')], default='INFO', max_length=20)),
+                ('recipient_role', models.CharField(blank=True, max_length=50)),
+                ('staff_message', models.TextField(blank=True)),
+                ('patient_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notification_events', to='people.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dispatched_at', 'created_at'], name='notif_event_pending_idx')],
+            },
+        ),
+    ]
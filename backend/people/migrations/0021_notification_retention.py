@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0020_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_id', models.BigIntegerField(unique=True)),
+                ('title', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('type', models.CharField(choices=[('RESCHEDULE', 'Reschedule'), ('ALERT', 'Alert'), ('INFO', 'Info')], default='INFO', max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='notification',
+            options={},
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['patient', 'is_read', 'created_at'], name='notif_patient_read_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivednotification',
+            name='patient',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to='people.patient'),
+        ),
+        migrations.AddField(
+            model_name='archivednotification',
+            name='recipient',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to='people.staff'),
+        ),
+    ]
@@ -1,6 +1,12 @@
 from django.db import models
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .news2 import early_warning_score
+from .report_storage import get_report_storage
 
 class Visit(models.Model):
 
@@ -66,6 +72,14 @@ class Visit(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Slot clash check in clean() and booked_slots lookups
+            models.Index(fields=['doctor', 'visit_date', 'slot_booked'], name='visit_doctor_date_slot_idx'),
+            # Daily inflow / dashboard trend range filters on created_at
+            models.Index(fields=['created_at'], name='visit_created_at_idx'),
+        ]
+
     def __str__(self):
         return f"Visit {self.id} - {self.patient.name} ({self.visit_type})"
 
@@ -213,6 +227,23 @@ class Patient(models.Model):
     def __str__(self):
         return f"{self.name} ({self.gender}, {self.age}) - {self.uhid}"
 
+class PatientChart(models.Model):
+    """
+    Read-optimised projection of a patient's chart for the doctor profile view.
+    Sections are refreshed by signals (people/signals.py) when the underlying
+    rows change; version is bumped on every change and drives the ETag.
+    """
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True, related_name="chart")
+    visit_history = models.JSONField(default=list, blank=True)
+    latest_vitals = models.JSONField(default=dict, blank=True)
+    allergies = models.JSONField(default=list, blank=True)
+    active_prescriptions = models.JSONField(default=list, blank=True)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Chart for Patient {self.patient_id} (v{self.version})"
+
 class Allergy(models.Model):
     SEVERITY_CHOICES = [
         ('LOW', 'Low'),
@@ -428,11 +459,27 @@ class Vital(models.Model):
     temperature = models.DecimalField(max_digits=4, decimal_places=1)  # e.g. 98.6
     spo2 = models.PositiveSmallIntegerField()            # percentage (0–100)
 
-    recorded_at = models.DateTimeField(auto_now_add=True)
+    # Defaults to now, but bulk monitor uploads carry their own reading times.
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    # Partial NEWS2, computed on save (see people/news2.py)
+    early_warning_score = models.PositiveSmallIntegerField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Per-visit vitals history and "latest vitals" lookups
+            models.Index(fields=['visit', 'recorded_at'], name='vital_visit_recorded_idx'),
+        ]
 
     def __str__(self):
         return f"Vitals for Visit {self.visit.id} at {self.recorded_at}"
 
+    def save(self, *args, **kwargs):
+        self.early_warning_score = early_warning_score(
+            self.bp_systolic, self.pulse, self.temperature, self.spo2
+        )
+        super().save(*args, **kwargs)
+
 class ClinicalNote(models.Model):
     note_id = models.BigAutoField(primary_key=True)
     visit = models.ForeignKey(
@@ -487,6 +534,13 @@ class Order(models.Model):
         ("CANCELLED", "Cancelled"),
     ]
 
+    # Used by the bulk transition endpoint (people/transitions.py).
+    ALLOWED_TRANSITIONS = {
+        "PENDING": {"IN_PROGRESS", "COMPLETED", "CANCELLED"},
+        "IN_PROGRESS": {"COMPLETED", "CANCELLED"},
+    }
+    TRANSITION_TIMESTAMPS = {}
+
     visit = models.ForeignKey(
         Visit,
         on_delete=models.CASCADE,
@@ -519,6 +573,13 @@ class LabTest(models.Model):
         ("CANCELLED", "Cancelled"),
     ]
 
+    ALLOWED_TRANSITIONS = {
+        "ORDERED": {"SAMPLE_COLLECTED", "IN_PROGRESS", "CANCELLED"},
+        "SAMPLE_COLLECTED": {"IN_PROGRESS", "COMPLETED", "CANCELLED"},
+        "IN_PROGRESS": {"COMPLETED", "CANCELLED"},
+    }
+    TRANSITION_TIMESTAMPS = {"COMPLETED": "completed_at"}
+
     RESULT_CHOICES = [
         ("NORMAL", "Normal"),
         ("ABNORMAL", "Abnormal"),
@@ -535,13 +596,18 @@ class LabTest(models.Model):
 
     test_name = models.CharField(max_length=100)
     result = models.CharField(max_length=20, choices=RESULT_CHOICES, blank=True, null=True)
-    report_file = models.FileField(upload_to="lab_reports/", blank=True, null=True)
+    report_file = models.FileField(upload_to="lab_reports/", storage=get_report_storage, blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="ORDERED")
     completed_at = models.DateTimeField(blank=True, null=True)
     completed_at = models.DateTimeField(blank=True, null=True)
     price = models.IntegerField(default=0)
     ai_summary = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='labtest_status_idx'),
+        ]
+
     def __str__(self):
         return f"LabTest {self.test_name} (Order {self.order.id})"
 
@@ -556,6 +622,13 @@ class RadiologyTest(models.Model):
         ("CANCELLED", "Cancelled"),
     ]
 
+    ALLOWED_TRANSITIONS = {
+        "ORDERED": {"SCHEDULED", "IN_PROGRESS", "CANCELLED"},
+        "SCHEDULED": {"IN_PROGRESS", "CANCELLED"},
+        "IN_PROGRESS": {"COMPLETED", "CANCELLED"},
+    }
+    TRANSITION_TIMESTAMPS = {"COMPLETED": "completed_at"}
+
     RESULT_CHOICES = [
         ("NORMAL", "Normal"),
         ("ABNORMAL", "Abnormal"),
@@ -572,7 +645,7 @@ class RadiologyTest(models.Model):
 
     scan_type = models.CharField(max_length=100)
     result = models.CharField(max_length=20, choices=RESULT_CHOICES, blank=True, null=True)
-    report_file = models.FileField(upload_to="radiology_reports/", blank=True, null=True)
+    report_file = models.FileField(upload_to="radiology_reports/", storage=get_report_storage, blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="ORDERED")
     completed_at = models.DateTimeField(blank=True, null=True)
     completed_at = models.DateTimeField(blank=True, null=True)
@@ -582,6 +655,33 @@ class RadiologyTest(models.Model):
     def __str__(self):
         return f"Radiology {self.scan_type} (Order {self.order.id})"
 
+class OrderSet(models.Model):
+    """
+    A named bundle of lab/radiology tests ordered together, e.g. an admission
+    panel. items: [{"order_type": "LAB" | "RADIOLOGY", "name": "CBC", "price": 300}, ...]
+    """
+    name = models.CharField(max_length=100, unique=True)
+    description = models.TextField(blank=True, null=True)
+    items = models.JSONField(default=list)
+    is_active = models.BooleanField(default=True)
+    created_by = models.ForeignKey(
+        Staff,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="order_sets",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({len(self.items)} tests)"
+
+class MedicineQuerySet(models.QuerySet):
+    def with_stock(self):
+        """Annotate stock_total (sum of batch stock) in the same query."""
+        return self.annotate(stock_total=Coalesce(Sum('batches__stock_qty'), 0))
+
+
 class Medicine(models.Model):
     medicine_id = models.BigAutoField(primary_key=True)
     name = models.CharField(max_length=255)
@@ -589,10 +689,17 @@ class Medicine(models.Model):
     category = models.CharField(max_length=100, blank=True, null=True) # e.g. Antibiotic, Analgesic
     manufacturer = models.CharField(max_length=255, blank=True, null=True)
     reorder_level = models.IntegerField(default=10) # Unique: proactive reordering
-    
+
+    objects = MedicineQuerySet.as_manager()
+
     @property
     def total_stock(self):
-        return sum(batch.stock_qty for batch in self.batches.all())
+        # Prefer the with_stock() annotation, then prefetched batches, then one aggregate.
+        if getattr(self, 'stock_total', None) is not None:
+            return self.stock_total
+        if 'batches' in getattr(self, '_prefetched_objects_cache', {}):
+            return sum(batch.stock_qty for batch in self.batches.all())
+        return self.batches.aggregate(total=Coalesce(Sum('stock_qty'), 0))['total']
 
     def __str__(self):
         return self.name
@@ -607,6 +714,7 @@ class MedicineBatch(models.Model):
     batch_number = models.CharField(max_length=100)
     expiry_date = models.DateField()
     stock_qty = models.IntegerField(default=0)
+    reserved_qty = models.IntegerField(default=0) # Held for open prescriptions (see people/reservations.py)
     received_qty = models.IntegerField(default=0) # Original quantity in this batch
     purchase_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2) # Selling price
@@ -618,6 +726,18 @@ class MedicineBatch(models.Model):
 
     class Meta:
         ordering = ['expiry_date'] # Supporting FEFO (First Expiry First Out)
+        indexes = [
+            # FEFO batch selection per medicine
+            models.Index(fields=['medicine', 'expiry_date'], name='batch_medicine_expiry_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(reserved_qty__gte=0), name='batch_reserved_qty_non_negative'),
+        ]
+
+    @property
+    def available_qty(self):
+        """Stock not held for other prescriptions."""
+        return self.stock_qty - self.reserved_qty
 
     def __str__(self):
         return f"{self.medicine.name} - Batch: {self.batch_number} (Exp: {self.expiry_date})"
@@ -640,10 +760,82 @@ class StockTransaction(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Snapshot + delta scans for as-of stock queries
+            models.Index(fields=['batch', 'timestamp'], name='stocktxn_batch_ts_idx'),
+            models.Index(fields=['timestamp'], name='stocktxn_ts_idx'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} - {self.quantity} for {self.batch.batch_number}"
 
 
+class StockSnapshot(models.Model):
+    """Closing ledger balance of a batch at the end of a day (see people/stock_ledger.py)."""
+    batch = models.ForeignKey(MedicineBatch, on_delete=models.CASCADE, related_name='snapshots')
+    snapshot_date = models.DateField()
+    closing_qty = models.IntegerField()
+    taken_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot_date', 'batch'], name='unique_batch_snapshot_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.batch.batch_number} @ {self.snapshot_date}: {self.closing_qty}"
+
+
+class ExpiryBucketSummary(models.Model):
+    """Per-medicine batch counts by time to expiry, rebuilt nightly (see people/expiry.py)."""
+    BUCKET_CHOICES = [
+        ('EXPIRED', 'Expired'),
+        ('DAYS_30', 'Expiring within 30 days'),
+        ('DAYS_90', 'Expiring within 90 days'),
+        ('BEYOND_90', 'More than 90 days'),
+    ]
+
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='expiry_buckets')
+    bucket = models.CharField(max_length=20, choices=BUCKET_CHOICES)
+    batch_count = models.IntegerField(default=0)
+    stock_qty = models.IntegerField(default=0)
+    stock_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    as_of = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medicine', 'bucket'], name='unique_expiry_bucket_per_medicine'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine.name} {self.bucket}: {self.batch_count} batches ({self.as_of})"
+
+
+class ReorderSuggestion(models.Model):
+    """Nightly purchase suggestion per medicine from consumption velocity (see people/reorder.py)."""
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='reorder_suggestions')
+    computed_on = models.DateField()
+    daily_velocity = models.FloatField(default=0)  # Units/day over the trailing window
+    peak_daily_velocity = models.FloatField(default=0)  # Highest window average in the history
+    demand_std = models.FloatField(default=0)
+    usable_stock = models.IntegerField(default=0)  # Not expired, not recalled
+    days_of_cover = models.FloatField(blank=True, null=True)  # Null when nothing is being dispensed
+    reorder_point = models.IntegerField(default=0)
+    suggested_qty = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medicine', 'computed_on'], name='unique_reorder_suggestion_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['computed_on', 'suggested_qty'], name='reorder_day_qty_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine.name} ({self.computed_on}): order {self.suggested_qty}"
+
+
 class Prescription(models.Model):
     STATUS_CHOICES = [
         ("PENDING", "Pending"),
@@ -678,6 +870,12 @@ class Prescription(models.Model):
         limit_choices_to={'role': 'PHARMACIST'}
     )
 
+    class Meta:
+        indexes = [
+            # Pharmacy pending queue, newest first
+            models.Index(fields=['status', '-created_at'], name='presc_status_created_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         self.quantity = self.dosage_per_day * self.duration
         super().save(*args, **kwargs)
@@ -685,6 +883,21 @@ class Prescription(models.Model):
     def __str__(self):
         return f"Prescription {self.prescription_id} - {self.medicine.name} (Visit {self.visit.id})"
 
+class PrescriptionReservation(models.Model):
+    """Units of a batch held for an open prescription until it is dispensed or cancelled."""
+    prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='reservations')
+    batch = models.ForeignKey(MedicineBatch, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prescription', 'batch'], name='unique_reservation_per_batch'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of {self.batch.batch_number} for Prescription {self.prescription_id}"
+
 class PrescriptionDispense(models.Model):
     dispense_id = models.BigAutoField(primary_key=True)
     prescription = models.ForeignKey(
@@ -715,9 +928,44 @@ class PrescriptionDispense(models.Model):
     notes = models.TextField(blank=True, null=True)
 
 
+    class Meta:
+        indexes = [
+            # Recall traceability: dispenses of a batch in time order
+            models.Index(fields=['batch', 'dispensed_at'], name='dispense_batch_time_idx'),
+        ]
+
     def __str__(self):
         return f"Dispense {self.dispense_id} - Prescription {self.prescription.prescription_id} ({self.quantity_dispensed} units)"
 
+
+class BatchRecall(models.Model):
+    """A manufacturer recall covering one or more batches (see people/recalls.py)."""
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("RUNNING", "Running"),
+        ("COMPLETED", "Completed"),
+        ("FAILED", "Failed"),
+    ]
+    FORMAT_CHOICES = [
+        ("csv", "CSV"),
+        ("ndjson", "NDJSON"),
+    ]
+
+    batches = models.ManyToManyField(MedicineBatch, related_name="recalls")
+    reason = models.TextField()
+    initiated_by = models.ForeignKey(Staff, on_delete=models.SET_NULL, null=True, blank=True, related_name="batch_recalls")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="PENDING")
+    artifact_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default="csv")
+    artifact = models.FileField(upload_to="recalls/", blank=True, null=True)
+    affected_dispenses = models.IntegerField(default=0)
+    affected_patients = models.IntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Recall {self.id} ({self.status})"
+
 class Operation(models.Model):
     STATUS_CHOICES = [
         ("SCHEDULED", "Scheduled"),
@@ -727,6 +975,15 @@ class Operation(models.Model):
         ("POSTPONED", "Postponed"),
     ]
 
+    # POSTPONED -> SCHEDULED needs a new slot, so it goes through a normal
+    # update where the OT conflict check runs.
+    ALLOWED_TRANSITIONS = {
+        "SCHEDULED": {"IN_PROGRESS", "POSTPONED", "CANCELLED"},
+        "IN_PROGRESS": {"COMPLETED"},
+        "POSTPONED": {"CANCELLED"},
+    }
+    TRANSITION_TIMESTAMPS = {"COMPLETED": "performed_at"}
+
     RESULT_CHOICES = [
         ("SUCCESSFUL", "Successful"),
         ("COMPLICATIONS", "Complications"),
@@ -754,11 +1011,12 @@ class Operation(models.Model):
     price = models.IntegerField(default=0)
     performed_at = models.DateTimeField(blank=True, null=True)
     operation_notes = models.TextField(blank=True, null=True) # Legacy field, prefer intra_op_notes
-    post_op_file = models.FileField(upload_to="operation_reports/", blank=True, null=True)
+    post_op_file = models.FileField(upload_to="operation_reports/", storage=get_report_storage, blank=True, null=True)
     ai_summary = models.TextField(blank=True, null=True)
 
     # New OT Lite Fields
     scheduled_time = models.DateTimeField(null=True, blank=True)
+    scheduled_end = models.DateTimeField(null=True, blank=True, help_text="Defaults to scheduled_time + 2h")
     ot_room = models.CharField(max_length=50, blank=True, null=True, help_text="e.g. OT-1")
     checklist_data = models.JSONField(default=dict, blank=True, help_text="Stores Yes/No for safety checks")
     anesthesia_notes = models.TextField(blank=True, null=True)
@@ -766,6 +1024,17 @@ class Operation(models.Model):
     consumables_used = models.JSONField(default=list, blank=True, help_text="List of items for billing")
     team_members = models.JSONField(default=dict, blank=True, help_text="Snapshot of staff involved")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['ot_room', 'scheduled_time'], name='operation_room_start_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.scheduled_time and not self.scheduled_end:
+            from .scheduling import operation_window
+            self.scheduled_time, self.scheduled_end = operation_window(self.scheduled_time)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.operation_name} (Order {self.order.id})"
 
@@ -793,6 +1062,12 @@ class Bill(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Revenue aggregates filter on status and a created_at range
+            models.Index(fields=['status', 'created_at'], name='bill_status_created_idx'),
+        ]
+
     def __str__(self):
         return f"Bill {self.id} (Visit {self.visit.id})"
 
@@ -826,6 +1101,12 @@ class BillItem(models.Model):
 
     amount = models.DecimalField(max_digits=12, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            # "Already billed?" lookups in pending_items
+            models.Index(fields=['service_type', 'service_ref_id'], name='billitem_service_ref_idx'),
+        ]
+
     def __str__(self):
         return f"BillItem {self.id} - {self.service_type}"
 
@@ -882,7 +1163,53 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['-created_at']
+        # No default ordering: the feed orders explicitly and counts/updates stay unsorted.
+        indexes = [
+            # Bell feed and unread counts: a recipient's notifications, newest first
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='notif_recipient_read_idx'),
+            models.Index(fields=['patient', 'is_read', 'created_at'], name='notif_patient_read_idx'),
+        ]
 
     def __str__(self):
         return f"{self.type}: {self.title}"
+
+
+class ArchivedNotification(models.Model):
+    """Read notification moved out of the live table by the retention job (people/inbox.py)."""
+    notification_id = models.BigIntegerField(unique=True)
+    recipient = models.ForeignKey(Staff, on_delete=models.CASCADE, related_name="archived_notifications", null=True, blank=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="archived_notifications", null=True, blank=True)
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    type = models.CharField(max_length=20, choices=Notification.TYPE_CHOICES, default='INFO')
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.type}: {self.title} (archived)"
+
+
+class NotificationEvent(models.Model):
+    """
+    Outbox row for a notification fan-out (see people/outbox.py). The request
+    records one event; a Celery worker creates the Notification rows.
+    """
+    title = models.CharField(max_length=255)
+    type = models.CharField(max_length=20, choices=Notification.TYPE_CHOICES, default='INFO')
+    recipient_role = models.CharField(max_length=50, blank=True)  # Every staff member with this role
+    staff_message = models.TextField(blank=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="notification_events", null=True, blank=True)
+    patient_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Sweeper: undispatched events, oldest first
+            models.Index(fields=['dispatched_at', 'created_at'], name='notif_event_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.type}: {self.title} ({'sent' if self.dispatched_at else 'pending'})"
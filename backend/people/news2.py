@@ -0,0 +1,39 @@
+"""
+NEWS2-style early warning scoring.
+
+Only the parameters we actually record on Vital are scored (SpO2 scale 1,
+systolic BP, pulse and temperature); respiration rate, consciousness and
+supplemental oxygen are not captured, so the result is a partial NEWS2.
+Works on scalars or NumPy arrays so bulk ingestion and backfills can score
+whole batches at once.
+"""
+import numpy as np
+
+# (inclusive upper bounds, points per band); len(points) == len(bounds) + 1
+SPO2_BANDS = ([91, 93, 95], [3, 2, 1, 0])
+SYSTOLIC_BANDS = ([90, 100, 110, 219], [3, 2, 1, 0, 3])
+PULSE_BANDS = ([40, 50, 90, 110, 130], [3, 1, 0, 1, 2, 3])
+TEMPERATURE_C_BANDS = ([35.0, 36.0, 38.0, 39.0], [3, 1, 0, 1, 2])
+
+# Aggregate score at which the NEWS2 guidance asks for an urgent response.
+URGENT_RESPONSE_THRESHOLD = 5
+
+
+def _band(values, bands):
+    bounds, points = bands
+    return np.asarray(points)[np.searchsorted(bounds, values, side='left')]
+
+
+def early_warning_scores(bp_systolic, pulse, temperature_f, spo2):
+    """Vectorised partial NEWS2. Temperature is in °F, as stored on Vital."""
+    temperature_c = np.round((np.asarray(temperature_f, dtype=float) - 32) * 5 / 9, 1)
+    return (
+        _band(np.asarray(spo2, dtype=float), SPO2_BANDS)
+        + _band(np.asarray(bp_systolic, dtype=float), SYSTOLIC_BANDS)
+        + _band(np.asarray(pulse, dtype=float), PULSE_BANDS)
+        + _band(temperature_c, TEMPERATURE_C_BANDS)
+    )
+
+
+def early_warning_score(bp_systolic, pulse, temperature_f, spo2):
+    return int(early_warning_scores(bp_systolic, pulse, float(temperature_f), spo2))
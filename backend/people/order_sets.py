@@ -0,0 +1,68 @@
+"""
+Order sets: place a bundle of lab and radiology tests in one transaction.
+
+One Order is created per order type and every child test is inserted with a
+single bulk_create, so a five-test admission panel costs a handful of
+queries instead of five full round trips through CreateOrderSerializer.
+"""
+from django.db import transaction
+
+from .models import LabTest, Order, RadiologyTest
+
+# order_type -> (child model, field holding the test name)
+ORDER_SET_TYPES = {
+    'LAB': (LabTest, 'test_name'),
+    'RADIOLOGY': (RadiologyTest, 'scan_type'),
+}
+
+
+def clean_items(items):
+    """Validate and normalise order set items. Returns (items, errors)."""
+    if not isinstance(items, list) or not items:
+        return [], ['items must be a non-empty list']
+    cleaned, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append(f"Item {index}: must be an object")
+            continue
+        order_type = str(item.get('order_type', '')).upper()
+        name = str(item.get('name') or '').strip()
+        if order_type not in ORDER_SET_TYPES:
+            errors.append(f"Item {index}: order_type must be one of {', '.join(ORDER_SET_TYPES)}")
+            continue
+        if not name:
+            errors.append(f"Item {index}: name is required")
+            continue
+        try:
+            price = int(item.get('price') or 0)
+        except (TypeError, ValueError):
+            errors.append(f"Item {index}: price must be a whole number")
+            continue
+        cleaned.append({'order_type': order_type, 'name': name, 'price': price})
+    return cleaned, errors
+
+
+def place_order_set(visit, doctor, items):
+    """
+    Create one Order per order type for the visit and bulk insert the tests.
+    `items` must already be cleaned. Returns the created ids.
+    """
+    by_type = {}
+    for item in items:
+        by_type.setdefault(item['order_type'], []).append(item)
+
+    result = {'orders': [], 'lab_tests': [], 'radiology_tests': []}
+    with transaction.atomic():
+        orders = Order.objects.bulk_create([
+            Order(visit=visit, doctor=doctor, order_type=order_type) for order_type in by_type
+        ])
+        for order in orders:
+            model, name_field = ORDER_SET_TYPES[order.order_type]
+            tests = model.objects.bulk_create([
+                model(order=order, price=item['price'], **{name_field: item['name']})
+                for item in by_type[order.order_type]
+            ])
+            key = 'lab_tests' if model is LabTest else 'radiology_tests'
+            result[key].extend(test.pk for test in tests)
+            result['orders'].append({'id': order.pk, 'order_type': order.order_type})
+    return result
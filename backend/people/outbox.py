@@ -0,0 +1,90 @@
+"""
+Notification outbox.
+
+Request code calls record_event(), which writes one NotificationEvent in the
+caller's transaction and queues people.tasks.dispatch_notification_event
+once it commits. The worker fans the event out with a single bulk_create.
+dispatch_pending() (beat, every minute) picks up events whose task was lost,
+e.g. because the broker was down when the request committed.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Notification, NotificationEvent, Staff
+from .inbox import notifications_added
+from .push import publish_on_commit
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BATCH_SIZE = 1000
+# Leave fresh events to their own task before the sweeper retries them.
+SWEEP_GRACE = timedelta(seconds=60)
+MAX_ATTEMPTS = 5
+
+
+def record_event(title, type='INFO', recipient_role='', staff_message='', patient=None, patient_message=''):
+    event = NotificationEvent.objects.create(
+        title=title, type=type, recipient_role=recipient_role, staff_message=staff_message,
+        patient=patient, patient_message=patient_message,
+    )
+    transaction.on_commit(lambda: _queue_event(event.pk))
+    return event
+
+
+def _queue_event(event_id):
+    from .tasks import dispatch_notification_event
+    try:
+        dispatch_notification_event.delay(event_id)
+    except Exception as e:
+        logger.error(f"Could not queue notification event {event_id}; the outbox sweeper will send it: {e}")
+
+
+def dispatch_event(event_id):
+    """Create the event's notifications once. Returns the number created (0 if already sent)."""
+    with transaction.atomic():
+        event = NotificationEvent.objects.select_for_update().filter(pk=event_id, dispatched_at__isnull=True).first()
+        if event is None:
+            return 0
+        notifications = []
+        if event.recipient_role:
+            staff_ids = Staff.objects.filter(role__iexact=event.recipient_role).values_list('pk', flat=True)
+            notifications.extend(
+                Notification(recipient_id=staff_id, title=event.title, message=event.staff_message, type=event.type)
+                for staff_id in staff_ids
+            )
+        if event.patient_id:
+            notifications.append(Notification(
+                patient_id=event.patient_id, title=event.title, message=event.patient_message, type=event.type,
+            ))
+        Notification.objects.bulk_create(notifications, batch_size=NOTIFICATION_BATCH_SIZE)
+        notifications_added(notifications)
+        publish_on_commit(notifications)
+        event.dispatched_at = timezone.now()
+        event.attempts += 1
+        event.save(update_fields=['dispatched_at', 'attempts'])
+    return len(notifications)
+
+
+def dispatch_pending(limit=500):
+    """Send undispatched events older than the grace period. Returns the number of events sent."""
+    cutoff = timezone.now() - SWEEP_GRACE
+    pending = list(
+        NotificationEvent.objects.filter(
+            dispatched_at__isnull=True, created_at__lt=cutoff, attempts__lt=MAX_ATTEMPTS,
+        )
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+    sent = 0
+    for event_id in pending:
+        try:
+            dispatch_event(event_id)
+            sent += 1
+        except Exception as e:
+            logger.error(f"Notification event {event_id} failed: {e}")
+            NotificationEvent.objects.filter(pk=event_id).update(attempts=F('attempts') + 1, last_error=str(e))
+    return sent
@@ -0,0 +1,110 @@
+"""
+Pending-prescription queue for the pharmacy.
+
+Rows carry the medicine name and the stock available to them (correlated
+subqueries over valid batches and the row's own reservations) instead of the nested MedicineSerializer, and
+pages are cached for a few seconds. Any prescription write bumps a version
+number in the cache key, so a dispensed or cancelled prescription drops out
+of the queue on the next request instead of after the TTL. The cache is
+best effort: when it is unreachable the queue is served uncached.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import MedicineBatch, Prescription, PrescriptionReservation
+
+logger = logging.getLogger(__name__)
+
+QUEUE_VERSION_KEY = 'pharmacy_queue_version'
+
+
+def available_stock_subquery(today=None):
+    """
+    Units the row's prescription could be dispensed from (see people/inventory.py):
+    unreserved stock on dispensable batches plus what the prescription holds itself.
+    """
+    today = today or timezone.localdate()
+    dispensable = dict(batch__is_recalled=False, batch__expiry_date__gt=today)
+    unreserved = (
+        MedicineBatch.objects.filter(
+            medicine_id=OuterRef('medicine_id'), is_recalled=False, expiry_date__gt=today,
+            stock_qty__gt=F('reserved_qty'),
+        )
+        .order_by()
+        .values('medicine_id')
+        .annotate(total=Sum(F('stock_qty') - F('reserved_qty')))
+        .values('total')
+    )
+    held = (
+        PrescriptionReservation.objects.filter(prescription_id=OuterRef('pk'), **dispensable)
+        .order_by()
+        .values('prescription_id')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    return (
+        Coalesce(Subquery(unreserved, output_field=IntegerField()), Value(0))
+        + Coalesce(Subquery(held, output_field=IntegerField()), Value(0))
+    )
+
+
+def pending_queue(queryset=None):
+    queryset = Prescription.objects.all() if queryset is None else queryset
+    return (
+        queryset.filter(status='PENDING')
+        .select_related('visit__patient', 'visit__doctor', 'medicine')
+        .annotate(available_stock=available_stock_subquery())
+        .order_by('-created_at', '-prescription_id')
+    )
+
+
+def queue_cache_key(params):
+    """Cache key for a queue page, or None when the cache is unreachable."""
+    try:
+        version = cache.get_or_set(QUEUE_VERSION_KEY, time.time_ns, timeout=None)
+    except Exception as e:
+        logger.error(f"Pharmacy queue cache unavailable, serving uncached: {e}")
+        return None
+    query = '&'.join(f"{key}={value}" for key, value in sorted(params.items()))
+    return f"pharmacy_queue:{version}:{query}"
+
+
+def cached_page(key):
+    if key is None:
+        return None
+    try:
+        return cache.get(key)
+    except Exception as e:
+        logger.error(f"Could not read cached pharmacy queue page: {e}")
+        return None
+
+
+def cache_page(key, data):
+    if key is None:
+        return
+    try:
+        cache.set(key, data, timeout=queue_cache_seconds())
+    except Exception as e:
+        logger.error(f"Could not cache pharmacy queue page: {e}")
+
+
+def invalidate_queue():
+    try:
+        try:
+            cache.incr(QUEUE_VERSION_KEY)
+        except ValueError:
+            # Key evicted: start from a value no cached page can carry.
+            cache.set(QUEUE_VERSION_KEY, time.time_ns(), timeout=None)
+    except Exception as e:
+        # Cached pages still expire after PHARMACY_QUEUE_CACHE_SECONDS.
+        logger.error(f"Could not invalidate the pharmacy queue cache: {e}")
+
+
+def queue_cache_seconds():
+    return getattr(settings, 'PHARMACY_QUEUE_CACHE_SECONDS', 5)
@@ -0,0 +1,161 @@
+"""
+Server push for notifications.
+
+Every Notification is published, after its transaction commits, to a
+per-recipient channel ("notifications:staff:<id>" or
+"notifications:patient:<id>"). NotificationStreamView holds one
+Server-Sent Events connection per open terminal and relays what arrives on
+the user's channel, so the bell never polls.
+
+The broker is Redis pub/sub in production (NOTIFICATION_PUSH_BACKEND =
+'redis', so web processes and Celery workers share channels) and an
+in-process stand-in ('memory') for tests and single-process development.
+Publishing is best effort: a broker outage never fails the write that
+created the notification, and clients reload the list when they reconnect.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from .inbox import audience_for
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 25
+
+
+def channel_for(recipient_id=None, patient_id=None):
+    if recipient_id:
+        return f"notifications:staff:{recipient_id}"
+    if patient_id:
+        return f"notifications:patient:{patient_id}"
+    return None
+
+
+def notification_payload(notification):
+    return {
+        'id': notification.pk,
+        'recipient': notification.recipient_id,
+        'patient': notification.patient_id,
+        'title': notification.title,
+        'message': notification.message,
+        'type': notification.type,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+
+def notification_audience(user):
+    """Channel a logged-in user listens on: their Staff row, else their Patient record."""
+    audience = audience_for(user)
+    return channel_for(**audience) if audience else None
+
+
+class MemoryBroker:
+    """In-process pub/sub. Subscribers are asyncio queues fed thread-safely from publishers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> set of (loop, queue)
+
+    def publish_many(self, messages):
+        with self._lock:
+            targets = [(self._subscribers.get(channel, set()).copy(), data) for channel, data in messages]
+        for subscribers, data in targets:
+            for loop, queue in subscribers:
+                loop.call_soon_threadsafe(queue.put_nowait, data)
+
+    async def listen(self, channel, heartbeat):
+        """Yields None once subscribed, then message payloads, or None every `heartbeat` seconds of silence."""
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(entry)
+        try:
+            yield None
+            while True:
+                try:
+                    yield await asyncio.wait_for(entry[1].get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(channel, set())
+                subscribers.discard(entry)
+                if not subscribers:
+                    self._subscribers.pop(channel, None)
+
+
+class RedisBroker:
+    def __init__(self, url):
+        self.url = url
+        self._client = None
+
+    def publish_many(self, messages):
+        import redis
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url, socket_connect_timeout=2)
+        with self._client.pipeline(transaction=False) as pipe:
+            for channel, data in messages:
+                pipe.publish(channel, data)
+            pipe.execute()
+
+    async def listen(self, channel, heartbeat):
+        import redis.asyncio as aioredis
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            yield None
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+                if message is None:
+                    yield None
+                elif message['type'] == 'message':
+                    data = message['data']
+                    yield data.decode() if isinstance(data, bytes) else data
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    backend = getattr(settings, 'NOTIFICATION_PUSH_BACKEND', 'memory')
+    url = getattr(settings, 'NOTIFICATION_PUSH_REDIS_URL', None)
+    key = (backend, url if backend == 'redis' else None)
+    with _brokers_lock:
+        if key not in _brokers:
+            _brokers[key] = RedisBroker(url) if backend == 'redis' else MemoryBroker()
+        return _brokers[key]
+
+
+def publish_notifications(notifications):
+    """Push notifications to their recipients' channels now."""
+    messages = []
+    for notification in notifications:
+        channel = channel_for(notification.recipient_id, notification.patient_id)
+        if channel:
+            messages.append((channel, json.dumps(notification_payload(notification), default=str)))
+    if not messages:
+        return 0
+    try:
+        get_broker().publish_many(messages)
+    except Exception as e:
+        logger.error(f"Could not publish {len(messages)} notifications: {e}")
+        return 0
+    return len(messages)
+
+
+def publish_on_commit(notifications):
+    """Push once the surrounding transaction commits (bulk_create paths skip post_save)."""
+    notifications = list(notifications)
+    if notifications:
+        transaction.on_commit(lambda: publish_notifications(notifications))
@@ -0,0 +1,143 @@
+"""
+Batch recalls.
+
+start_recall() flips is_recalled on every listed batch in the same
+transaction that records the recall, so FEFO allocation (people/inventory.py)
+stops using them immediately. The traceability part runs in a Celery task:
+affected dispenses are streamed with .iterator() over the
+(batch, dispensed_at) index into a CSV or NDJSON artifact, and one ALERT
+notification per affected patient is bulk-created and pushed (people/push.py).
+Only a PENDING or FAILED recall is run, so patients are never notified twice.
+"""
+import csv
+import io
+import json
+import logging
+import tempfile
+
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BatchRecall, MedicineBatch, Notification, PrescriptionDispense
+from .inbox import notifications_added
+from .push import publish_on_commit
+from .reservations import BATCH_LOCK_ORDER, release_batches
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 2000
+NOTIFICATION_BATCH_SIZE = 1000
+
+ARTIFACT_FIELDS = [
+    'dispense_id', 'dispensed_at', 'batch_number', 'medicine', 'quantity',
+    'patient_id', 'uhid', 'patient_name', 'phone', 'email', 'prescription_id',
+]
+
+
+def start_recall(batch_ids, reason, initiated_by=None, artifact_format='csv'):
+    """Record the recall and take its batches out of circulation. Queues the traceability job."""
+    with transaction.atomic():
+        batches = list(
+            MedicineBatch.objects.select_for_update().filter(pk__in=batch_ids)
+            .order_by(*BATCH_LOCK_ORDER).values_list('pk', flat=True)
+        )
+        missing = {str(pk) for pk in batch_ids} - {str(pk) for pk in batches}
+        if missing:
+            raise ValueError(f"Unknown batch ids: {', '.join(sorted(missing))}")
+
+        MedicineBatch.objects.filter(pk__in=batches).update(is_recalled=True, recall_reason=reason)
+        release_batches(batches)
+        recall = BatchRecall.objects.create(reason=reason, initiated_by=initiated_by, artifact_format=artifact_format)
+        recall.batches.set(batches)
+        transaction.on_commit(lambda: _queue_recall(recall.pk))
+    return recall
+
+
+def _queue_recall(recall_id):
+    from .tasks import run_batch_recall
+    try:
+        run_batch_recall.delay(recall_id)
+    except Exception as e:
+        logger.error(f"Could not queue recall {recall_id}; run it with run_recall(): {e}")
+
+
+def _affected_dispenses(batch_ids):
+    return (
+        PrescriptionDispense.objects.filter(batch_id__in=batch_ids)
+        .order_by('batch_id', 'dispensed_at')
+        .values_list(
+            'dispense_id', 'dispensed_at', 'batch__batch_number', 'medicine__name', 'quantity_dispensed',
+            'prescription__visit__patient_id', 'prescription__visit__patient__uhid',
+            'prescription__visit__patient__name', 'prescription__visit__patient__phone',
+            'prescription__visit__patient__email', 'prescription_id',
+        )
+        .iterator(chunk_size=STREAM_CHUNK_SIZE)
+    )
+
+
+def run_recall(recall_id):
+    """
+    Stream affected dispenses to the artifact and notify each affected patient once.
+    The recall is claimed with a conditional status update, so a duplicate or
+    redelivered task finds it RUNNING or COMPLETED and leaves it alone.
+    """
+    claimed = BatchRecall.objects.filter(pk=recall_id, status__in=('PENDING', 'FAILED')).update(status='RUNNING', error=None)
+    recall = BatchRecall.objects.get(pk=recall_id)
+    if not claimed:
+        logger.info(f"Recall {recall_id} is already {recall.status}; not running it again")
+        return recall
+    batch_ids = list(recall.batches.values_list('pk', flat=True))
+    batch_numbers = ', '.join(recall.batches.order_by('batch_number').values_list('batch_number', flat=True))
+
+    try:
+        patients = set()
+        dispense_count = 0
+        with tempfile.TemporaryFile(mode='w+b') as spool:
+            text = io.TextIOWrapper(spool, encoding='utf-8', newline='')
+            writer = csv.writer(text) if recall.artifact_format == 'csv' else None
+            if writer:
+                writer.writerow(ARTIFACT_FIELDS)
+            for row in _affected_dispenses(batch_ids):
+                dispense_count += 1
+                patients.add(row[5])
+                if writer:
+                    writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row])
+                else:
+                    text.write(json.dumps(dict(zip(ARTIFACT_FIELDS, row)), default=str) + '\n')
+            text.flush()
+            text.detach()
+            spool.seek(0)
+
+            with transaction.atomic():
+                recall.artifact.save(f"recall-{recall.pk}.{recall.artifact_format}", File(spool), save=False)
+                notifications = Notification.objects.bulk_create(
+                    [
+                        Notification(
+                            patient_id=patient_id,
+                            title='Medicine recall',
+                            message=(
+                                f"A medicine dispensed to you belongs to a recalled batch ({batch_numbers}). "
+                                f"Please stop using it and contact the pharmacy. "
+                                f"Reason: {recall.reason}"
+                            ),
+                            type='ALERT',
+                        )
+                        for patient_id in sorted(patients)
+                    ],
+                    batch_size=NOTIFICATION_BATCH_SIZE,
+                )
+                notifications_added(notifications)
+                publish_on_commit(notifications)
+                recall.status = 'COMPLETED'
+                recall.affected_dispenses = dispense_count
+                recall.affected_patients = len(patients)
+                recall.completed_at = timezone.now()
+                recall.save(update_fields=[
+                    'artifact', 'status', 'affected_dispenses', 'affected_patients', 'completed_at',
+                ])
+    except Exception as e:
+        logger.error(f"Recall {recall_id} failed: {e}")
+        BatchRecall.objects.filter(pk=recall_id).update(status='FAILED', error=str(e))
+        raise
+    return recall
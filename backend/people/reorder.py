@@ -0,0 +1,134 @@
+"""
+Reorder suggestions from consumption velocity.
+
+Daily DISPENSE totals per medicine are grouped in SQL (one row per
+medicine-day), pivoted into a medicine x day matrix with pandas and smoothed
+with a rolling window. The latest window gives the daily velocity and its
+spread; with the usable stock these project days of cover, a reorder point
+and an order-up-to quantity for every medicine at once. Results are stored
+in ReorderSuggestion by the nightly people.tasks.compute_reorder_suggestions.
+"""
+import math
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Medicine, ReorderSuggestion, StockTransaction
+from .stock_ledger import end_of_day
+
+HISTORY_DAYS = 365
+VELOCITY_WINDOW_DAYS = 30
+# One-sided ~95% service level for the safety stock.
+SERVICE_LEVEL_Z = 1.65
+
+
+def daily_consumption(start, end):
+    """Medicine x day DataFrame of units dispensed in [start, end], zero-filled."""
+    rows = (
+        StockTransaction.objects.filter(
+            transaction_type='DISPENSE',
+            timestamp__gte=end_of_day(start - timedelta(days=1)),
+            timestamp__lt=end_of_day(end),
+        )
+        .annotate(day=TruncDate('timestamp'))
+        .values('batch__medicine_id', 'day')
+        .annotate(units=Sum('quantity'))
+        .values_list('batch__medicine_id', 'day', 'units')
+    )
+    days = pd.date_range(start, end, freq='D')
+    frame = pd.DataFrame.from_records(list(rows), columns=['medicine_id', 'day', 'units'])
+    if frame.empty:
+        return pd.DataFrame(columns=days, dtype=float)
+    frame['day'] = pd.to_datetime(frame['day'])
+    # Dispenses are stored as negative quantities.
+    frame['units'] = -frame['units'].astype(float)
+    matrix = frame.pivot_table(index='medicine_id', columns='day', values='units', aggfunc='sum', fill_value=0.0)
+    return matrix.reindex(columns=days, fill_value=0.0)
+
+
+def compute_suggestions(today=None, history_days=HISTORY_DAYS, window=VELOCITY_WINDOW_DAYS):
+    """
+    Suggested purchase quantities for every medicine as a DataFrame indexed by
+    medicine id. Nothing is written.
+    """
+    today = today or timezone.localdate()
+    lead_time = getattr(settings, 'REORDER_LEAD_TIME_DAYS', 7)
+    cover_days = getattr(settings, 'REORDER_COVER_DAYS', 30)
+
+    stock = pd.DataFrame.from_records(
+        list(
+            Medicine.objects.annotate(
+                usable=Coalesce(
+                    Sum('batches__stock_qty', filter=Q(batches__is_recalled=False, batches__expiry_date__gt=today)),
+                    0,
+                )
+            ).values_list('pk', 'reorder_level', 'usable')
+        ),
+        columns=['medicine_id', 'reorder_level', 'usable_stock'],
+        index='medicine_id',
+    )
+    if stock.empty:
+        return stock
+
+    consumption = daily_consumption(today - timedelta(days=history_days - 1), today - timedelta(days=1))
+    consumption = consumption.reindex(index=stock.index, fill_value=0.0)
+    # Rolling over the day axis: each column is the trailing-window mean/std ending that day.
+    rolling = consumption.T.rolling(window, min_periods=1)
+    means = rolling.mean()
+    velocity = means.iloc[-1].fillna(0.0)
+    spread = rolling.std(ddof=0).iloc[-1].fillna(0.0)
+    peak = means.max().fillna(0.0)
+
+    usable = stock['usable_stock'].astype(float)
+    safety = SERVICE_LEVEL_Z * spread * math.sqrt(lead_time)
+    reorder_point = np.maximum(np.ceil(velocity * lead_time + safety), stock['reorder_level'])
+    order_up_to = np.maximum(np.ceil(velocity * (lead_time + cover_days) + safety), stock['reorder_level'])
+    suggested = np.where(usable < reorder_point, np.maximum(order_up_to - usable, 0), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(velocity > 0, usable / velocity, np.nan)
+
+    return pd.DataFrame({
+        'daily_velocity': velocity.round(3),
+        'peak_daily_velocity': peak.round(3),
+        'demand_std': spread.round(3),
+        'usable_stock': stock['usable_stock'].astype(int),
+        'days_of_cover': np.round(cover, 1),
+        'reorder_point': reorder_point.astype(int),
+        'suggested_qty': suggested.astype(int),
+    }, index=stock.index)
+
+
+def store_suggestions(today=None):
+    """Compute and upsert today's ReorderSuggestion rows. Returns the number of medicines processed."""
+    today = today or timezone.localdate()
+    frame = compute_suggestions(today)
+    rows = [
+        ReorderSuggestion(
+            medicine_id=int(medicine_id),
+            computed_on=today,
+            daily_velocity=float(row.daily_velocity),
+            peak_daily_velocity=float(row.peak_daily_velocity),
+            demand_std=float(row.demand_std),
+            usable_stock=int(row.usable_stock),
+            days_of_cover=None if np.isnan(row.days_of_cover) else float(row.days_of_cover),
+            reorder_point=int(row.reorder_point),
+            suggested_qty=int(row.suggested_qty),
+        )
+        for medicine_id, row in zip(frame.index, frame.itertuples(index=False))
+    ]
+    ReorderSuggestion.objects.bulk_create(
+        rows,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['medicine', 'computed_on'],
+        update_fields=[
+            'daily_velocity', 'peak_daily_velocity', 'demand_std', 'usable_stock',
+            'days_of_cover', 'reorder_point', 'suggested_qty',
+        ],
+    )
+    return len(rows)
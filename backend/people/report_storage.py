@@ -0,0 +1,147 @@
+"""
+Content-addressed storage for report files (lab, radiology, post-op).
+
+Uploads are streamed to a temp file in chunks while being hashed, then moved
+to <upload_to>/<sha[:2]>/<sha><ext>. Re-uploading identical bytes reuses the
+existing blob instead of storing a second copy. Because blobs can be shared
+between rows, delete() is a no-op. sweep_orphaned_blobs() (run nightly by
+people.tasks.sweep_report_blobs) removes blobs no report field references
+any more, e.g. replaced reports or uploads whose transaction rolled back.
+Only blobs older than a grace period are removed, so an identical upload
+that has reused a blob but not yet committed its row keeps it.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+from django.utils.deconstruct import deconstructible
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+ORPHAN_GRACE = timedelta(days=1)
+
+# How long a signed report link handed out by the API stays valid.
+REPORT_URL_MAX_AGE = getattr(settings, 'REPORT_URL_MAX_AGE', 60 * 60)
+_signer = signing.TimestampSigner(salt='people.report-file')
+
+
+@deconstructible
+class ReportStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save().
+        return name
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        os.makedirs(self.path(directory), exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.path(directory), suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            hexdigest = digest.hexdigest()
+            final_name = os.path.join(directory, hexdigest[:2], f"{hexdigest}{ext}")
+            final_path = self.path(final_name)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+                # Restart the orphan grace period for the new reference.
+                os.utime(final_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return final_name.replace('\\', '/')
+
+    def delete(self, name):
+        pass
+
+    def purge(self, name):
+        """Really remove a blob (see sweep_orphaned_blobs)."""
+        super().delete(name)
+
+    def etag(self, name):
+        """Strong ETag: the content hash for addressed blobs, size/mtime for legacy files."""
+        stem = os.path.splitext(os.path.basename(name))[0]
+        if DIGEST_RE.match(stem):
+            return f'"{stem}"'
+        stat = os.stat(self.path(name))
+        return f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def get_report_storage():
+    return report_storage
+
+
+report_storage = ReportStorage()
+
+
+def _report_fields():
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if getattr(field, 'storage', None) is report_storage:
+                yield model, field
+
+
+def sweep_orphaned_blobs(grace=ORPHAN_GRACE):
+    """
+    Delete content-addressed blobs (and abandoned .upload temp files) older than
+    `grace` that no report field points at. Legacy, non-hashed files are kept.
+    Returns the number of files removed.
+    """
+    referenced = set()
+    directories = set()
+    for model, field in _report_fields():
+        directories.add(str(field.upload_to).rstrip('/'))
+        referenced.update(
+            model.objects.exclude(**{f'{field.name}__isnull': True}).exclude(**{field.name: ''})
+            .values_list(field.name, flat=True).iterator()
+        )
+
+    cutoff = time.time() - grace.total_seconds()
+    removed = 0
+    for directory in sorted(directories):
+        root = report_storage.path(directory)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, report_storage.location).replace('\\', '/')
+                stem, ext = os.path.splitext(filename)
+                orphan = ext == '.upload' or (DIGEST_RE.match(stem) and name not in referenced)
+                if orphan and os.path.getmtime(path) < cutoff:
+                    report_storage.purge(name)
+                    removed += 1
+    return removed
+
+
+def signed_report_url(kind, pk):
+    """Short-lived link to the report download view; usable from a plain <a href>."""
+    token = _signer.sign(f"{kind}:{pk}")
+    return f"{reverse('report-file', kwargs={'kind': kind, 'pk': pk})}?sig={token}"
+
+
+def check_report_signature(token, kind, pk):
+    try:
+        return _signer.unsign(token, max_age=REPORT_URL_MAX_AGE) == f"{kind}:{pk}"
+    except signing.BadSignature:
+        return False
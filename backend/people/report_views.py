@@ -0,0 +1,147 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import LabTest, Operation, RadiologyTest, Staff
+from .report_storage import check_report_signature
+
+# kind in the URL -> (model, file field, path to the owning patient's uhid)
+REPORT_KINDS = {
+    'lab': (LabTest, 'report_file', 'order__visit__patient__uhid'),
+    'radiology': (RadiologyTest, 'report_file', 'order__visit__patient__uhid'),
+    'operation': (Operation, 'post_op_file', 'order__visit__patient__uhid'),
+}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _parse_range(header, size):
+    """Return (start, end) inclusive for a single byte range, None to ignore the header, or False if unsatisfiable."""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(fh, start, end):
+    try:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fh.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        fh.close()
+
+
+class ReportFileView(APIView):
+    """
+    Authenticated download of lab, radiology and post-op report files.
+
+    Access: any staff member, the patient the report belongs to, or anyone
+    holding a signed link from the API (?sig=). Supports ETag/If-None-Match
+    and single byte ranges. With REPORT_SENDFILE set to 'nginx' or 'apache'
+    the file body is handed off to the web server via X-Accel-Redirect /
+    X-Sendfile, which then handles ranges itself.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, kind, pk):
+        if kind not in REPORT_KINDS:
+            return Response({'error': 'Unknown report type'}, status=status.HTTP_404_NOT_FOUND)
+        model, file_attr, uhid_path = REPORT_KINDS[kind]
+
+        row = model.objects.filter(pk=pk).values(file_attr, uhid_path).first()
+        if row is None or not row[file_attr]:
+            return Response({'error': 'Report not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if not self._can_read(request, kind, pk, row[uhid_path]):
+            return Response({'error': 'Not allowed to view this report'}, status=status.HTTP_403_FORBIDDEN)
+
+        storage = model._meta.get_field(file_attr).storage
+        name = row[file_attr]
+        if not storage.exists(name):
+            return Response({'error': 'Report file is missing'}, status=status.HTTP_404_NOT_FOUND)
+
+        etag = storage.etag(name)
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        offload = getattr(settings, 'REPORT_SENDFILE', None)
+        if offload:
+            response = HttpResponse(content_type=content_type)
+            if offload == 'nginx':
+                prefix = getattr(settings, 'REPORT_SENDFILE_PREFIX', '/protected-media/')
+                response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + name
+            else:
+                response['X-Sendfile'] = storage.path(name)
+        else:
+            response = self._stream(request, storage, name, content_type)
+
+        response['ETag'] = etag
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'private, max-age=3600'
+        response['Content-Disposition'] = f'inline; filename="{os.path.basename(name)}"'
+        return response
+
+    def _can_read(self, request, kind, pk, patient_uhid):
+        signature = request.query_params.get('sig')
+        if signature and check_report_signature(signature, kind, pk):
+            return True
+        user = request.user
+        if not user.is_authenticated:
+            return False
+        if user.username == f"p_{patient_uhid}":
+            return True
+        return user.is_staff or Staff.objects.filter(user_email=user.username).exists()
+
+    def _stream(self, request, storage, name, content_type):
+        size = storage.size(name)
+        byte_range = _parse_range(request.headers.get('Range', ''), size) if 'Range' in request.headers else None
+
+        if byte_range is False:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range is None:
+            # FileResponse streams the file in blocks instead of reading it whole.
+            response = FileResponse(storage.open(name, 'rb'), content_type=content_type)
+            response.block_size = STREAM_CHUNK_SIZE
+            response['Content-Length'] = size
+            return response
+
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(storage.open(name, 'rb'), start, end),
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+        return response
@@ -0,0 +1,110 @@
+"""
+Soft stock reservations for open prescriptions.
+
+Creating a prescription holds its quantity on the medicine's dispensable
+batches, earliest expiry first (PrescriptionReservation rows plus the
+MedicineBatch.reserved_qty counter, updated together under row locks).
+Available-to-dispense is then stock_qty - reserved_qty on the batch row.
+Reservations are released when the prescription is closed or deleted (also
+through a deleted visit or patient; see people/signals.py), consumed when
+it is dispensed (people/inventory.py), and dropped when their batch expires
+or is recalled. Reserving is best effort: a shortfall is reported, not
+raised, since a prescription is still valid when stock is short.
+"""
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import MedicineBatch, Prescription, PrescriptionReservation
+from .pharmacy_queue import invalidate_queue
+
+OPEN_STATUSES = ('PENDING', 'PARTIALLY_DISPENSED')
+# Every path that locks MedicineBatch rows locks them in this order, so
+# dispensing, reserving, recalls and the expiry sweep cannot deadlock.
+BATCH_LOCK_ORDER = ('medicine_id', 'expiry_date', 'pk')
+
+
+def reserve_stock(prescription, quantity=None):
+    """
+    Hold `quantity` (default: the prescription's quantity) on FEFO batches for a
+    prescription that holds nothing yet. Returns {"reserved": n, "shortfall": m}.
+    """
+    quantity = prescription.quantity if quantity is None else quantity
+    today = timezone.localdate()
+    with transaction.atomic():
+        batches = (
+            MedicineBatch.objects.select_for_update()
+            .filter(medicine_id=prescription.medicine_id, is_recalled=False, expiry_date__gt=today)
+            .filter(stock_qty__gt=F('reserved_qty'))
+            .order_by(*BATCH_LOCK_ORDER)
+        )
+        holds, remaining = [], quantity
+        for batch in batches:
+            if remaining == 0:
+                break
+            take = min(remaining, batch.available_qty)
+            batch.reserved_qty += take
+            holds.append((batch, take))
+            remaining -= take
+
+        if holds:
+            MedicineBatch.objects.bulk_update([batch for batch, _ in holds], ['reserved_qty'])
+            PrescriptionReservation.objects.bulk_create([
+                PrescriptionReservation(prescription=prescription, batch=batch, quantity=take) for batch, take in holds
+            ])
+            transaction.on_commit(invalidate_queue)
+    return {'reserved': quantity - remaining, 'shortfall': remaining}
+
+
+def _release(reservations):
+    """Give back the listed reservation rows (as a queryset) and delete them. Returns units released."""
+    per_batch = {}
+    for batch_id, quantity in reservations.values_list('batch_id', 'quantity'):
+        per_batch[batch_id] = per_batch.get(batch_id, 0) + quantity
+    if not per_batch:
+        return 0
+    batches = list(
+        MedicineBatch.objects.select_for_update().filter(pk__in=per_batch).order_by(*BATCH_LOCK_ORDER)
+    )
+    for batch in batches:
+        batch.reserved_qty = max(batch.reserved_qty - per_batch[batch.pk], 0)
+    MedicineBatch.objects.bulk_update(batches, ['reserved_qty'])
+    reservations.delete()
+    transaction.on_commit(invalidate_queue)
+    return sum(per_batch.values())
+
+
+def release_reservations(prescription_ids):
+    """Cancel path: release everything held for these prescriptions."""
+    with transaction.atomic():
+        return _release(PrescriptionReservation.objects.filter(prescription_id__in=prescription_ids))
+
+
+def release_batches(batch_ids):
+    """Expiry/recall path: drop every reservation on batches that can no longer be dispensed."""
+    with transaction.atomic():
+        return _release(PrescriptionReservation.objects.filter(batch_id__in=batch_ids))
+
+
+def sync_reservation(prescription, previous_status, previous_quantity, previous_medicine_id):
+    """
+    Keep reservations in line with an edited prescription: release once it is no
+    longer open (cancelled, or marked dispensed by hand), reserve what is still to
+    be dispensed when it is reopened or the medicine or quantity of an open
+    prescription changes.
+    """
+    was_open = previous_status in OPEN_STATUSES
+    if prescription.status not in OPEN_STATUSES:
+        if was_open:
+            release_reservations([prescription.pk])
+    elif (
+        not was_open
+        or prescription.medicine_id != previous_medicine_id
+        or prescription.quantity != previous_quantity
+    ):
+        with transaction.atomic():
+            release_reservations([prescription.pk])
+            prescription = Prescription.objects.get(pk=prescription.pk)
+            dispensed = prescription.dispenses.aggregate(total=Sum('quantity_dispensed'))['total'] or 0
+            if prescription.quantity > dispensed:
+                reserve_stock(prescription, prescription.quantity - dispensed)
@@ -0,0 +1,182 @@
+"""
+OT room scheduling.
+
+Operations occupy their room for the half-open interval
+[scheduled_time, scheduled_end). On PostgreSQL an exclusion constraint
+(migration 0012) rejects overlapping active bookings per room; elsewhere the
+pre-check in find_conflict() is the only guard. IntervalTree is the in-memory
+index used to detect overlaps within a set of bookings (the OT board, or a
+batch of new bookings checked against each other) without a pairwise scan.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.serializers import ValidationError
+
+from .models import Operation
+
+DEFAULT_OPERATION_DURATION = timedelta(hours=2)
+ACTIVE_OPERATION_STATUSES = ('SCHEDULED', 'IN_PROGRESS')
+OVERLAP_CONSTRAINT = 'operation_ot_room_no_overlap'
+
+
+class IntervalTree:
+    """
+    Static interval tree over half-open [start, end) intervals: a balanced
+    tree over the intervals sorted by start, each node tracking the largest
+    end in its subtree so whole branches can be skipped.
+    """
+
+    def __init__(self, intervals):
+        # intervals: iterable of (start, end, payload)
+        self._items = sorted(intervals, key=lambda item: item[0])
+        self._max_end = [None] * len(self._items)
+        self._build(0, len(self._items) - 1)
+
+    def _build(self, lo, hi):
+        if lo > hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self._items[mid][1]
+        for child in (self._build(lo, mid - 1), self._build(mid + 1, hi)):
+            if child is not None and child > max_end:
+                max_end = child
+        self._max_end[mid] = max_end
+        return max_end
+
+    def overlapping(self, start, end):
+        """Payloads of all intervals overlapping [start, end)."""
+        found = []
+        self._search(0, len(self._items) - 1, start, end, found)
+        return found
+
+    def _search(self, lo, hi, start, end, found):
+        if lo > hi:
+            return
+        mid = (lo + hi) // 2
+        if self._max_end[mid] <= start:
+            return
+        self._search(lo, mid - 1, start, end, found)
+        item_start, item_end, payload = self._items[mid]
+        if item_start >= end:
+            # Everything to the right starts even later.
+            return
+        if item_end > start:
+            found.append(payload)
+        self._search(mid + 1, hi, start, end, found)
+
+
+def as_aware(value, field='scheduled_time'):
+    """Aware datetime from a datetime or ISO string; None for an empty value. Raises ValidationError."""
+    if value in (None, ''):
+        return None
+    if isinstance(value, str):
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:  # Well-formed but out of range, e.g. month 13
+            parsed = None
+        value = parsed
+    if not isinstance(value, datetime):
+        raise ValidationError({field: 'Enter a valid ISO 8601 date and time.'})
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def operation_window(scheduled_time, scheduled_end=None, duration_minutes=None, default_duration=DEFAULT_OPERATION_DURATION):
+    """
+    Resolve (start, end) for a booking. Without an end or duration_minutes the
+    booking lasts default_duration. Raises ValidationError for unusable input.
+    """
+    start = as_aware(scheduled_time)
+    if start is None:
+        return None, None
+    end = as_aware(scheduled_end, 'scheduled_end')
+    if end is None:
+        duration = default_duration
+        if duration_minutes not in (None, ''):
+            try:
+                minutes = int(duration_minutes)
+            except (TypeError, ValueError):
+                minutes = 0
+            if isinstance(duration_minutes, bool) or minutes <= 0:
+                raise ValidationError({'duration_minutes': 'Enter a positive whole number of minutes.'})
+            duration = timedelta(minutes=minutes)
+        end = start + duration
+    return start, end
+
+
+def find_conflict(ot_room, start, end, exclude_pk=None):
+    """First active operation in the room overlapping [start, end), or None."""
+    conflicts = Operation.objects.filter(
+        ot_room=ot_room,
+        status__in=ACTIVE_OPERATION_STATUSES,
+        scheduled_time__lt=end,
+        scheduled_end__gt=start,
+    )
+    if exclude_pk is not None:
+        conflicts = conflicts.exclude(pk=exclude_pk)
+    return conflicts.order_by('scheduled_time').only('scheduled_time', 'scheduled_end').first()
+
+
+def conflict_message(ot_room, blocking):
+    return (
+        f"OT Room {ot_room} is already booked from "
+        f"{timezone.localtime(blocking.scheduled_time).strftime('%H:%M')} to "
+        f"{timezone.localtime(blocking.scheduled_end).strftime('%H:%M')}. "
+        f"Please choose a different time or room."
+    )
+
+
+def is_overlap_violation(error):
+    return OVERLAP_CONSTRAINT in str(error)
+
+
+def ot_board(day):
+    """
+    All rooms' bookings that touch the given local date, in one query.
+    Each booking lists the ids of other active bookings it overlaps.
+    """
+    day_start = timezone.make_aware(datetime.combine(day, time.min))
+    day_end = day_start + timedelta(days=1)
+    rows = (
+        Operation.objects.filter(scheduled_time__lt=day_end, scheduled_end__gt=day_start)
+        .exclude(status='CANCELLED')
+        .exclude(ot_room__isnull=True)
+        .order_by('ot_room', 'scheduled_time')
+        .values(
+            'operation_id', 'operation_name', 'status', 'ot_room', 'scheduled_time', 'scheduled_end',
+            'surgeon__name', 'order__visit__patient_id', 'order__visit__patient__name',
+        )
+    )
+
+    rooms = {}
+    for row in rows:
+        rooms.setdefault(row['ot_room'], []).append(row)
+
+    board = []
+    for room, bookings in rooms.items():
+        tree = IntervalTree(
+            (b['scheduled_time'], b['scheduled_end'], b['operation_id'])
+            for b in bookings if b['status'] in ACTIVE_OPERATION_STATUSES
+        )
+        operations = []
+        for b in bookings:
+            conflicts = []
+            if b['status'] in ACTIVE_OPERATION_STATUSES:
+                conflicts = [pk for pk in tree.overlapping(b['scheduled_time'], b['scheduled_end'])
+                             if pk != b['operation_id']]
+            operations.append({
+                'id': b['operation_id'],
+                'operation_name': b['operation_name'],
+                'status': b['status'],
+                'patient_id': b['order__visit__patient_id'],
+                'patient_name': b['order__visit__patient__name'],
+                'surgeon_name': b['surgeon__name'],
+                'scheduled_time': b['scheduled_time'],
+                'scheduled_end': b['scheduled_end'],
+                'conflicts_with': conflicts,
+            })
+        board.append({'ot_room': room, 'operations': operations})
+    return board
@@ -1,8 +1,16 @@
 from rest_framework import serializers
-from .models import Allergy, Bill, BillItem, InsuranceClaim, Patient, Staff, Visit, Admission, Bed, Vital, ClinicalNote, Order, LabTest, RadiologyTest, Medicine, MedicineBatch, StockTransaction, Prescription, PrescriptionDispense, Operation, Notification
+from .models import BatchRecall, ReorderSuggestion, OrderSet, Allergy, Bill, BillItem, InsuranceClaim, Patient, Staff, Visit, Admission, Bed, Vital, ClinicalNote, Order, LabTest, RadiologyTest, Medicine, MedicineBatch, StockTransaction, Prescription, PrescriptionDispense, Operation, Notification
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from django.utils.dateparse import parse_datetime
-from datetime import timedelta
+from .report_storage import signed_report_url
+from .order_sets import clean_items
+from .recalls import start_recall
+from .grn import MAX_GRN_LINES
+from .scheduling import (
+    ACTIVE_OPERATION_STATUSES, DEFAULT_OPERATION_DURATION, conflict_message, find_conflict, is_overlap_violation,
+    operation_window,
+)
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
@@ -209,7 +217,7 @@ class VitalSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vital
         fields = '__all__'
-        read_only_fields = ['nurse']
+        read_only_fields = ['nurse', 'recorded_at', 'early_warning_score']
 
 class ClinicalNoteSerializer(serializers.ModelSerializer):
     created_by_name = serializers.CharField(source='created_by.name', read_only=True)
@@ -231,11 +239,28 @@ class ClinicalNoteSerializer(serializers.ModelSerializer):
                  pass # Relaxing strictness for now or relying on frontend validation
         return data
 
+class ReportFileField(serializers.FileField):
+    """Accepts uploads as usual but renders a signed link to the report download view."""
+
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        kwargs.setdefault('required', False)
+        kwargs.setdefault('allow_null', True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = signed_report_url(self.kind, value.instance.pk)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
 class LabTestSerializer(serializers.ModelSerializer):
     patient_name = serializers.CharField(source='order.visit.patient.name', read_only=True)
     patient_id = serializers.IntegerField(source='order.visit.patient.id', read_only=True)
     doctor_name = serializers.CharField(source='order.doctor.name', read_only=True)
     ordered_at = serializers.DateTimeField(source='order.ordered_at', read_only=True)
+    report_file = ReportFileField('lab')
     
     class Meta:
         model = LabTest
@@ -246,6 +271,7 @@ class RadiologyTestSerializer(serializers.ModelSerializer):
     patient_id = serializers.IntegerField(source='order.visit.patient.id', read_only=True)
     doctor_name = serializers.CharField(source='order.doctor.name', read_only=True)
     ordered_at = serializers.DateTimeField(source='order.ordered_at', read_only=True)
+    report_file = ReportFileField('radiology')
 
     class Meta:
         model = RadiologyTest
@@ -255,35 +281,70 @@ class MedicineBatchSerializer(serializers.ModelSerializer):
     is_expired = serializers.SerializerMethodField()
     days_to_expiry = serializers.SerializerMethodField()
     health_score = serializers.SerializerMethodField()
+    available_qty = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = MedicineBatch
         fields = '__all__'
+        read_only_fields = ['reserved_qty']
+
+    def _today(self):
+        # One date per request: the context dict is shared by every row of a list
+        # (and by nested batch lists under MedicineSerializer).
+        if 'today' not in self.context:
+            self.context['today'] = timezone.localdate()
+        return self.context['today']
 
     def get_is_expired(self, obj):
-        from django.utils import timezone
-        return obj.expiry_date < timezone.now().date()
+        return obj.expiry_date < self._today()
 
     def get_days_to_expiry(self, obj):
-        from django.utils import timezone
-        delta = obj.expiry_date - timezone.now().date()
-        return delta.days
-    
+        return (obj.expiry_date - self._today()).days
+
     def get_health_score(self, obj):
-        # Unique HIS Metric: Higher is better. 
+        # Unique HIS Metric: Higher is better.
         # Factors: Expiry distance, stock velocity (mocked for now)
-        from django.utils import timezone
-        days = (obj.expiry_date - timezone.now().date()).days
+        days = (obj.expiry_date - self._today()).days
         if days < 0: return 0
         if days > 365: return 100
         return int((days / 365) * 100)
 
+class GoodsReceiptLineSerializer(serializers.Serializer):
+    medicine_id = serializers.IntegerField(required=False)
+    medicine_name = serializers.CharField(max_length=255, required=False)
+    generic_name = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    category = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    manufacturer = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    batch_number = serializers.CharField(max_length=100)
+    expiry_date = serializers.DateField()
+    quantity = serializers.IntegerField(min_value=1)
+    purchase_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+
+    def validate(self, data):
+        if not data.get('medicine_id') and not (data.get('medicine_name') or '').strip():
+            raise serializers.ValidationError("Each line needs a medicine_id or medicine_name.")
+        return data
+
+class GoodsReceiptSerializer(serializers.Serializer):
+    invoice_number = serializers.CharField(max_length=80)
+    supplier = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    lines = GoodsReceiptLineSerializer(many=True, allow_empty=False, max_length=MAX_GRN_LINES)
+
 class StockTransactionSerializer(serializers.ModelSerializer):
     staff_name = serializers.CharField(source='performed_by.name', read_only=True)
     class Meta:
         model = StockTransaction
         fields = '__all__'
 
+class ReorderSuggestionSerializer(serializers.ModelSerializer):
+    medicine_name = serializers.CharField(source='medicine.name', read_only=True)
+    generic_name = serializers.CharField(source='medicine.generic_name', read_only=True)
+
+    class Meta:
+        model = ReorderSuggestion
+        fields = '__all__'
+
 class MedicineSerializer(serializers.ModelSerializer):
     batches = MedicineBatchSerializer(many=True, read_only=True)
     total_stock = serializers.ReadOnlyField()
@@ -322,6 +383,24 @@ class PrescriptionSerializer(serializers.ModelSerializer):
         model = Prescription
         fields = '__all__'
 
+class PendingPrescriptionSerializer(serializers.ModelSerializer):
+    """Pharmacy queue row: medicine name and dispensable stock only; batches come from /medicine-batches/?medicine=."""
+    medicine_id = serializers.IntegerField(read_only=True)
+    medicine_name = serializers.CharField(source='medicine.name', read_only=True)
+    available_stock = serializers.IntegerField(read_only=True)
+    patient_name = serializers.CharField(source='visit.patient.name', read_only=True)
+    patient_id = serializers.IntegerField(source='visit.patient.id', read_only=True)
+    doctor_name = serializers.CharField(source='visit.doctor.name', read_only=True)
+    visit_date = serializers.DateField(source='visit.visit_date', read_only=True)
+
+    class Meta:
+        model = Prescription
+        fields = [
+            'prescription_id', 'visit', 'medicine_id', 'medicine_name', 'available_stock',
+            'dosage_per_day', 'duration', 'quantity', 'status', 'created_at',
+            'patient_name', 'patient_id', 'doctor_name', 'visit_date',
+        ]
+
 class PrescriptionDispenseSerializer(serializers.ModelSerializer):
     pharmacist_name = serializers.CharField(source='dispensed_by.name', read_only=True)
     medicine_name = serializers.CharField(source='medicine.name', read_only=True)
@@ -337,11 +416,44 @@ class OperationSerializer(serializers.ModelSerializer):
     doctor_name = serializers.CharField(source='order.doctor.name', read_only=True)
     surgeon_name = serializers.CharField(source='surgeon.name', read_only=True)
     ordered_at = serializers.DateTimeField(source='order.ordered_at', read_only=True)
+    post_op_file = ReportFileField('operation')
 
     class Meta:
         model = Operation
         fields = '__all__'
 
+    def validate(self, data):
+        instance = self.instance
+        def current(field):
+            return data[field] if field in data else getattr(instance, field, None)
+
+        ot_room, status = current('ot_room'), current('status') or 'SCHEDULED'
+        start = current('scheduled_time')
+        end = data.get('scheduled_end') or (None if 'scheduled_time' in data else current('scheduled_end'))
+        duration = DEFAULT_OPERATION_DURATION
+        if instance is not None and instance.scheduled_time and instance.scheduled_end:
+            # Moving only the start keeps the booking's length.
+            duration = instance.scheduled_end - instance.scheduled_time
+        start, end = operation_window(start, end, default_duration=duration)
+        if start:
+            if end <= start:
+                raise serializers.ValidationError("Operation must end after it starts.")
+            data['scheduled_time'], data['scheduled_end'] = start, end
+            if ot_room and status in ACTIVE_OPERATION_STATUSES:
+                blocking_op = find_conflict(ot_room, start, end, exclude_pk=getattr(instance, 'pk', None))
+                if blocking_op:
+                    raise serializers.ValidationError(conflict_message(ot_room, blocking_op))
+        return data
+
+    def save(self, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError as e:
+            if not is_overlap_violation(e):
+                raise
+            raise serializers.ValidationError("OT Room was just booked for an overlapping slot. Please choose a different time or room.")
+
 class OrderSerializer(serializers.ModelSerializer):
     lab_tests = LabTestSerializer(many=True, read_only=True)
     radiology_tests = RadiologyTestSerializer(many=True, read_only=True)
@@ -385,27 +497,17 @@ class CreateOrderSerializer(serializers.ModelSerializer):
         if data.get('order_type') == 'OPERATION':
             details = data.get('details', {})
             ot_room = details.get('ot_room')
-            scheduled_time = details.get('scheduled_time')
-            
-            if ot_room and scheduled_time:
-                check_time = parse_datetime(scheduled_time)
-                if check_time:
-                    # Assume 2 hour slot duration
-                    start_window = check_time - timedelta(hours=2)
-                    end_window = check_time + timedelta(hours=2)
-                    
-                    conflicts = Operation.objects.filter(
-                        ot_room=ot_room,
-                        scheduled_time__gt=start_window,
-                        scheduled_time__lt=end_window,
-                        status__in=['SCHEDULED', 'IN_PROGRESS']
-                    )
-                    
-                    if conflicts.exists():
-                        blocking_op = conflicts.first()
-                        raise serializers.ValidationError(
-                            f"OT Room {ot_room} is already booked around this time ({blocking_op.scheduled_time.strftime('%H:%M')}). Please choose a different time or room."
-                        )
+            start, end = operation_window(
+                details.get('scheduled_time'), details.get('scheduled_end'), details.get('duration_minutes')
+            )
+            if start and end <= start:
+                raise serializers.ValidationError("Operation must end after it starts.")
+
+            if ot_room and start:
+                blocking_op = find_conflict(ot_room, start, end)
+                if blocking_op:
+                    raise serializers.ValidationError(conflict_message(ot_room, blocking_op))
+            details['scheduled_time'], details['scheduled_end'] = start, end
         return data
 
     def create(self, validated_data):
@@ -415,34 +517,88 @@ class CreateOrderSerializer(serializers.ModelSerializer):
         # If doctor_id is passed (from context or request), use it, otherwise rely on view validation
         if doctor_id:
             validated_data['doctor_id'] = doctor_id
-            
-        order = Order.objects.create(**validated_data)
 
-        if order.order_type == 'LAB':
-            LabTest.objects.create(
-                order=order,
-                test_name=details.get('test_name'),
-                price=details.get('price', 0)
-            )
-        elif order.order_type == 'RADIOLOGY':
-            RadiologyTest.objects.create(
-                order=order,
-                scan_type=details.get('scan_type'),
-                price=details.get('price', 0)
-            )
-        elif order.order_type == 'OPERATION':
-            # Default surgeon to the ordering doctor
-            Operation.objects.create(
-                order=order,
-                operation_name=details.get('operation_name'),
-                surgeon=order.doctor, 
-                price=details.get('price', 0),
-                ot_room=details.get('ot_room'),
-                scheduled_time=details.get('scheduled_time')
-            )
-        
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(**validated_data)
+
+                if order.order_type == 'LAB':
+                    LabTest.objects.create(
+                        order=order,
+                        test_name=details.get('test_name'),
+                        price=details.get('price', 0)
+                    )
+                elif order.order_type == 'RADIOLOGY':
+                    RadiologyTest.objects.create(
+                        order=order,
+                        scan_type=details.get('scan_type'),
+                        price=details.get('price', 0)
+                    )
+                elif order.order_type == 'OPERATION':
+                    # Default surgeon to the ordering doctor
+                    Operation.objects.create(
+                        order=order,
+                        operation_name=details.get('operation_name'),
+                        surgeon=order.doctor,
+                        price=details.get('price', 0),
+                        ot_room=details.get('ot_room'),
+                        scheduled_time=details.get('scheduled_time'),
+                        scheduled_end=details.get('scheduled_end'),
+                    )
+        except IntegrityError as e:
+            # A concurrent booking won the race; the exclusion constraint caught it
+            # and the order rolled back with it.
+            if not is_overlap_violation(e):
+                raise
+            raise serializers.ValidationError(f"OT Room {details.get('ot_room')} was just booked for an overlapping slot. Please choose a different time or room.")
+
         return order
 
+class OrderSetSerializer(serializers.ModelSerializer):
+    created_by_name = serializers.CharField(source='created_by.name', read_only=True)
+
+    class Meta:
+        model = OrderSet
+        fields = '__all__'
+        read_only_fields = ['created_by', 'created_at']
+
+    def validate_items(self, value):
+        items, errors = clean_items(value)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return items
+
+class BatchRecallSerializer(serializers.ModelSerializer):
+    batch_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, allow_empty=False)
+    batch_numbers = serializers.SerializerMethodField()
+    initiated_by_name = serializers.CharField(source='initiated_by.name', read_only=True)
+
+    class Meta:
+        model = BatchRecall
+        fields = [
+            'id', 'batch_ids', 'batches', 'batch_numbers', 'reason', 'artifact_format', 'status',
+            'affected_dispenses', 'affected_patients', 'error', 'initiated_by', 'initiated_by_name',
+            'created_at', 'completed_at',
+        ]
+        read_only_fields = [
+            'batches', 'status', 'affected_dispenses', 'affected_patients', 'error',
+            'initiated_by', 'created_at', 'completed_at',
+        ]
+
+    def get_batch_numbers(self, obj):
+        return [batch.batch_number for batch in obj.batches.all()]
+
+    def create(self, validated_data):
+        try:
+            return start_recall(
+                validated_data['batch_ids'],
+                validated_data['reason'],
+                initiated_by=validated_data.get('initiated_by'),
+                artifact_format=validated_data.get('artifact_format', 'csv'),
+            )
+        except ValueError as e:
+            raise serializers.ValidationError({'batch_ids': str(e)})
+
 class NotificationSerializer(serializers.ModelSerializer):
     recipient_name = serializers.CharField(source='recipient.name', read_only=True)
     patient_name = serializers.CharField(source='patient.name', read_only=True)
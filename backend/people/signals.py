@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models import Staff
@@ -52,3 +52,107 @@ def update_bill_total(sender, instance, **kwargs):
     # Update bill
     bill.total_amount = total
     bill.save(update_fields=['total_amount'])
+
+
+from .models import Allergy, ClinicalNote, Patient, Prescription, Visit, Vital
+from .chart import refresh_chart, touch_chart
+from .pharmacy_queue import invalidate_queue
+from .reservations import release_reservations
+from django.db import transaction
+
+
+def _patient_of_visit(visit_id):
+    return Visit.objects.filter(pk=visit_id).values_list('patient_id', flat=True).first()
+
+
+@receiver(post_save, sender=Visit)
+@receiver(post_delete, sender=Visit)
+def refresh_chart_visits(sender, instance, **kwargs):
+    refresh_chart(instance.patient_id, 'visit_history')
+
+
+@receiver(post_save, sender=ClinicalNote)
+@receiver(post_delete, sender=ClinicalNote)
+def refresh_chart_diagnoses(sender, instance, **kwargs):
+    patient_id = _patient_of_visit(instance.visit_id)
+    if patient_id:
+        refresh_chart(patient_id, 'visit_history')
+
+
+@receiver(post_save, sender=Vital)
+@receiver(post_delete, sender=Vital)
+def refresh_chart_vitals(sender, instance, **kwargs):
+    patient_id = _patient_of_visit(instance.visit_id)
+    if patient_id:
+        refresh_chart(patient_id, 'latest_vitals')
+
+
+@receiver(post_save, sender=Allergy)
+@receiver(post_delete, sender=Allergy)
+def refresh_chart_allergies(sender, instance, **kwargs):
+    refresh_chart(instance.patient_id, 'allergies')
+
+
+@receiver(post_save, sender=Prescription)
+@receiver(post_delete, sender=Prescription)
+def refresh_chart_prescriptions(sender, instance, **kwargs):
+    patient_id = _patient_of_visit(instance.visit_id)
+    if patient_id:
+        refresh_chart(patient_id, 'active_prescriptions')
+
+
+@receiver(post_save, sender=Prescription)
+@receiver(post_delete, sender=Prescription)
+def invalidate_pharmacy_queue(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_queue)
+
+
+@receiver(pre_delete, sender=Prescription)
+def release_prescription_holds(sender, instance, **kwargs):
+    # Also runs for cascades (a deleted visit or patient), whose reservation
+    # rows would otherwise vanish without giving reserved_qty back.
+    release_reservations([instance.pk])
+
+
+@receiver(post_save, sender=Patient)
+def touch_chart_demographics(sender, instance, created, **kwargs):
+    if not created:
+        touch_chart(instance.pk)
+
+
+from .models import Medicine
+from .formulary import formulary
+
+
+@receiver(post_save, sender=Medicine)
+def index_formulary_medicine(sender, instance, **kwargs):
+    transaction.on_commit(lambda: formulary.update([instance]))
+
+
+@receiver(post_delete, sender=Medicine)
+def unindex_formulary_medicine(sender, instance, **kwargs):
+    medicine_id = instance.pk
+    transaction.on_commit(lambda: formulary.remove(medicine_id))
+
+
+from .models import Notification
+from .inbox import notifications_added
+from .push import publish_notifications
+
+
+@receiver(post_save, sender=Notification)
+def push_notification(sender, instance, created, **kwargs):
+    if created:
+        notifications_added([instance])
+        transaction.on_commit(lambda: publish_notifications([instance]))
+
+
+from .models import MedicineBatch
+from .expiry import refresh_medicine_buckets
+
+
+@receiver(post_save, sender=MedicineBatch)
+@receiver(post_delete, sender=MedicineBatch)
+def refresh_expiry_summary(sender, instance, **kwargs):
+    medicine_id = instance.medicine_id
+    transaction.on_commit(lambda: refresh_medicine_buckets([medicine_id]))
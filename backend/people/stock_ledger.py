@@ -0,0 +1,109 @@
+"""
+As-of stock queries over the StockTransaction ledger.
+
+A nightly job (people.tasks.snapshot_stock_levels) stores each batch's
+closing balance in StockSnapshot. The balance at any moment is then the
+latest snapshot before it plus the ledger rows since that snapshot, instead
+of a sum over the batch's whole history.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import MedicineBatch, StockSnapshot, StockTransaction
+
+SNAPSHOT_CHUNK_SIZE = 2000
+
+
+def end_of_day(day):
+    """Aware datetime at the start of the next local day (closing time for `day`)."""
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def stock_as_of(at, batch_ids=None):
+    """
+    Ledger balance of each batch at `at` as {batch_id: qty}.
+    Uses the most recent snapshot day before `at` plus the ledger delta since.
+    """
+    at_date = timezone.localdate(at)
+    base_date = (
+        StockSnapshot.objects.filter(snapshot_date__lt=at_date)
+        .order_by('-snapshot_date')
+        .values_list('snapshot_date', flat=True)
+        .first()
+    )
+
+    balances = {}
+    ledger = StockTransaction.objects.filter(timestamp__lt=at)
+    if base_date is not None:
+        snapshots = StockSnapshot.objects.filter(snapshot_date=base_date)
+        if batch_ids is not None:
+            snapshots = snapshots.filter(batch_id__in=batch_ids)
+        balances.update(snapshots.values_list('batch_id', 'closing_qty'))
+        ledger = ledger.filter(timestamp__gte=end_of_day(base_date))
+    if batch_ids is not None:
+        ledger = ledger.filter(batch_id__in=batch_ids)
+
+    for batch_id, delta in ledger.values('batch_id').annotate(delta=Sum('quantity')).values_list('batch_id', 'delta'):
+        balances[batch_id] = balances.get(batch_id, 0) + delta
+    return balances
+
+
+def take_snapshots(day):
+    """Upsert every batch's closing balance for `day`. Returns the number of rows written."""
+    closing_time = end_of_day(day)
+    balances = stock_as_of(closing_time)
+    # Batches with no ledger activity yet still get a (zero) row so the next
+    # as-of query can start from this day.
+    existing = MedicineBatch.objects.filter(created_at__lt=closing_time).values_list('pk', flat=True)
+    rows = [
+        StockSnapshot(batch_id=batch_id, snapshot_date=day, closing_qty=balances.get(batch_id, 0))
+        for batch_id in existing.iterator(chunk_size=SNAPSHOT_CHUNK_SIZE)
+    ]
+    StockSnapshot.objects.bulk_create(
+        rows,
+        batch_size=SNAPSHOT_CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=['snapshot_date', 'batch'],
+        update_fields=['closing_qty', 'taken_at'],
+    )
+    return len(rows)
+
+
+def reconcile_stock(medicine_id=None):
+    """
+    Stock-take report: batches whose stock_qty disagrees with the ledger sum,
+    from one grouped query.
+    """
+    batches = MedicineBatch.objects.all()
+    if medicine_id:
+        batches = batches.filter(medicine_id=medicine_id)
+    batches = (
+        batches.order_by()
+        .annotate(ledger_qty=Coalesce(Sum('transactions__quantity'), Value(0)))
+        .annotate(difference=F('stock_qty') - F('ledger_qty'))
+    )
+    mismatches = list(
+        batches.exclude(difference=0)
+        .order_by('medicine__name', 'batch_number')
+        .values('batch_id', 'batch_number', 'medicine_id', 'medicine__name', 'stock_qty', 'ledger_qty', 'difference')
+    )
+    return {
+        'checked_at': timezone.now(),
+        'mismatched_batches': len(mismatches),
+        'net_difference': sum(row['difference'] for row in mismatches),
+        'batches': [
+            {
+                'batch_id': row['batch_id'],
+                'batch_number': row['batch_number'],
+                'medicine_id': row['medicine_id'],
+                'medicine_name': row['medicine__name'],
+                'stock_qty': row['stock_qty'],
+                'ledger_qty': row['ledger_qty'],
+                'difference': row['difference'],
+            }
+            for row in mismatches
+        ],
+    }
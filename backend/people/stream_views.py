@@ -0,0 +1,84 @@
+"""
+Server-Sent Events endpoint for the notification bell.
+
+GET /api/notifications/stream/?ticket=<ticket> keeps the connection open
+and relays the user's channel from people/push.py. EventSource cannot send
+an Authorization header, so the client first trades its JWT for a ticket at
+POST /api/notifications/stream_ticket/. Tickets are signed, expire after
+TICKET_SECONDS and are accepted once, so the access token never appears in
+URLs or access logs and a logged URL cannot be replayed. This is an async view:
+serve the project through his/asgi.py (uvicorn/daphne) so each open stream
+costs a coroutine, not a worker thread.
+"""
+import logging
+import secrets
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+
+from .push import HEARTBEAT_SECONDS, get_broker, notification_audience
+
+logger = logging.getLogger(__name__)
+
+# Client reconnect delay sent with the stream (milliseconds).
+RECONNECT_MS = 5000
+TICKET_SECONDS = 30
+
+_ticket_signer = signing.TimestampSigner(salt='people.notification-stream')
+
+
+def issue_ticket(user):
+    return _ticket_signer.sign_object({'user': user.pk, 'nonce': secrets.token_urlsafe(12)})
+
+
+def _user_from_ticket(ticket):
+    if not ticket:
+        return None
+    try:
+        payload = _ticket_signer.unsign_object(ticket, max_age=TICKET_SECONDS)
+    except signing.BadSignature:
+        return None
+    # First use wins; the marker lives as long as the ticket could.
+    try:
+        first_use = cache.add(f"notif_stream_ticket:{payload['nonce']}", 1, TICKET_SECONDS)
+    except Exception as e:
+        # Single use cannot be checked, so refuse; the client retries with a new ticket.
+        logger.error(f"Could not check stream ticket: {e}")
+        return None
+    if not first_use:
+        return None
+    return User.objects.filter(pk=payload['user'], is_active=True).first()
+
+
+async def _events(channel):
+    subscribed = False
+    async for data in get_broker().listen(channel, HEARTBEAT_SECONDS):
+        if not subscribed:
+            # Sent only once subscribed, so the list the client reloads on
+            # "ready" cannot miss a notification published in between.
+            subscribed = True
+            yield f"retry: {RECONNECT_MS}\nevent: ready\ndata: {{}}\n\n"
+        elif data is None:
+            yield ": keep-alive\n\n"
+        else:
+            yield f"data: {data}\n\n"
+
+
+class NotificationStreamView(View):
+    async def get(self, request):
+        user = await sync_to_async(_user_from_ticket)(request.GET.get('ticket', ''))
+        if user is None:
+            return JsonResponse({'error': 'A valid stream ticket is required'}, status=401)
+        channel = await sync_to_async(notification_audience)(user)
+        if channel is None:
+            return JsonResponse({'error': 'No notifications for this account'}, status=403)
+
+        response = StreamingHttpResponse(_events(channel), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
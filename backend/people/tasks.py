@@ -0,0 +1,85 @@
+import logging
+from datetime import date, timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from .expiry import refresh_expiry_buckets, sweep_expired
+from .inbox import archive_read
+from .outbox import dispatch_event, dispatch_pending
+from .recalls import run_recall
+from .reorder import store_suggestions
+from .report_storage import sweep_orphaned_blobs
+from .stock_ledger import take_snapshots
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def snapshot_stock_levels(day=None):
+    """Nightly: store every batch's closing balance for `day` (ISO date, default yesterday)."""
+    day = date.fromisoformat(day) if day else timezone.localdate() - timedelta(days=1)
+    count = take_snapshots(day)
+    logger.info(f"Stored {count} stock snapshots for {day}")
+    return {"date": day.isoformat(), "snapshots": count}
+
+
+@shared_task
+def sweep_expired_stock():
+    """Nightly: write off stock of lapsed batches, then rebuild the expiry-bucket summary."""
+    today = timezone.localdate()
+    try:
+        written_off = sweep_expired(today)
+    except ValueError as e:
+        logger.error(f"Expiry sweep skipped: {e}")
+        written_off = 0
+    rows = refresh_expiry_buckets(today)
+    logger.info(f"Wrote off {written_off} expired batches; {rows} expiry bucket rows for {today}")
+    return {"date": today.isoformat(), "written_off": written_off, "bucket_rows": rows}
+
+
+@shared_task
+def compute_reorder_suggestions():
+    """Nightly: recompute consumption velocity and purchase suggestions for every medicine."""
+    today = timezone.localdate()
+    count = store_suggestions(today)
+    logger.info(f"Stored reorder suggestions for {count} medicines on {today}")
+    return {"date": today.isoformat(), "medicines": count}
+
+
+@shared_task
+def run_batch_recall(recall_id):
+    """Trace a recall's affected patients, write the artifact and notify them."""
+    recall = run_recall(recall_id)
+    return {"recall_id": recall.pk, "affected_patients": recall.affected_patients}
+
+
+@shared_task
+def dispatch_notification_event(event_id):
+    """Fan one outbox event out to its recipients."""
+    return {"event_id": event_id, "notifications": dispatch_event(event_id)}
+
+
+@shared_task
+def sweep_notification_outbox():
+    """Every minute: send outbox events whose dispatch task never ran."""
+    sent = dispatch_pending()
+    if sent:
+        logger.info(f"Outbox sweeper sent {sent} notification events")
+    return {"sent": sent}
+
+
+@shared_task
+def archive_old_notifications():
+    """Nightly: move read notifications past the retention period to the archive."""
+    moved = archive_read()
+    logger.info(f"Archived {moved} read notifications")
+    return {"archived": moved}
+
+
+@shared_task
+def sweep_report_blobs():
+    """Nightly: delete report blobs that no lab, radiology or operation record references."""
+    removed = sweep_orphaned_blobs()
+    logger.info(f"Removed {removed} orphaned report blobs")
+    return {"removed": removed}
@@ -1,6 +1,66 @@
-from django.test import TestCase
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
 from django.core.exceptions import ValidationError
-from people.models import Staff
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.test import APIClient
+from people.models import (
+    Bill, BillItem, LabTest, Medicine, MedicineBatch, Notification, Order, Patient, Prescription, Staff, Visit, Vital,
+)
+
+# The default cache is the shared Redis (his/settings.py). Tests get a private
+# in-process cache, so cache.clear() cannot flush it and counters keyed by
+# reused ids cannot leak between runs.
+_local_cache = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+
+def setUpModule():
+    _local_cache.enable()
+
+
+def tearDownModule():
+    _local_cache.disable()
+
+
+def make_staff(email, name, role="DOCTOR", department="OPD", **extra):
+    if role == "DOCTOR":
+        extra.setdefault('fee', 100)
+    return Staff.objects.create(
+        user_email=email, name=name, role=role, department=department, password_hash="x", **extra,
+    )
+
+
+def make_visit(doctor, patient_name, phone, visit_type="IPD", **extra):
+    """A new patient with one visit today."""
+    patient = Patient.objects.create(name=patient_name, age=40, gender="Male", phone=phone)
+    return Visit.objects.create(patient=patient, doctor=doctor, visit_type=visit_type, visit_date=date.today(), **extra)
+
+
+def api_client(staff):
+    """APIClient logged in as `staff` (its User is created by the Staff post_save signal)."""
+    client = APIClient()
+    client.force_authenticate(User.objects.get(username=staff.user_email))
+    return client
+
+
+class TempMediaMixin:
+    """Points MEDIA_ROOT at a throwaway directory for each test."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.media_root = media.name
+
 
 class StaffDoctorFieldsTest(TestCase):
     def test_doctor_fields_creation(self):
@@ -53,3 +113,1671 @@ class StaffDoctorFieldsTest(TestCase):
         )
         with self.assertRaises(ValidationError):
             doctor.full_clean()
+
+
+
+class HotPathIndexPlanTest(TestCase):
+    """EXPLAIN the hot queries and check they are served by the intended indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_staff("idx_doc@example.com", "Dr. Index")
+        cls.nurse = make_staff("idx_nurse@example.com", "Nurse Index", role="NURSE", department="IPD")
+        cls.visit = make_visit(cls.doctor, "Index Patient", "9000000001")
+        cls.patient = cls.visit.patient
+        cls.medicine = Medicine.objects.create(name="Paracetamol")
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be seq-scanned.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"Expected {index_name} in plan:\n{plan}")
+
+    def test_visit_slot_lookup(self):
+        qs = Visit.objects.filter(doctor=self.doctor, visit_date=date.today(), slot_booked="10:00 - 10:30")
+        self.assertUsesIndex(qs, 'visit_doctor_date_slot_idx')
+
+    def test_visit_daily_inflow(self):
+        start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        qs = Visit.objects.filter(created_at__gte=start, created_at__lt=start + timedelta(days=1))
+        self.assertUsesIndex(qs, 'visit_created_at_idx')
+
+    def test_bill_revenue_window(self):
+        start = timezone.now() - timedelta(days=7)
+        qs = Bill.objects.filter(status='PAID', created_at__gte=start)
+        self.assertUsesIndex(qs, 'bill_status_created_idx')
+
+    def test_billitem_already_billed(self):
+        qs = BillItem.objects.filter(service_type='LAB_TEST', service_ref_id=1)
+        self.assertUsesIndex(qs, 'billitem_service_ref_idx')
+
+    def test_labtest_status_filter(self):
+        self.assertUsesIndex(LabTest.objects.filter(status='COMPLETED'), 'labtest_status_idx')
+
+    def test_fefo_batch_selection(self):
+        qs = MedicineBatch.objects.filter(
+            medicine=self.medicine, expiry_date__gt=date.today()
+        ).order_by('expiry_date')
+        self.assertUsesIndex(qs, 'batch_medicine_expiry_idx')
+
+    @skipUnless(connection.vendor == 'postgresql', "SQLite cannot match NOT is_read against an index column")
+    def test_unread_notifications(self):
+        qs = Notification.objects.filter(recipient=self.doctor, is_read=False).order_by('-created_at')
+        self.assertUsesIndex(qs, 'notif_recipient_read_idx')
+
+    def test_latest_vitals_for_visit(self):
+        qs = Vital.objects.filter(visit=self.visit).order_by('-recorded_at')
+        self.assertUsesIndex(qs, 'vital_visit_recorded_idx')
+
+
+class VitalTrendTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = make_staff("trend_doc@example.com", "Dr. Trend", department="IPD")
+        cls.nurse = make_staff("trend_nurse@example.com", "Nurse Trend", role="NURSE", department="IPD")
+        cls.visit = make_visit(doctor, "Trend Patient", "9000000002")
+
+        start = timezone.now() - timedelta(hours=10)
+        for minute in range(0, 600, 5):
+            vital = Vital.objects.create(
+                visit=cls.visit, nurse=cls.nurse, bp_systolic=100 + minute // 10, bp_diastolic=70,
+                pulse=80, temperature="98.6", spo2=97,
+            )
+            Vital.objects.filter(pk=vital.pk).update(recorded_at=start + timedelta(minutes=minute))
+
+    def setUp(self):
+        self.client = api_client(self.nurse)
+
+    def test_downsamples_to_requested_points(self):
+        response = self.client.get('/api/vitals/trend/', {'visit': self.visit.id, 'points': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 120)
+        self.assertEqual(len(response.data['timestamps']), 10)
+        systolic = response.data['series']['bp_systolic']
+        self.assertEqual(systolic['min'][0], 100)
+        self.assertLessEqual(systolic['min'][-1], systolic['avg'][-1])
+        self.assertLessEqual(systolic['avg'][-1], systolic['max'][-1])
+        self.assertEqual(systolic['max'][-1], 159)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/vitals/trend/', {'visit': self.visit.id, 'points': 50})
+
+    def test_requires_visit_or_patient(self):
+        response = self.client.get('/api/vitals/trend/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_params_are_rejected(self):
+        for params in (
+            {'visit': 'abc'},
+            {'patient': 'abc'},
+            {'visit': self.visit.id, 'start': '2026-13-45T10:00'},
+            {'visit': self.visit.id, 'end': 'yesterday'},
+        ):
+            self.assertEqual(self.client.get('/api/vitals/trend/', params).status_code, 400, params)
+
+
+class BulkVitalIngestTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = make_staff("bulk_doc@example.com", "Dr. Bulk", department="IPD")
+        cls.nurse = make_staff("bulk_nurse@example.com", "ICU Gateway", role="NURSE", department="IPD")
+        cls.visit = make_visit(doctor, "Bulk Patient", "9000000003")
+
+    def setUp(self):
+        self.client = api_client(self.nurse)
+
+    def reading(self, **overrides):
+        data = {
+            'visit': self.visit.id, 'bp_systolic': 120, 'bp_diastolic': 80,
+            'pulse': 72, 'temperature': 98.6, 'spo2': 98,
+        }
+        data.update(overrides)
+        return data
+
+    def test_partial_batch_reports_row_errors(self):
+        taken = timezone.now() - timedelta(minutes=30)
+        readings = [
+            self.reading(recorded_at=taken.isoformat()),
+            self.reading(spo2=140),
+            self.reading(visit=999999),
+            self.reading(pulse='fast'),
+            self.reading(),
+        ]
+        response = self.client.post('/api/vitals/bulk/', {'readings': readings}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([e['index'] for e in response.data['errors']], [1, 2, 3])
+        self.assertIn('spo2', response.data['errors'][0]['errors'])
+        self.assertEqual(Vital.objects.filter(visit=self.visit).count(), 2)
+        first = Vital.objects.get(pk=response.data['ids'][0])
+        self.assertEqual(first.recorded_at, taken)
+        self.assertEqual(first.nurse, self.nurse)
+        self.assertEqual(first.early_warning_score, 0)
+
+    def test_non_finite_values_are_row_errors(self):
+        readings = [
+            self.reading(spo2='NaN'), self.reading(pulse='Infinity'), self.reading(),
+            self.reading(recorded_at='2026-02-30T10:00:00'),
+        ]
+        response = self.client.post('/api/vitals/bulk/', {'readings': readings}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(
+            [(e['index'], list(e['errors'])) for e in response.data['errors']],
+            [(0, ['spo2']), (1, ['pulse']), (3, ['recorded_at'])],
+        )
+
+    def test_query_count_independent_of_batch_size(self):
+        from django.test.utils import CaptureQueriesContext
+        readings = [self.reading() for _ in range(250)]
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post('/api/vitals/bulk/', {'readings': readings}, format='json')
+        selects = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        # Staff, visit and chart lookups; inserts are batched (SQLite caps rows per statement).
+        self.assertEqual(len(selects), 3)
+        self.assertLessEqual(len(inserts), 3)
+        self.assertEqual(Vital.objects.count(), 250)
+
+
+class EarlyWarningScoreTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = make_staff("ews_doc@example.com", "Dr. Ews", department="IPD")
+        cls.nurse = make_staff("ews_nurse@example.com", "Nurse Ews", role="NURSE", department="IPD")
+        cls.visits = [make_visit(doctor, f"Ews Patient {i}", f"900000010{i}") for i in range(2)]
+
+    def record(self, visit, **values):
+        data = dict(bp_systolic=120, bp_diastolic=80, pulse=72, temperature="98.6", spo2=98)
+        data.update(values)
+        return Vital.objects.create(visit=visit, nurse=self.nurse, **data)
+
+    def test_scores(self):
+        from people.news2 import early_warning_score
+        self.assertEqual(early_warning_score(120, 72, 98.6, 98), 0)
+        # SpO2 91 (3) + systolic 95 (2) + pulse 115 (2) + 102.2°F = 39.0°C (1)
+        self.assertEqual(early_warning_score(95, 115, 102.2, 91), 8)
+        self.assertEqual(early_warning_score(225, 35, 94.0, 96), 3 + 3 + 3)
+
+    def test_score_stored_on_save(self):
+        vital = self.record(self.visits[0], spo2=93, pulse=100)
+        self.assertEqual(vital.early_warning_score, 2 + 1)
+
+    def test_deteriorating_feed_uses_latest_reading_per_visit(self):
+        stable, sick = self.visits
+        self.record(stable, spo2=88, bp_systolic=85)   # was bad...
+        self.record(stable)                             # ...but recovered
+        self.record(sick, spo2=90, pulse=135)
+
+        client = api_client(self.nurse)
+        with self.assertNumQueries(1):
+            response = client.get('/api/vitals/deteriorating/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['visit_id'] for row in response.data], [sick.id])
+        self.assertEqual(response.data[0]['early_warning_score'], 6)
+        self.assertEqual(client.get('/api/vitals/deteriorating/', {'ward': 'abc'}).status_code, 400)
+
+    def test_recompute_command(self):
+        from django.core.management import call_command
+        from io import StringIO
+        vital = self.record(self.visits[0], spo2=91)
+        Vital.objects.filter(pk=vital.pk).update(early_warning_score=None)
+        call_command('recompute_early_warning_scores', '--chunk-size', '1', stdout=StringIO())
+        vital.refresh_from_db()
+        self.assertEqual(vital.early_warning_score, 3)
+
+
+class PatientChartProjectionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from people.models import Allergy, ClinicalNote
+        cls.doctor = make_staff("chart_doc@example.com", "Dr. Chart")
+        cls.nurse = make_staff("chart_nurse@example.com", "Nurse Chart", role="NURSE")
+        cls.patient = Patient.objects.create(name="Chart Patient", age=52, gender="Female", phone="9000000200")
+        for days_ago in range(5):
+            visit = Visit.objects.create(
+                patient=cls.patient, doctor=cls.doctor, visit_type="IPD",
+                visit_date=date.today() - timedelta(days=days_ago), chief_complaint="Cough",
+            )
+            ClinicalNote.objects.create(visit=visit, doctor=cls.doctor, diagnosis=f"Dx {days_ago}", notes="n")
+        cls.latest_visit = Visit.objects.filter(patient=cls.patient).order_by('-visit_date').first()
+        Allergy.objects.create(patient=cls.patient, allergen="Penicillin", severity="HIGH")
+
+    def setUp(self):
+        self.client = api_client(self.doctor)
+        self.url = f'/api/doctor/patients/{self.patient.id}/'
+
+    def test_profile_is_served_from_projection(self):
+        self.client.get(self.url)  # builds the chart on first read
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['visitHistory']), 5)
+        self.assertEqual(response.data['visitHistory'][0]['diagnosis'], "Dx 0")
+        self.assertEqual(response.data['allergies'], "Penicillin (HIGH)")
+        self.assertEqual(response.data['lastVisit'], date.today().isoformat())
+
+    def test_etag_changes_when_chart_sources_change(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Vital.objects.create(
+            visit=self.latest_visit, nurse=self.nurse, bp_systolic=130, bp_diastolic=85,
+            pulse=90, temperature="99.1", spo2=95,
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['vitals']['bp'], "130/85")
+
+
+class LabWorklistTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_staff("lab_doc@example.com", "Dr. Lab")
+        for i in range(12):
+            visit = make_visit(cls.doctor, f"Lab Patient {i}", f"90000003{i:02d}", visit_type="OPD")
+            order = Order.objects.create(visit=visit, doctor=cls.doctor, order_type="LAB")
+            LabTest.objects.create(order=order, test_name="CBC", status="COMPLETED" if i % 3 == 0 else "ORDERED")
+
+    def setUp(self):
+        self.client = api_client(self.doctor)
+
+    def test_counts_and_keyset_pages(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/lab-tests/worklist/', {'page_size': 5, 'status': 'ORDERED'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['counts'], {'ORDERED': 8, 'COMPLETED': 4})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertTrue(response.data['results'][0]['patient_name'].startswith("Lab Patient"))
+
+        second = self.client.get(response.data['next'])
+        self.assertEqual(len(second.data['results']), 3)
+        self.assertIsNone(second.data['next'])
+        first_ids = {row['id'] for row in response.data['results']}
+        self.assertFalse(first_ids & {row['id'] for row in second.data['results']})
+
+
+class LabBulkUploadTest(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_staff("upload_doc@example.com", "Dr. Upload", department="LAB")
+        visit = make_visit(cls.doctor, "Upload Patient", "9000000400", visit_type="OPD")
+        order = Order.objects.create(visit=visit, doctor=cls.doctor, order_type="LAB")
+        cls.tests = [LabTest.objects.create(order=order, test_name=name) for name in ("CBC", "LFT", "KFT")]
+
+    def setUp(self):
+        super().setUp()
+        self.client = api_client(self.doctor)
+
+    def test_zip_upload_completes_tests_in_one_go(self):
+        import io
+        import json
+        import zipfile
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as bundle:
+            bundle.writestr('run42/cbc.pdf', b'%PDF-1.4 cbc')
+            bundle.writestr('run42/lft.pdf', b'%PDF-1.4 lft')
+        buffer.seek(0)
+        buffer.name = 'run42.zip'
+        manifest = [
+            {'file': 'cbc.pdf', 'lab_test_id': self.tests[0].id, 'result': 'NORMAL'},
+            {'file': 'lft.pdf', 'lab_test_id': self.tests[1].id},
+            {'file': 'kft.pdf', 'lab_test_id': self.tests[2].id},
+        ]
+        response = self.client.post(
+            '/api/lab-tests/bulk_upload/',
+            {'manifest': json.dumps(manifest), 'archive': buffer},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['completed']), [self.tests[0].id, self.tests[1].id])
+        self.assertEqual(response.data['errors'][0]['file'], 'kft.pdf')
+
+        cbc = LabTest.objects.get(pk=self.tests[0].id)
+        self.assertEqual(cbc.status, 'COMPLETED')
+        self.assertEqual(cbc.result, 'NORMAL')
+        self.assertIsNotNone(cbc.completed_at)
+        with cbc.report_file.open('rb') as f:
+            self.assertEqual(f.read(), b'%PDF-1.4 cbc')
+        self.assertEqual(LabTest.objects.get(pk=self.tests[2].id).status, 'ORDERED')
+
+    def test_malformed_manifest_entries_are_rejected(self):
+        import json
+        response = self.client.post(
+            '/api/lab-tests/bulk_upload/', {'manifest': '["cbc.pdf"]'}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('manifest entry 0', response.data['error'])
+
+        for bad_id in (['1'], {'id': 1}, 'abc', 1.5, True):
+            manifest = json.dumps([{'file': 'cbc.pdf', 'lab_test_id': bad_id}])
+            response = self.client.post('/api/lab-tests/bulk_upload/', {'manifest': manifest}, format='multipart')
+            self.assertEqual(response.status_code, 400, bad_id)
+
+    def test_repeated_lab_test_is_reported_once(self):
+        import json
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        test_id = self.tests[0].id
+        manifest = [
+            {'file': 'cbc.pdf', 'lab_test_id': test_id},
+            {'file': 'cbc2.pdf', 'lab_test_id': str(test_id)},
+        ]
+        files = [SimpleUploadedFile('cbc.pdf', b'%PDF-1.4 a'), SimpleUploadedFile('cbc2.pdf', b'%PDF-1.4 b')]
+        response = self.client.post(
+            '/api/lab-tests/bulk_upload/', {'manifest': json.dumps(manifest), 'files': files}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['completed'], [test_id])
+        self.assertEqual(
+            [(e['file'], e['error']) for e in response.data['errors']], [('cbc2.pdf', 'Lab test listed more than once')],
+        )
+        with LabTest.objects.get(pk=test_id).report_file.open('rb') as f:
+            self.assertEqual(f.read(), b'%PDF-1.4 a')
+
+
+class ReportStorageTest(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_staff("report_doc@example.com", "Dr. Report", department="LAB")
+        visit = make_visit(cls.doctor, "Report Patient", "9000000500", visit_type="OPD")
+        cls.patient = visit.patient
+        order = Order.objects.create(visit=visit, doctor=cls.doctor, order_type="LAB")
+        cls.tests = [LabTest.objects.create(order=order, test_name=name) for name in ("CBC", "LFT")]
+
+    def setUp(self):
+        super().setUp()
+        self.client = api_client(self.doctor)
+
+        from django.core.files.base import ContentFile
+        self.body = bytes(range(256)) * 1024
+        for test in self.tests:
+            test.report_file.save('scan.pdf', ContentFile(self.body), save=True)
+
+    def test_identical_uploads_share_one_blob(self):
+        import hashlib
+        import os
+        first, second = (LabTest.objects.get(pk=test.pk) for test in self.tests)
+        digest = hashlib.sha256(self.body).hexdigest()
+        self.assertEqual(first.report_file.name, f"lab_reports/{digest[:2]}/{digest}.pdf")
+        self.assertEqual(first.report_file.name, second.report_file.name)
+        stored = [name for _, _, names in os.walk(self.media_root) for name in names]
+        self.assertEqual(stored, [f"{digest}.pdf"])
+
+    def test_sweep_removes_only_old_unreferenced_blobs(self):
+        import os
+        import time
+        from django.core.files.base import ContentFile
+        from people.report_storage import sweep_orphaned_blobs
+        first = LabTest.objects.get(pk=self.tests[0].pk)
+        orphan = first.report_file.path
+        first.report_file.save('rescan.pdf', ContentFile(b'%PDF-1.4 rescan'), save=True)
+        second = LabTest.objects.get(pk=self.tests[1].pk)
+        # Neither test points at the original scan any more.
+        second.report_file.save('rescan.pdf', ContentFile(b'%PDF-1.4 other'), save=True)
+
+        self.assertEqual(sweep_orphaned_blobs(), 0)  # Still within the grace period.
+        day_ago = time.time() - 2 * 24 * 3600
+        for dirpath, _, names in os.walk(self.media_root):
+            for name in names:
+                os.utime(os.path.join(dirpath, name), (day_ago, day_ago))
+
+        self.assertEqual(sweep_orphaned_blobs(), 1)
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(first.report_file.path))
+        self.assertTrue(os.path.exists(second.report_file.path))
+
+    def test_full_download_range_and_etag(self):
+        url = f'/api/reports/lab/{self.tests[0].pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.body)}')
+        self.assertEqual(b''.join(response.streaming_content), self.body[100:200])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.body[-10:])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(self.body)}-')
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_access_requires_staff_owner_or_signed_link(self):
+        url = f'/api/reports/lab/{self.tests[0].pk}/'
+
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(url).status_code, 403)
+
+        other = Patient.objects.create(name="Other Patient", age=20, gender="Male", phone="9000000501")
+        outsider = APIClient()
+        outsider.force_authenticate(User.objects.create(username=f"p_{other.uhid}"))
+        self.assertEqual(outsider.get(url).status_code, 403)
+
+        owner = APIClient()
+        owner.force_authenticate(User.objects.create(username=f"p_{self.patient.uhid}"))
+        self.assertEqual(owner.get(url).status_code, 200)
+
+        listed = self.client.get(f'/api/lab-tests/{self.tests[0].pk}/').data['report_file']
+        self.assertIn('sig=', listed)
+        self.assertEqual(anonymous.get(listed).status_code, 200)
+        self.assertEqual(anonymous.get(f'/api/reports/lab/{self.tests[1].pk}/?' + listed.split('?')[1]).status_code, 403)
+
+        with override_settings(REPORT_SENDFILE='nginx'):
+            response = self.client.get(url)
+        self.assertTrue(response['X-Accel-Redirect'].startswith('/protected-media/lab_reports/'))
+
+
+class OTSchedulingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.surgeon = make_staff("ot_doc@example.com", "Dr. Surgeon")
+        cls.visit = make_visit(cls.surgeon, "OT Patient", "9000000600")
+
+    def setUp(self):
+        self.client = api_client(self.surgeon)
+
+    def book(self, start, room="OT-1", **extra):
+        details = {'operation_name': 'Appendectomy', 'ot_room': room, 'scheduled_time': start, **extra}
+        return self.client.post(
+            '/api/orders/', {'visit': self.visit.id, 'order_type': 'OPERATION', 'details': details}, format='json'
+        )
+
+    def test_interval_tree_matches_pairwise_overlap(self):
+        import random
+        from people.scheduling import IntervalTree
+        rng = random.Random(7)
+        intervals = []
+        for i in range(200):
+            start = rng.randint(0, 1000)
+            intervals.append((start, start + rng.randint(1, 60), i))
+        tree = IntervalTree(intervals)
+        for _ in range(50):
+            start = rng.randint(0, 1000)
+            end = start + rng.randint(1, 60)
+            expected = {i for s, e, i in intervals if s < end and e > start}
+            self.assertEqual(set(tree.overlapping(start, end)), expected)
+
+    def test_booking_uses_real_end_times(self):
+        from people.models import Operation
+        self.assertEqual(self.book('2030-01-01T09:00:00Z', duration_minutes=60).status_code, 201)
+        op = Operation.objects.get()
+        self.assertEqual(op.scheduled_end - op.scheduled_time, timedelta(hours=1))
+
+        # Back-to-back is fine; overlapping is rejected with the blocking slot.
+        self.assertEqual(self.book('2030-01-01T10:00:00Z').status_code, 201)
+        response = self.book('2030-01-01T11:30:00Z')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('10:00 to 12:00', str(response.data))
+        self.assertEqual(self.book('2030-01-01T11:30:00Z', room="OT-2").status_code, 201)
+
+        # Rescheduling an existing operation is checked too, excluding itself.
+        first = Operation.objects.order_by('scheduled_time').first()
+        response = self.client.patch(
+            f'/api/operations/{first.pk}/', {'scheduled_time': '2030-01-01T09:30:00Z'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(
+            f'/api/operations/{first.pk}/', {'scheduled_time': '2030-01-01T08:00:00Z'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        first.refresh_from_db()
+        # Moving only the start keeps the booked hour.
+        self.assertEqual(first.scheduled_end - first.scheduled_time, timedelta(hours=1))
+
+    def test_unusable_times_and_durations_are_rejected(self):
+        from people.models import Operation
+        self.assertEqual(self.book('2030-01-03T09:00:00Z', duration_minutes='long').status_code, 400)
+        self.assertEqual(self.book('2030-01-03T09:00:00Z', duration_minutes=-30).status_code, 400)
+        self.assertEqual(self.book(1893488400).status_code, 400)
+        self.assertEqual(self.book('2030-13-45T09:00:00Z').status_code, 400)
+        self.assertFalse(Operation.objects.exists())
+
+    def test_overlap_race_rolls_back_the_order(self):
+        from unittest import mock
+        from django.db import IntegrityError
+        from people.models import Operation
+        race = IntegrityError('conflicting key value violates exclusion constraint "operation_ot_room_no_overlap"')
+        with mock.patch.object(Operation.objects, 'create', side_effect=race):
+            response = self.book('2030-01-04T09:00:00Z')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_migration_postpones_legacy_overlaps(self):
+        import importlib
+        from people.models import Operation
+        migration = importlib.import_module('people.migrations.0012_operation_intervals')
+        order = Order.objects.create(visit=self.visit, doctor=self.surgeon, order_type='OPERATION')
+        def legacy(start, room='OT-1', status='SCHEDULED'):
+            return Operation.objects.create(
+                order=order, operation_name='Legacy', surgeon=self.surgeon, ot_room=room,
+                scheduled_time=start, status=status,
+            )
+        kept = legacy('2030-01-05T09:00:00Z')
+        clash = legacy('2030-01-05T10:00:00Z')
+        after = legacy('2030-01-05T11:00:00Z')
+        other_room = legacy('2030-01-05T10:00:00Z', room='OT-2')
+
+        with self.assertLogs(migration.logger, 'WARNING') as logs:
+            self.assertEqual(migration._postpone_overlaps(Operation), [clash.pk])
+        self.assertIn(f'Postponed 1 overlapping OT bookings: {clash.pk}', logs.output[0])
+        self.assertEqual(
+            dict(Operation.objects.values_list('pk', 'status')),
+            {kept.pk: 'SCHEDULED', clash.pk: 'POSTPONED', after.pk: 'SCHEDULED', other_room.pk: 'SCHEDULED'},
+        )
+
+        legacy('2030-01-05T11:30:00Z', status='IN_PROGRESS')
+        with self.assertRaisesRegex(RuntimeError, 'in-progress'):
+            migration._postpone_overlaps(Operation)
+
+    def test_board_returns_all_rooms_in_one_query(self):
+        from django.test.utils import CaptureQueriesContext
+        self.book('2030-01-02T09:00:00Z')
+        self.book('2030-01-02T13:00:00Z')
+        self.book('2030-01-02T09:00:00Z', room="OT-2")
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/operations/board/?date=2030-01-02')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'people_operation' in q['sql']]), 1)
+
+        rooms = {room['ot_room']: room['operations'] for room in response.data['rooms']}
+        self.assertEqual(len(rooms['OT-1']), 2)
+        self.assertEqual(len(rooms['OT-2']), 1)
+        self.assertEqual(rooms['OT-1'][0]['conflicts_with'], [])
+        self.assertEqual(self.client.get('/api/operations/board/?date=bad').status_code, 400)
+
+    @skipUnless(connection.vendor != 'postgresql', "The exclusion constraint rejects overlapping rows")
+    def test_board_flags_overlaps_without_the_constraint(self):
+        from people.models import Operation
+        self.book('2030-01-02T09:00:00Z')
+        self.book('2030-01-02T13:00:00Z')
+        # A double booking written around the pre-check.
+        order = Order.objects.create(visit=self.visit, doctor=self.surgeon, order_type='OPERATION')
+        legacy = Operation.objects.create(
+            order=order, operation_name='Legacy', surgeon=self.surgeon, ot_room='OT-1',
+            scheduled_time='2030-01-02T10:00:00Z',
+        )
+        rooms = {
+            room['ot_room']: room['operations']
+            for room in self.client.get('/api/operations/board/?date=2030-01-02').data['rooms']
+        }
+        self.assertEqual(len(rooms['OT-1']), 3)
+        self.assertEqual(rooms['OT-1'][0]['conflicts_with'], [legacy.pk])
+        self.assertEqual(rooms['OT-1'][2]['conflicts_with'], [])
+
+
+class OrderSetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from people.models import OrderSet
+        cls.doctor = make_staff("orderset_doc@example.com", "Dr. Panel")
+        cls.visit = make_visit(cls.doctor, "Panel Patient", "9000000700")
+        cls.panel = OrderSet.objects.create(name="Admission panel", items=[
+            {'order_type': 'LAB', 'name': 'CBC', 'price': 300},
+            {'order_type': 'LAB', 'name': 'LFT', 'price': 500},
+            {'order_type': 'LAB', 'name': 'KFT', 'price': 500},
+            {'order_type': 'LAB', 'name': 'Lipid profile', 'price': 600},
+            {'order_type': 'RADIOLOGY', 'name': 'Chest X-ray', 'price': 800},
+        ])
+
+    def setUp(self):
+        self.client = api_client(self.doctor)
+
+    def test_order_set_is_placed_in_constant_queries(self):
+        from django.test.utils import CaptureQueriesContext
+        from people.models import RadiologyTest
+        payload = {
+            'visit': self.visit.id, 'order_set': self.panel.id,
+            'items': [{'order_type': 'LAB', 'name': 'HbA1c', 'price': 400}],
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/orders/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+
+        self.assertEqual(len(response.data['orders']), 2)
+        self.assertEqual(len(response.data['lab_tests']), 5)
+        self.assertEqual(len(response.data['radiology_tests']), 1)
+        lab_order = Order.objects.get(order_type='LAB')
+        self.assertEqual(lab_order.doctor, self.doctor)
+        self.assertEqual(
+            sorted(LabTest.objects.filter(order=lab_order).values_list('test_name', flat=True)),
+            ['CBC', 'HbA1c', 'KFT', 'LFT', 'Lipid profile'],
+        )
+        self.assertEqual(RadiologyTest.objects.get(pk=response.data['radiology_tests'][0]).price, 800)
+
+    def test_invalid_items_create_nothing(self):
+        response = self.client.post('/api/orders/bulk/', {
+            'visit': self.visit.id,
+            'items': [{'order_type': 'LAB', 'name': 'CBC'}, {'order_type': 'OPERATION', 'name': 'CABG'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+        for payload in ({'visit': 'abc'}, {'visit': self.visit.id, 'order_set': 'x'}):
+            response = self.client.post('/api/orders/bulk/', payload, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error'], 'visit and order_set must be integer ids')
+
+        response = self.client.post('/api/order-sets/', {
+            'name': 'Bad set', 'items': [{'order_type': 'LAB'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/order-sets/', {
+            'name': 'Diabetes review', 'items': [{'order_type': 'lab', 'name': 'HbA1c'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['items'], [{'order_type': 'LAB', 'name': 'HbA1c', 'price': 0}])
+        self.assertEqual(response.data['created_by'], self.doctor.pk)
+
+
+class BulkTransitionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_staff("transition_doc@example.com", "Dr. Round", department="LAB")
+        visit = make_visit(cls.doctor, "Round Patient", "9000000800")
+        order = Order.objects.create(visit=visit, doctor=cls.doctor, order_type="LAB")
+        cls.tests = LabTest.objects.bulk_create([LabTest(order=order, test_name=f"T{i}") for i in range(6)])
+
+    def setUp(self):
+        self.client = api_client(self.doctor)
+
+    def test_collection_round_is_one_update_per_target(self):
+        from django.test.utils import CaptureQueriesContext
+        ids = [t.id for t in self.tests]
+        LabTest.objects.filter(pk=ids[5]).update(status='CANCELLED')
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/lab-tests/transition/', {
+                'transitions': [
+                    {'id': ids[0], 'status': 'SAMPLE_COLLECTED'},
+                    {'id': ids[1], 'status': 'SAMPLE_COLLECTED'},
+                    {'id': ids[2], 'status': 'SAMPLE_COLLECTED'},
+                    {'id': ids[3], 'status': 'IN_PROGRESS'},
+                    {'id': ids[4], 'status': 'COMPLETED'},
+                    {'id': ids[5], 'status': 'IN_PROGRESS'},
+                    {'id': 999999, 'status': 'IN_PROGRESS'},
+                ],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+
+        self.assertEqual(response.data['updated'], 4)
+        results = {r['id']: r for r in response.data['results']}
+        self.assertIn('Cannot move from ORDERED to COMPLETED', results[ids[4]]['error'])
+        self.assertIn('CANCELLED', results[ids[5]]['error'])
+        self.assertEqual(results[999999]['error'], 'Not found')
+        self.assertEqual(
+            list(LabTest.objects.filter(pk__in=ids[:3]).values_list('status', flat=True).distinct()),
+            ['SAMPLE_COLLECTED'],
+        )
+
+    def test_completion_stamps_completed_at(self):
+        ids = [t.id for t in self.tests[:2]]
+        LabTest.objects.filter(pk__in=ids).update(status='IN_PROGRESS')
+        response = self.client.post('/api/lab-tests/transition/', {'ids': ids, 'status': 'COMPLETED'}, format='json')
+        self.assertEqual(response.data['updated'], 2)
+        stamps = set(LabTest.objects.filter(pk__in=ids).values_list('completed_at', flat=True))
+        self.assertEqual(len(stamps), 1)
+        self.assertIsNotNone(stamps.pop())
+
+    def test_non_string_status_is_rejected(self):
+        ids = [self.tests[0].id]
+        for payload in ({'ids': ids, 'status': ['X']}, {'transitions': [{'id': ids[0], 'status': {'a': 1}}]}):
+            response = self.client.post('/api/lab-tests/transition/', payload, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(LabTest.objects.get(pk=ids[0]).status, 'ORDERED')
+
+    def test_lost_race_is_reported(self):
+        from unittest import mock
+        from people.transitions import bulk_transition
+        ids = [t.id for t in self.tests[:2]]
+        original_filter = LabTest.objects.filter
+
+        def racing_filter(*args, **kwargs):
+            if 'status__in' in kwargs:
+                # Another technician cancels one test between our read and update.
+                original_filter(pk=ids[1]).update(status='CANCELLED')
+            return original_filter(*args, **kwargs)
+
+        with mock.patch.object(LabTest.objects, 'filter', side_effect=racing_filter):
+            results = bulk_transition(LabTest, [(pk, 'SAMPLE_COLLECTED') for pk in ids])
+        self.assertTrue(results[0]['ok'])
+        self.assertFalse(results[1]['ok'])
+        self.assertIn('CANCELLED', results[1]['error'])
+
+
+class MedicineStockTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.pharmacist = make_staff("stock_pharm@example.com", "Pharm Stock", role="PHARMACIST", department="PHARMACY")
+        today = date.today()
+        cls.medicines = []
+        for i, (reorder, stocks) in enumerate([(10, [3, 4]), (10, [20]), (5, []), (50, [10, 30, 5])]):
+            medicine = Medicine.objects.create(name=f"Med {i}", reorder_level=reorder)
+            cls.medicines.append(medicine)
+            for j, qty in enumerate(stocks):
+                MedicineBatch.objects.create(
+                    medicine=medicine, batch_number=f"B{i}{j}", stock_qty=qty, unit_price=Decimal('2.50'),
+                    expiry_date=today + timedelta(days=[-1, 10, 90][j % 3]),
+                )
+
+    def setUp(self):
+        self.client = api_client(self.pharmacist)
+
+    def test_total_stock_sources(self):
+        self.assertEqual(self.medicines[0].total_stock, 7)
+        self.assertEqual(Medicine.objects.with_stock().get(pk=self.medicines[3].pk).stock_total, 45)
+        self.assertEqual(Medicine.objects.with_stock().get(pk=self.medicines[2].pk).total_stock, 0)
+        with self.assertNumQueries(2):
+            prefetched = Medicine.objects.prefetch_related('batches').get(pk=self.medicines[1].pk)
+            self.assertEqual(prefetched.total_stock, 20)
+
+    def test_low_stock_and_stats_are_set_based(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/medicines/low_stock/')
+        self.assertEqual(sorted(m['name'] for m in response.data), ['Med 0', 'Med 2', 'Med 3'])
+        self.assertEqual({m['name']: m['stock_status'] for m in response.data}['Med 2'], 'Out of Stock')
+
+        from people.expiry import refresh_expiry_buckets
+        refresh_expiry_buckets()
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/medicines/stats/')
+        self.assertEqual(response.data['total_medicines'], 4)
+        self.assertEqual(response.data['active_batches'], 6)
+        self.assertEqual(response.data['low_stock_count'], 3)
+        self.assertEqual(response.data['expired_count'], 3)
+        self.assertEqual(response.data['expiring_soon_count'], 2)
+        self.assertEqual(response.data['inventory_valuation'], Decimal('180.00'))
+
+
+class StockLedgerSnapshotTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from people.models import StockTransaction
+        cls.pharmacist = make_staff("ledger_pharm@example.com", "Pharm Ledger", role="PHARMACIST", department="PHARMACY")
+        medicine = Medicine.objects.create(name="Ledgerol")
+        cls.batch = MedicineBatch.objects.create(
+            medicine=medicine, batch_number="L1", stock_qty=70, unit_price=Decimal('1.00'),
+            expiry_date=date.today() + timedelta(days=365),
+        )
+        cls.drifted = MedicineBatch.objects.create(
+            medicine=medicine, batch_number="L2", stock_qty=12, unit_price=Decimal('1.00'),
+            expiry_date=date.today() + timedelta(days=365),
+        )
+        MedicineBatch.objects.filter(pk__in=[cls.batch.pk, cls.drifted.pk]).update(
+            created_at=timezone.now() - timedelta(days=10)
+        )
+
+        cls.day1 = timezone.localdate() - timedelta(days=3)
+        cls.day2 = cls.day1 + timedelta(days=1)
+        ledger = [
+            (cls.batch, 'PURCHASE', 100, cls.day1, 9),
+            (cls.batch, 'DISPENSE', -10, cls.day1, 15),
+            (cls.batch, 'DISPENSE', -5, cls.day2, 11),
+            (cls.batch, 'DISPENSE', -15, cls.day2 + timedelta(days=1), 10),
+            (cls.drifted, 'PURCHASE', 10, cls.day1, 9),
+        ]
+        for batch, kind, qty, day, hour in ledger:
+            txn = StockTransaction.objects.create(
+                batch=batch, transaction_type=kind, quantity=qty, performed_by=cls.pharmacist,
+            )
+            stamp = timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time())) + timedelta(hours=hour)
+            StockTransaction.objects.filter(pk=txn.pk).update(timestamp=stamp)
+
+    def test_as_of_uses_latest_snapshot_plus_delta(self):
+        from people.models import StockSnapshot
+        from people.stock_ledger import end_of_day, stock_as_of, take_snapshots
+
+        self.assertEqual(take_snapshots(self.day1), 2)
+        self.assertEqual(
+            dict(StockSnapshot.objects.filter(snapshot_date=self.day1).values_list('batch_id', 'closing_qty')),
+            {self.batch.pk: 90, self.drifted.pk: 10},
+        )
+
+        # Corrupt the snapshot: as-of reads must start from it rather than re-summing history.
+        StockSnapshot.objects.filter(batch=self.batch).update(closing_qty=1000)
+        self.assertEqual(stock_as_of(end_of_day(self.day2))[self.batch.pk], 995)
+        StockSnapshot.objects.filter(batch=self.batch).update(closing_qty=90)
+
+        take_snapshots(self.day2)
+        take_snapshots(self.day2)  # re-running a day upserts instead of duplicating
+        self.assertEqual(StockSnapshot.objects.filter(snapshot_date=self.day2).count(), 2)
+        with self.assertNumQueries(3):
+            balances = stock_as_of(timezone.now())
+        self.assertEqual(balances[self.batch.pk], 70)
+
+    def test_as_of_and_reconciliation_endpoints(self):
+        client = api_client(self.pharmacist)
+
+        response = client.get(f'/api/medicine-batches/as_of/?date={self.day1.isoformat()}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({b['batch_number']: b['stock_qty'] for b in response.data['batches']}, {'L1': 90, 'L2': 10})
+        self.assertEqual(client.get('/api/medicine-batches/as_of/').status_code, 400)
+        url = f'/api/medicine-batches/as_of/?date={self.day1.isoformat()}&medicine=abc'
+        self.assertEqual(client.get(url).status_code, 400)
+        self.assertEqual(client.get('/api/medicine-batches/reconciliation/?medicine=abc').status_code, 400)
+
+        with self.assertNumQueries(1):
+            report = client.get('/api/medicine-batches/reconciliation/').data
+        self.assertEqual(report['mismatched_batches'], 1)
+        self.assertEqual(report['batches'][0]['batch_number'], 'L2')
+        self.assertEqual(report['batches'][0]['ledger_qty'], 10)
+        self.assertEqual(report['batches'][0]['difference'], 2)
+
+
+def _dispensing_fixture(suffix):
+    """Pharmacist, prescription for 30 units and a medicine with stock split over batches."""
+    pharmacist = make_staff(f"fefo_pharm_{suffix}@example.com", "Pharm FEFO", role="PHARMACIST", department="PHARMACY")
+    doctor = make_staff(f"fefo_doc_{suffix}@example.com", "Dr. FEFO")
+    visit = make_visit(doctor, "FEFO Patient", f"90000009{suffix:02d}", visit_type="OPD")
+    medicine = Medicine.objects.create(name=f"Fefocillin {suffix}")
+    today = date.today()
+
+    def batch(number, qty, days, **extra):
+        return MedicineBatch.objects.create(
+            medicine=medicine, batch_number=number, stock_qty=qty, unit_price=Decimal('1.00'),
+            expiry_date=today + timedelta(days=days), **extra,
+        )
+
+    batches = {
+        'expired': batch('EXP', 50, -1),
+        'recalled': batch('REC', 50, 5, is_recalled=True),
+        'soon': batch('SOON', 12, 10),
+        'mid': batch('MID', 10, 60),
+        'late': batch('LATE', 100, 300),
+    }
+    prescription = Prescription.objects.create(visit=visit, medicine=medicine, dosage_per_day=3, duration=10)
+    return pharmacist, prescription, batches
+
+
+class FefoDispenseTest(TestCase):
+    def setUp(self):
+        self.pharmacist, self.prescription, self.batches = _dispensing_fixture(1)
+        self.client = api_client(self.pharmacist)
+
+    def stock(self):
+        return {key: MedicineBatch.objects.get(pk=b.pk).stock_qty for key, b in self.batches.items()}
+
+    def test_dispense_splits_across_batches_in_expiry_order(self):
+        from people.models import PrescriptionDispense, StockTransaction
+        url = f'/api/prescriptions/{self.prescription.pk}/dispense/'
+        response = self.client.post(url, {'quantity_dispensed': 20}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'PARTIALLY_DISPENSED')
+        self.assertEqual(self.stock(), {'expired': 50, 'recalled': 50, 'soon': 0, 'mid': 2, 'late': 100})
+        self.assertEqual(
+            sorted(StockTransaction.objects.values_list('batch__batch_number', 'quantity')),
+            [('MID', -8), ('SOON', -12)],
+        )
+
+        # The remaining 10 complete the prescription (status is computed before this dispense is recorded).
+        response = self.client.post(url, {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'DISPENSED')
+        self.assertEqual(self.stock()['late'], 92)
+        self.assertEqual(
+            PrescriptionDispense.objects.filter(prescription=self.prescription).aggregate(
+                total=Sum('quantity_dispensed'))['total'],
+            30,
+        )
+
+    def test_insufficient_or_invalid_batch_changes_nothing(self):
+        from people.models import StockTransaction
+        url = f'/api/prescriptions/{self.prescription.pk}/dispense/'
+        MedicineBatch.objects.filter(pk=self.batches['late'].pk).update(stock_qty=0)
+
+        response = self.client.post(url, {'quantity_dispensed': 30}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['available'], 22)
+
+        response = self.client.post(url, {'quantity_dispensed': 5, 'batch_id': self.batches['expired'].pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'quantity_dispensed': 31}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.assertFalse(StockTransaction.objects.exists())
+        self.assertEqual(self.stock()['soon'], 12)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentDispenseTest(TransactionTestCase):
+    """Two pharmacists dispensing against the same scarce stock must not oversell."""
+
+    def test_concurrent_dispenses_do_not_oversell(self):
+        import threading
+        from django.db import connection as default_connection
+        from people.inventory import DispenseError, dispense_prescription
+
+        pharmacist, first, batches = _dispensing_fixture(2)
+        MedicineBatch.objects.filter(pk=batches['late'].pk).update(stock_qty=18)
+        # 12 + 10 + 18 = 40 units available; two prescriptions of 30 each.
+        second = Prescription.objects.create(visit=first.visit, medicine=first.medicine, dosage_per_day=3, duration=10)
+
+        barrier = threading.Barrier(2)
+        outcomes = []
+
+        def dispense(prescription_id):
+            from django.db import connection
+            try:
+                barrier.wait()
+                dispense_prescription(prescription_id, pharmacist)
+                outcomes.append('ok')
+            except DispenseError:
+                outcomes.append('rejected')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=dispense, args=(p.pk,)) for p in (first, second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['ok', 'rejected'])
+        remaining = MedicineBatch.objects.filter(medicine=first.medicine, is_recalled=False).exclude(
+            pk=batches['expired'].pk
+        ).aggregate(total=Sum('stock_qty'))['total']
+        self.assertEqual(remaining, 10)
+        self.assertFalse(MedicineBatch.objects.filter(stock_qty__lt=0).exists())
+        default_connection.close()
+
+
+class BatchDispenseTest(TestCase):
+    def setUp(self):
+        self.pharmacist, first, self.batches = _dispensing_fixture(3)
+        self.prescriptions = [first] + [
+            Prescription.objects.create(visit=first.visit, medicine=first.medicine, dosage_per_day=1, duration=5)
+            for _ in range(3)
+        ]
+        self.client = api_client(self.pharmacist)
+
+    def test_discharge_queue_in_one_request(self):
+        from django.test.utils import CaptureQueriesContext
+        from people.models import PrescriptionDispense
+        cancelled = self.prescriptions[3]
+        Prescription.objects.filter(pk=cancelled.pk).update(status='CANCELLED')
+        items = [
+            {'prescription_id': self.prescriptions[0].pk},
+            {'prescription_id': self.prescriptions[1].pk, 'quantity': 2},
+            {'prescription_id': self.prescriptions[2].pk},
+            {'prescription_id': cancelled.pk},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/prescriptions/dispense_batch/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx.captured_queries), 13)
+
+        self.assertEqual(response.data['dispensed'], 3)
+        results = response.data['results']
+        self.assertEqual(results[0]['status'], 'DISPENSED')
+        self.assertEqual([b['batch_number'] for b in results[0]['batches']], ['SOON', 'MID', 'LATE'])
+        self.assertEqual(results[1]['status'], 'PARTIALLY_DISPENSED')
+        self.assertEqual(results[2]['batches'], [{'batch_id': self.batches['late'].pk, 'batch_number': 'LATE', 'quantity': 5}])
+        self.assertFalse(results[3]['ok'])
+
+        # 30 + 2 + 5 units: SOON (12) and MID (10) drained, LATE 100 -> 85.
+        self.assertEqual(MedicineBatch.objects.get(pk=self.batches['late'].pk).stock_qty, 85)
+        self.assertEqual(PrescriptionDispense.objects.count(), 5)
+        self.assertEqual(Prescription.objects.get(pk=self.prescriptions[1].pk).status, 'PARTIALLY_DISPENSED')
+
+    def test_stock_is_shared_across_the_batch(self):
+        MedicineBatch.objects.filter(pk=self.batches['late'].pk).update(stock_qty=0)
+        response = self.client.post('/api/prescriptions/dispense_batch/', {
+            'prescription_ids': [p.pk for p in self.prescriptions],
+        }, format='json')
+        # 22 valid units: the 30-unit prescription fails, the three 5-unit ones fit.
+        self.assertEqual([r['ok'] for r in response.data['results']], [False, True, True, True])
+        self.assertEqual(
+            MedicineBatch.objects.filter(pk__in=[self.batches['soon'].pk, self.batches['mid'].pk])
+            .aggregate(total=Sum('stock_qty'))['total'],
+            7,
+        )
+
+
+class BatchRecallTest(TempMediaMixin, TestCase):
+    def setUp(self):
+        from people.inventory import dispense_many
+        super().setUp()
+        self.pharmacist, first, self.batches = _dispensing_fixture(4)
+        other_visit = make_visit(first.visit.doctor, "Recall Other", "9000000999", visit_type="OPD")
+        second = Prescription.objects.create(visit=first.visit, medicine=first.medicine, dosage_per_day=1, duration=5)
+        third = Prescription.objects.create(visit=other_visit, medicine=first.medicine, dosage_per_day=1, duration=5)
+        # 30 units from SOON, MID and LATE; both 5-unit prescriptions from LATE.
+        dispense_many([{'prescription_id': p.pk} for p in (first, second, third)], self.pharmacist)
+        self.client = api_client(self.pharmacist)
+
+    def test_recall_flips_batches_and_notifies_each_patient_once(self):
+        import csv
+        import io
+        from django.test.utils import CaptureQueriesContext
+        from people.inventory import DispenseError, dispense_prescription
+        from people.models import BatchRecall
+        from people.recalls import run_recall
+        recalled = [self.batches['mid'].pk, self.batches['late'].pk]
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/batch-recalls/', {
+                'batch_ids': recalled, 'reason': 'Contamination',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            set(MedicineBatch.objects.filter(is_recalled=True).values_list('pk', flat=True)),
+            set(recalled) | {self.batches['recalled'].pk},
+        )
+
+        # Recalled batches are no longer offered for allocation.
+        prescription = Prescription.objects.create(
+            visit=Visit.objects.first(), medicine=self.batches['late'].medicine, dosage_per_day=1, duration=1,
+        )
+        with self.assertRaises(DispenseError):
+            dispense_prescription(prescription.pk, self.pharmacist)
+
+        with CaptureQueriesContext(connection) as ctx:
+            run_recall(response.data['id'])
+        self.assertLessEqual(len(ctx.captured_queries), 12)
+
+        recall = BatchRecall.objects.get(pk=response.data['id'])
+        self.assertEqual(recall.status, 'COMPLETED')
+        self.assertEqual(recall.affected_dispenses, 4)
+        self.assertEqual(recall.affected_patients, 2)
+        self.assertEqual(Notification.objects.filter(title='Medicine recall').count(), 2)
+
+        download = self.client.get(f'/api/batch-recalls/{recall.pk}/artifact/')
+        self.assertEqual(download.status_code, 200)
+        rows = list(csv.DictReader(io.StringIO(b''.join(download.streaming_content).decode())))
+        self.assertEqual(sorted(row['batch_number'] for row in rows), ['LATE', 'LATE', 'LATE', 'MID'])
+
+        # A redelivered task finds the recall completed and notifies nobody again.
+        run_recall(recall.pk)
+        self.assertEqual(Notification.objects.filter(title='Medicine recall').count(), 2)
+        self.assertEqual(BatchRecall.objects.get(pk=recall.pk).completed_at, recall.completed_at)
+
+    def test_unknown_batch_rejects_whole_recall(self):
+        response = self.client.post('/api/batch-recalls/', {
+            'batch_ids': [self.batches['mid'].pk, 999999], 'reason': 'Contamination',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(MedicineBatch.objects.filter(pk=self.batches['mid'].pk, is_recalled=True).exists())
+
+
+class ExpirySweepTest(TestCase):
+    def setUp(self):
+        self.admin = make_staff("expiry_admin@example.com", "Admin", role="ADMIN", department="ADMIN")
+        self.pharmacist, self.prescription, self.batches = _dispensing_fixture(5)
+
+    def test_sweep_writes_off_lapsed_stock_once(self):
+        from people.expiry import sweep_expired
+        from people.models import StockTransaction
+        self.assertEqual(sweep_expired(), 1)
+        self.assertEqual(MedicineBatch.objects.get(pk=self.batches['expired'].pk).stock_qty, 0)
+        txn = StockTransaction.objects.get(transaction_type='EXPIRED')
+        self.assertEqual((txn.batch_id, txn.quantity, txn.performed_by_id), (self.batches['expired'].pk, -50, self.admin.pk))
+        # Nothing left to write off on a second run.
+        self.assertEqual(sweep_expired(), 0)
+
+    def test_buckets_feed_pharmacy_stats(self):
+        from people.expiry import bucket_totals, refresh_expiry_buckets
+        from people.models import ExpiryBucketSummary
+        live = bucket_totals()
+        self.assertEqual(live, {'EXPIRED': 1, 'DAYS_30': 2, 'DAYS_90': 1, 'BEYOND_90': 1})
+
+        refresh_expiry_buckets()
+        self.assertEqual(ExpiryBucketSummary.objects.count(), 4)
+        self.assertEqual(ExpiryBucketSummary.objects.get(bucket='DAYS_30').stock_qty, 62)
+        self.assertEqual(bucket_totals(), live)
+
+        stats = api_client(self.pharmacist).get('/api/medicines/stats/').data
+        self.assertEqual((stats['expired_count'], stats['expiring_soon_count']), (1, 2))
+
+        # Batches added after the nightly rebuild, by hand or by GRN, are counted the same day.
+        with self.captureOnCommitCallbacks(execute=True):
+            MedicineBatch.objects.create(
+                medicine=self.batches['soon'].medicine, batch_number='NEW', stock_qty=5,
+                unit_price=Decimal('1.00'), expiry_date=date.today() + timedelta(days=20),
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api_client(self.pharmacist).post('/api/medicine-batches/grn/', {
+                'invoice_number': 'INV-EXP-1', 'supplier': 'Acme',
+                'lines': [{
+                    'medicine_name': 'Bucketol', 'batch_number': 'B1', 'quantity': 10, 'unit_price': '2.00',
+                    'expiry_date': (date.today() + timedelta(days=400)).isoformat(),
+                }],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(bucket_totals(), {'EXPIRED': 1, 'DAYS_30': 3, 'DAYS_90': 1, 'BEYOND_90': 2})
+        self.assertEqual(ExpiryBucketSummary.objects.get(bucket='DAYS_30').stock_qty, 67)
+
+    def test_batch_list_uses_one_today(self):
+        from unittest import mock
+        client = api_client(self.pharmacist)
+        with mock.patch('people.serializers.timezone.localdate', return_value=date.today()) as localdate:
+            response = client.get('/api/medicine-batches/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(localdate.call_count, 1)
+        expired = next(b for b in response.data if b['batch_number'] == 'EXP')
+        self.assertEqual((expired['is_expired'], expired['days_to_expiry'], expired['health_score']), (True, -1, 0))
+
+
+class ReorderSuggestionTest(TestCase):
+    def setUp(self):
+        from people.models import StockTransaction
+        from people.stock_ledger import end_of_day
+        self.pharmacist, prescription, batches = _dispensing_fixture(6)
+        today = date.today()
+        self.busy = prescription.medicine  # 12 + 10 + 100 usable units
+        self.idle = Medicine.objects.create(name="Idlemycin", reorder_level=10)
+        MedicineBatch.objects.create(
+            medicine=self.idle, batch_number="IDLE", stock_qty=4, unit_price=Decimal('1.00'),
+            expiry_date=today + timedelta(days=100),
+        )
+        # 10 units a day for the last 30 days, 40 a day before that.
+        for days_ago in range(1, 61):
+            txn = StockTransaction.objects.create(
+                batch=batches['late'], transaction_type='DISPENSE', quantity=-10 if days_ago <= 30 else -40,
+                performed_by=self.pharmacist,
+            )
+            StockTransaction.objects.filter(pk=txn.pk).update(
+                timestamp=end_of_day(today - timedelta(days=days_ago + 1)) + timedelta(hours=10)
+            )
+
+    def test_velocity_cover_and_suggested_quantity(self):
+        from people.reorder import compute_suggestions
+        # Stock expiring today cannot be dispensed (see inventory.py), so it does not count.
+        MedicineBatch.objects.create(
+            medicine=self.idle, batch_number="LAST-DAY", stock_qty=50, unit_price=Decimal('1.00'), expiry_date=date.today(),
+        )
+        frame = compute_suggestions()
+        busy = frame.loc[self.busy.pk]
+        self.assertEqual(busy['daily_velocity'], 10.0)
+        self.assertEqual(busy['peak_daily_velocity'], 40.0)
+        self.assertEqual(busy['usable_stock'], 122)
+        self.assertEqual(busy['days_of_cover'], 12.2)
+        # Steady demand: no safety stock, reorder at 7 days of lead time, order up to 37 days.
+        self.assertEqual(busy['reorder_point'], 70)
+        self.assertEqual(busy['suggested_qty'], 0)
+
+        idle = frame.loc[self.idle.pk]
+        self.assertEqual((idle['daily_velocity'], idle['reorder_point'], idle['suggested_qty']), (0.0, 10, 6))
+
+    def test_nightly_job_stores_and_serves_suggestions(self):
+        from people.models import ReorderSuggestion
+        from people.tasks import compute_reorder_suggestions
+        MedicineBatch.objects.filter(medicine=self.busy, batch_number='LATE').update(stock_qty=20)
+        result = compute_reorder_suggestions()
+        self.assertEqual(result['medicines'], 2)
+        compute_reorder_suggestions()  # Re-running the same day updates in place.
+        self.assertEqual(ReorderSuggestion.objects.count(), 2)
+
+        response = api_client(self.pharmacist).get('/api/medicines/reorder_suggestions/')
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results']
+        # 42 usable units cover 4.2 days; order up to 370.
+        self.assertEqual([(r['medicine_name'], r['suggested_qty']) for r in rows], [('Fefocillin 6', 328), ('Idlemycin', 6)])
+
+
+class PendingQueueTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.pharmacist, first, self.batches = _dispensing_fixture(7)
+        self.prescriptions = [first] + [
+            Prescription.objects.create(visit=first.visit, medicine=first.medicine, dosage_per_day=1, duration=2)
+            for _ in range(4)
+        ]
+        self.client = api_client(self.pharmacist)
+
+    def test_queue_rows_are_slim_and_paged(self):
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/prescriptions/pending/', {'page_size': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 3)
+        row = response.data['results'][0]
+        self.assertNotIn('medicine', row)
+        self.assertEqual(row['medicine_name'], 'Fefocillin 7')
+        # SOON + MID + LATE; expired and recalled batches are not dispensable.
+        self.assertEqual(row['available_stock'], 122)
+        # Auth, count and one page query.
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/prescriptions/pending/', {'page_size': 3})
+        self.assertEqual(cached.data, response.data)
+
+    def test_dispense_drops_out_of_cached_queue(self):
+        from people.inventory import dispense_prescription
+        self.assertEqual(self.client.get('/api/prescriptions/pending/').data['count'], 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            dispense_prescription(self.prescriptions[1].pk, self.pharmacist)
+        self.assertEqual(self.client.get('/api/prescriptions/pending/').data['count'], 4)
+
+    def test_unreachable_cache_is_bypassed(self):
+        unreachable = {'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:1/0',
+        }}
+        doctor = api_client(Staff.objects.get(user_email="fefo_doc_7@example.com"))
+        medicine_id = self.prescriptions[0].medicine_id
+        with override_settings(CACHES=unreachable), self.assertLogs('people', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = doctor.post('/api/prescriptions/', {
+                    'visit': self.prescriptions[0].visit_id, 'medicine_id': medicine_id,
+                    'dosage_per_day': 1, 'duration': 1,
+                }, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(self.client.get('/api/prescriptions/pending/').data['count'], 6)
+            self.assertEqual(self.client.get('/api/notifications/unread_count/').status_code, 200)
+            self.assertEqual(self.client.get(f'/api/medicines/{medicine_id}/substitutes/').status_code, 200)
+
+    def test_batches_on_demand(self):
+        response = self.client.get('/api/medicine-batches/', {
+            'medicine': self.prescriptions[0].medicine_id, 'available': 'true',
+        })
+        self.assertEqual([b['batch_number'] for b in response.data], ['SOON', 'MID', 'LATE'])
+        self.assertEqual(self.client.get('/api/medicine-batches/', {'medicine': 'abc'}).status_code, 400)
+
+
+class GoodsReceiptTest(TestCase):
+    def setUp(self):
+        self.pharmacist = make_staff("grn_pharm@example.com", "Pharm GRN", role="PHARMACIST", department="PHARMACY")
+        self.paracetamol = Medicine.objects.create(name="Calpol", generic_name="Paracetamol")
+        self.client = api_client(self.pharmacist)
+
+    def line(self, batch_number, **extra):
+        return {
+            'batch_number': batch_number, 'expiry_date': (date.today() + timedelta(days=365)).isoformat(),
+            'quantity': 100, 'purchase_price': '1.50', 'unit_price': '2.00', **extra,
+        }
+
+    def test_invoice_books_batches_and_ledger_in_bulk(self):
+        from people.models import StockTransaction
+        invoice = {
+            'invoice_number': 'INV-77', 'supplier': 'Acme Pharma',
+            'lines': [
+                self.line('P1', medicine_name='calpol'),
+                self.line('P2', medicine_name='PARACETAMOL'),
+                self.line('A1', medicine_name='Amoxil', generic_name='Amoxicillin', category='Antibiotic'),
+                self.line('A2', medicine_name='amoxil', quantity=40),
+            ],
+        }
+        with self.assertNumQueries(8):
+            response = self.client.post('/api/medicine-batches/grn/', invoice, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        lines = response.data['lines']
+        self.assertEqual([l['medicine_id'] for l in lines[:2]], [self.paracetamol.pk] * 2)
+        self.assertEqual(len(response.data['medicines_created']), 1)
+        amoxil = Medicine.objects.get(pk=response.data['medicines_created'][0])
+        self.assertEqual((amoxil.name, amoxil.generic_name), ('Amoxil', 'Amoxicillin'))
+        self.assertEqual(lines[3]['medicine_id'], amoxil.pk)
+
+        self.assertEqual(MedicineBatch.objects.get(pk=lines[3]['batch_id']).received_qty, 40)
+        txns = StockTransaction.objects.filter(reference_id='GRN-INV-77')
+        self.assertEqual(sorted(txns.values_list('transaction_id', flat=True)), sorted(l['transaction_id'] for l in lines))
+        self.assertEqual(txns.aggregate(total=Sum('quantity'))['total'], 340)
+
+    def test_duplicate_batch_rejects_whole_invoice(self):
+        MedicineBatch.objects.create(
+            medicine=self.paracetamol, batch_number='P1', stock_qty=5, unit_price=Decimal('2.00'),
+            expiry_date=date.today() + timedelta(days=30),
+        )
+        response = self.client.post('/api/medicine-batches/grn/', {
+            'invoice_number': 'INV-78',
+            'lines': [self.line('NEW', medicine_name='Brand new'), self.line('P1', medicine_id=self.paracetamol.pk)],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('P1', response.data['error'])
+        self.assertFalse(Medicine.objects.filter(name='Brand new').exists())
+
+        response = self.client.post('/api/medicine-batches/grn/', {
+            'invoice_number': 'INV-79', 'lines': [self.line('X', quantity=0)],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class FormularySubstitutionTest(TestCase):
+    def setUp(self):
+        pharmacist = make_staff("formulary_pharm@example.com", "Pharm F", role="PHARMACIST", department="PHARMACY")
+        today = date.today()
+        self.prescribed = Medicine.objects.create(name="Crocin", generic_name="Paracetamol", category="Analgesic")
+        self.dolo = Medicine.objects.create(name="Dolo", generic_name="  PARACETAMOL ", category="analgesic")
+        self.calpol = Medicine.objects.create(name="Calpol", generic_name="Paracetamol", category="Analgesic")
+        self.empty = Medicine.objects.create(name="Pacimol", generic_name="Paracetamol", category="Analgesic")
+        self.syrup = Medicine.objects.create(name="Calpol Syrup", generic_name="Paracetamol", category="Paediatric")
+        for medicine, qty, days in [(self.dolo, 30, 200), (self.dolo, 5, 20), (self.calpol, 40, 90), (self.syrup, 10, 50)]:
+            MedicineBatch.objects.create(
+                medicine=medicine, batch_number=f"B{qty}", stock_qty=qty, unit_price=Decimal('1.00'),
+                expiry_date=today + timedelta(days=days),
+            )
+        MedicineBatch.objects.create(
+            medicine=self.empty, batch_number="OLD", stock_qty=50, unit_price=Decimal('1.00'),
+            expiry_date=today - timedelta(days=1),
+        )
+        cache.clear()
+        self.client = api_client(pharmacist)
+
+    def test_equivalents_in_one_call(self):
+        url = f'/api/medicines/{self.prescribed.pk}/substitutes/'
+        self.client.get(url)  # Builds the index.
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['generic_name'], response.data['category']), ('paracetamol', 'analgesic'))
+        self.assertEqual(
+            [(s['name'], s['available_stock'], s['nearest_expiry']) for s in response.data['substitutes']],
+            [('Dolo', 35, date.today() + timedelta(days=20)), ('Calpol', 40, date.today() + timedelta(days=90))],
+        )
+        self.assertEqual(self.client.get('/api/medicines/999999/substitutes/').status_code, 404)
+
+    def test_index_follows_medicine_changes(self):
+        from people.formulary import formulary
+        self.assertEqual(formulary.equivalents(self.prescribed.pk), sorted([self.dolo.pk, self.calpol.pk, self.empty.pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.calpol.generic_name = "Ibuprofen"
+            self.calpol.save()
+            self.dolo.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(formulary.equivalents(self.prescribed.pk), [self.empty.pk])
+
+    def test_stale_local_copy_is_rebuilt(self):
+        import time
+        from unittest import mock
+        from people.formulary import LOCAL_COPY_SECONDS, formulary
+        formulary.equivalents(self.prescribed.pk)
+        # Changes that never bumped the version, as if made by another process.
+        [added] = Medicine.objects.bulk_create([Medicine(name="Febrex", generic_name="Paracetamol", category="Analgesic")])
+        Medicine.objects.filter(pk=self.empty.pk).update(generic_name="Ibuprofen")
+
+        # A medicine the copy does not know triggers a rebuild.
+        self.assertEqual(formulary.key_of(added.pk), (True, ('paracetamol', 'analgesic')))
+        Medicine.objects.filter(pk=self.calpol.pk).update(generic_name="Ibuprofen")
+        self.assertIn(self.calpol.pk, formulary.equivalents(self.prescribed.pk))
+        # Anything else is picked up once the copy is older than LOCAL_COPY_SECONDS.
+        later = time.monotonic() + LOCAL_COPY_SECONDS
+        with mock.patch('people.formulary.time.monotonic', return_value=later):
+            self.assertEqual(formulary.equivalents(self.prescribed.pk), sorted([self.dolo.pk, added.pk]))
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        self.pharmacist, self.first, self.batches = _dispensing_fixture(8)
+        # Usable: SOON 12, MID 10, LATE 100 -> cap LATE at 18 so 40 units exist.
+        MedicineBatch.objects.filter(pk=self.batches['late'].pk).update(stock_qty=18)
+        self.doctor = Staff.objects.get(user_email="fefo_doc_8@example.com")
+        self.client = api_client(self.doctor)
+
+    def prescribe(self, per_day, days):
+        return self.client.post('/api/prescriptions/', {
+            'visit': self.first.visit_id, 'medicine_id': self.first.medicine_id,
+            'dosage_per_day': per_day, 'duration': days,
+        }, format='json')
+
+    def reserved(self):
+        return {key: MedicineBatch.objects.get(pk=b.pk).reserved_qty for key, b in self.batches.items()}
+
+    def test_reserve_on_create_and_release_on_cancel(self):
+        from people.models import PrescriptionReservation
+        response = self.prescribe(2, 10)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['reserved_quantity'], response.data['reservation_shortfall']), (20, 0))
+        self.assertEqual(self.reserved(), {'expired': 0, 'recalled': 0, 'soon': 12, 'mid': 8, 'late': 0})
+
+        # Only 20 units are left unreserved.
+        second = self.prescribe(3, 10)
+        self.assertEqual((second.data['reserved_quantity'], second.data['reservation_shortfall']), (20, 10))
+        self.assertEqual(MedicineBatch.objects.get(pk=self.batches['late'].pk).available_qty, 0)
+
+        response = self.client.patch(f"/api/prescriptions/{response.data['prescription_id']}/", {'status': 'CANCELLED'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.reserved(), {'expired': 0, 'recalled': 0, 'soon': 0, 'mid': 2, 'late': 18})
+        self.assertEqual(PrescriptionReservation.objects.count(), 2)
+
+    def test_dispense_respects_other_reservations_and_consumes_its_own(self):
+        from people.inventory import DispenseError, dispense_prescription
+        from people.models import PrescriptionReservation
+        # The fixture prescription (30 units) predates reservations; a new one holds 20.
+        held = Prescription.objects.get(pk=self.prescribe(2, 10).data['prescription_id'])
+
+        with self.assertRaises(DispenseError) as ctx:
+            dispense_prescription(self.first.pk, self.pharmacist)
+        self.assertEqual(ctx.exception.detail['available'], 20)
+
+        dispense_prescription(held.pk, self.pharmacist, quantity=15)
+        # FEFO took SOON (12) + 3 of MID, all from its own hold; 5 units stay held on MID.
+        self.assertEqual(self.reserved(), {'expired': 0, 'recalled': 0, 'soon': 0, 'mid': 5, 'late': 0})
+        self.assertEqual(list(PrescriptionReservation.objects.values_list('batch_id', 'quantity')), [(self.batches['mid'].pk, 5)])
+
+        dispense_prescription(held.pk, self.pharmacist)
+        self.assertFalse(PrescriptionReservation.objects.exists())
+        self.assertEqual(sum(self.reserved().values()), 0)
+
+    def test_holds_follow_medicine_changes_and_close_with_the_prescription(self):
+        from people.models import PrescriptionReservation
+        other = Medicine.objects.create(name="Otherol")
+        other_batch = MedicineBatch.objects.create(
+            medicine=other, batch_number="OTH", stock_qty=50, unit_price=Decimal('1.00'),
+            expiry_date=date.today() + timedelta(days=100),
+        )
+        url = f"/api/prescriptions/{self.prescribe(2, 10).data['prescription_id']}/"
+
+        response = self.client.patch(url, {'medicine_id': other.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(self.reserved().values()), 0)
+        self.assertEqual(MedicineBatch.objects.get(pk=other_batch.pk).reserved_qty, 20)
+
+        response = self.client.patch(url, {'status': 'DISPENSED'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MedicineBatch.objects.get(pk=other_batch.pk).reserved_qty, 0)
+        self.assertFalse(PrescriptionReservation.objects.exists())
+
+        # Reopening holds the stock again.
+        response = self.client.patch(url, {'status': 'PENDING'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MedicineBatch.objects.get(pk=other_batch.pk).reserved_qty, 20)
+
+    def test_deleting_the_visit_gives_held_stock_back(self):
+        from people.models import PrescriptionReservation
+        self.prescribe(2, 10)
+        self.assertEqual(self.reserved(), {'expired': 0, 'recalled': 0, 'soon': 12, 'mid': 8, 'late': 0})
+        response = self.client.delete(f'/api/visits/{self.first.visit_id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(PrescriptionReservation.objects.exists())
+        self.assertEqual(sum(self.reserved().values()), 0)
+
+    def test_expiry_sweep_drops_holds(self):
+        from people.expiry import sweep_expired
+        from people.models import PrescriptionReservation
+        self.prescribe(2, 10)
+        MedicineBatch.objects.filter(pk=self.batches['soon'].pk).update(expiry_date=date.today() - timedelta(days=1))
+        sweep_expired(performer=self.pharmacist)
+        self.assertEqual(self.reserved()['soon'], 0)
+        self.assertEqual(list(PrescriptionReservation.objects.values_list('batch_id', flat=True)), [self.batches['mid'].pk])
+
+
+class NotificationOutboxTest(TestCase):
+    def setUp(self):
+        self.doctor = make_staff("outbox_doc@example.com", "Dr. Outbox")
+        for i in range(5):
+            make_staff(f"outbox_rec{i}@example.com", f"Reception {i}", role="RECEPTION")
+        self.visit = make_visit(self.doctor, "Outbox Patient", "9000000777", visit_type="OPD", slot_booked="10:00 - 10:30")
+        self.patient = self.visit.patient
+        self.client = api_client(self.doctor)
+
+    def test_reschedule_records_one_event_and_worker_fans_out(self):
+        from people.models import NotificationEvent
+        from people.outbox import dispatch_event
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(f'/api/visits/{self.visit.pk}/', {'slot_booked': '11:00 - 11:30'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Notification.objects.exists())
+        event = NotificationEvent.objects.get()
+        self.assertIn('11:00 - 11:30', event.staff_message)
+
+        # Savepoint, event lock, staff ids, one INSERT, event update, release.
+        with self.assertNumQueries(6):
+            self.assertEqual(dispatch_event(event.pk), 6)
+        self.assertEqual(Notification.objects.filter(recipient__role='RECEPTION', type='RESCHEDULE').count(), 5)
+        self.assertEqual(Notification.objects.filter(patient=self.patient).count(), 1)
+        # A second delivery (task retry or sweeper) sends nothing.
+        self.assertEqual(dispatch_event(event.pk), 0)
+
+    def test_sweeper_sends_events_whose_task_was_lost(self):
+        from people.models import NotificationEvent
+        from people.outbox import dispatch_pending, record_event
+        with self.captureOnCommitCallbacks():
+            event = record_event("Test", recipient_role='RECEPTION', staff_message="hello")
+        self.assertEqual(dispatch_pending(), 0)  # Still within the grace period.
+        NotificationEvent.objects.filter(pk=event.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(dispatch_pending(), 1)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertIsNotNone(NotificationEvent.objects.get(pk=event.pk).dispatched_at)
+
+
+@override_settings(NOTIFICATION_PUSH_BACKEND='memory')
+class NotificationPushTest(TestCase):
+    def setUp(self):
+        self.staff = make_staff("push_rec@example.com", "Reception Push", role="RECEPTION")
+
+    def ticket(self):
+        response = api_client(self.staff).post('/api/notifications/stream_ticket/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['ticket']
+
+    def notify(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(recipient=self.staff, title="Hello", message="Pushed", **fields)
+
+    async def test_stream_relays_new_notifications(self):
+        import asyncio
+        import json
+        from asgiref.sync import sync_to_async
+        ticket = await sync_to_async(self.ticket)()
+        response = await self.async_client.get('/api/notifications/stream/', {'ticket': ticket})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content.__aiter__()
+        self.assertIn(b'event: ready', await asyncio.wait_for(stream.__anext__(), 2))
+
+        notification = await sync_to_async(self.notify)()
+        chunk = await asyncio.wait_for(stream.__anext__(), 2)
+        payload = json.loads(chunk.decode().removeprefix('data: ').strip())
+        self.assertEqual((payload['id'], payload['message']), (notification.pk, 'Pushed'))
+        await stream.aclose()
+
+    def test_stream_ticket_is_short_lived_and_single_use(self):
+        import time
+        from unittest import mock
+        from people.stream_views import TICKET_SECONDS, _user_from_ticket
+        self.assertEqual(self.client.post('/api/notifications/stream_ticket/').status_code, 401)
+        ticket = self.ticket()
+        self.assertEqual(_user_from_ticket(ticket).username, self.staff.user_email)
+        self.assertIsNone(_user_from_ticket(ticket))
+        self.assertIsNone(_user_from_ticket(ticket[:-2] + 'xx'))
+        later = time.time() + TICKET_SECONDS + 1
+        stale = self.ticket()
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            self.assertIsNone(_user_from_ticket(stale))
+
+    async def test_stream_requires_a_valid_ticket(self):
+        from asgiref.sync import sync_to_async
+        from rest_framework_simplejwt.tokens import AccessToken
+        response = await self.async_client.get('/api/notifications/stream/', {'ticket': 'nope'})
+        self.assertEqual(response.status_code, 401)
+        # An access token in the URL is no longer accepted.
+        user = await sync_to_async(User.objects.get)(username=self.staff.user_email)
+        response = await self.async_client.get('/api/notifications/stream/', {'token': str(AccessToken.for_user(user))})
+        self.assertEqual(response.status_code, 401)
+
+    def test_bulk_paths_publish_too(self):
+        from unittest import mock
+        from people.outbox import dispatch_event, record_event
+        with self.captureOnCommitCallbacks():
+            event = record_event("Fan out", recipient_role='RECEPTION', staff_message="hi")
+        with mock.patch('people.push.MemoryBroker.publish_many') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                dispatch_event(event.pk)
+        [(messages,), _] = publish.call_args
+        self.assertEqual([channel for channel, _ in messages], [f"notifications:staff:{self.staff.pk}"])
+
+
+@override_settings(NOTIFICATION_PUSH_BACKEND='memory')
+class NotificationInboxTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = make_staff("inbox_rec@example.com", "Reception Inbox", role="RECEPTION")
+        self.client = api_client(self.staff)
+
+    def notify(self, title="Hello", **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(recipient=self.staff, title=title, message="m", **fields)
+
+    def unread(self):
+        return self.client.get('/api/notifications/unread_count/').data['unread']
+
+    def test_unread_count_is_served_from_the_counter(self):
+        for i in range(3):
+            self.notify(f"n{i}")
+        self.notify("seen", is_read=True)
+        self.assertEqual(self.unread(), 3)
+
+        self.notify("new")
+        with self.assertNumQueries(1):  # Resolving the user's audience only
+            self.assertEqual(self.unread(), 4)
+
+    def test_mark_read_keeps_the_counter_in_step(self):
+        first, second, _ = [self.notify(f"n{i}") for i in range(3)]
+        self.assertEqual(self.unread(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/notifications/{first.pk}/mark_read/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/notifications/{first.pk}/mark_read/')
+        self.assertEqual(self.unread(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/notifications/mark_all_read/')
+        self.assertEqual(response.data['updated'], 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.unread(), 0)
+
+    def test_list_is_paged_newest_first(self):
+        notifications = [self.notify(f"n{i}") for i in range(25)]
+        response = self.client.get('/api/notifications/')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(
+            [row['id'] for row in response.data['results']],
+            [n.pk for n in reversed(notifications)][:20],
+        )
+
+    def test_archive_moves_old_read_notifications_in_chunks(self):
+        from people.inbox import archive_read
+        from people.models import ArchivedNotification
+        old_read = [self.notify(f"old{i}", is_read=True) for i in range(5)]
+        old_unread = self.notify("old unread")
+        recent_read = self.notify("recent", is_read=True)
+        Notification.objects.exclude(pk=recent_read.pk).update(created_at=timezone.now() - timedelta(days=120))
+
+        with override_settings(NOTIFICATION_RETENTION_DAYS=90):
+            self.assertEqual(archive_read(chunk_size=2), 5)
+        self.assertEqual(
+            set(Notification.objects.values_list('pk', flat=True)), {old_unread.pk, recent_read.pk},
+        )
+        self.assertEqual(
+            sorted(ArchivedNotification.objects.values_list('notification_id', flat=True)),
+            [n.pk for n in old_read],
+        )
+        self.assertEqual(archive_read(90), 0)
@@ -0,0 +1,88 @@
+"""
+Bulk status transitions for orders, lab/radiology tests and operations.
+
+Requests are checked against the model's ALLOWED_TRANSITIONS using one read
+of the current statuses, then applied with a single UPDATE per target
+status. Each UPDATE is guarded with status__in on the allowed source states,
+so a row changed concurrently after the read is reported instead of being
+overwritten.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+MAX_BULK_TRANSITIONS = 1000
+
+
+def parse_transitions(data):
+    """
+    Accepts {"ids": [...], "status": "X"} or {"transitions": [{"id", "status"}, ...]}.
+    Returns a list of (id, target) pairs.
+    """
+    if data.get('transitions') is not None:
+        pairs = data['transitions']
+        if not isinstance(pairs, list) or not all(isinstance(p, dict) for p in pairs):
+            raise ValueError('transitions must be a list of {"id", "status"} objects')
+        pairs = [(p.get('id'), p.get('status')) for p in pairs]
+    else:
+        ids = data.get('ids')
+        if not isinstance(ids, list):
+            raise ValueError('Provide ids and status, or transitions')
+        pairs = [(pk, data.get('status')) for pk in ids]
+    if not all(isinstance(target, str) for _, target in pairs):
+        raise ValueError('status must be a string')
+    return pairs
+
+
+def bulk_transition(model, pairs):
+    """
+    Apply (id, target_status) pairs to `model`. Returns one result per id, in request order:
+    {"id", "ok", "from", "to"} or {"id", "ok": False, "error"}.
+    """
+    valid_statuses = {choice for choice, _ in model.STATUS_CHOICES}
+    allowed = model.ALLOWED_TRANSITIONS
+
+    keys = [pk for pk, _ in pairs if str(pk).isdigit()]
+    current = dict(model.objects.filter(pk__in=keys).values_list('pk', 'status'))
+    current = {str(pk): status for pk, status in current.items()}
+
+    results = {}
+    by_target = {}
+    for pk, target in pairs:
+        key = str(pk)
+        if key in results:
+            # First occurrence wins; duplicates get no separate result.
+            continue
+        if target not in valid_statuses:
+            results[key] = {'id': pk, 'ok': False, 'error': f'Unknown status {target}'}
+        elif key not in current:
+            results[key] = {'id': pk, 'ok': False, 'error': 'Not found'}
+        elif target not in allowed.get(current[key], ()):
+            results[key] = {'id': pk, 'ok': False, 'error': f'Cannot move from {current[key]} to {target}'}
+        else:
+            results[key] = {'id': pk, 'ok': True, 'from': current[key], 'to': target}
+            by_target.setdefault(target, []).append(int(key))
+
+    now = timezone.now()
+    with transaction.atomic():
+        for target, ids in by_target.items():
+            sources = [state for state, targets in allowed.items() if target in targets]
+            stamp_field = model.TRANSITION_TIMESTAMPS.get(target)
+            changes = {'status': target}
+            if stamp_field:
+                changes[stamp_field] = now
+            updated = model.objects.filter(pk__in=ids, status__in=sources).update(**changes)
+            if updated != len(ids):
+                _mark_lost_races(model, ids, target, stamp_field, now, results)
+
+    return list(results.values())
+
+
+def _mark_lost_races(model, ids, target, stamp_field, now, results):
+    fields = ['pk', 'status'] + ([stamp_field] if stamp_field else [])
+    for row in model.objects.filter(pk__in=ids).values(*fields):
+        applied = row['status'] == target and (stamp_field is None or row[stamp_field] == now)
+        if not applied:
+            results[str(row['pk'])] = {
+                'id': row['pk'], 'ok': False,
+                'error': f"Status changed to {row['status']} by another request",
+            }
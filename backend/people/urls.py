@@ -7,9 +7,11 @@ from .views import (
     MedicineViewSet, MedicineBatchViewSet, StockTransactionViewSet, PrescriptionViewSet, 
     PrescriptionDispenseViewSet, OperationViewSet, DoctorPatientProfileView, PatientAuthView,
     PrescriptionDispenseViewSet, OperationViewSet, DoctorPatientProfileView, PatientAuthView,
-    AdminDashboardStatsView, AutoBookVisitView, ExportPatientEHRView, NotificationViewSet
+    AdminDashboardStatsView, AutoBookVisitView, ExportPatientEHRView, NotificationViewSet, OrderSetViewSet, BatchRecallViewSet
 )
 from .search_views import global_search
+from .report_views import ReportFileView
+from .stream_views import NotificationStreamView
 
 router = DefaultRouter()
 router.register('patients', PatientViewSet)
@@ -22,11 +24,13 @@ router.register('beds', BedViewSet)
 router.register('vitals', VitalViewSet)
 router.register('clinical-notes', ClinicalNoteViewSet)
 router.register('orders', OrderViewSet)
+router.register('order-sets', OrderSetViewSet)
 router.register('lab-tests', LabTestViewSet)
 router.register('radiology-tests', RadiologyTestViewSet)
 router.register('medicines', MedicineViewSet)
 router.register('medicine-batches', MedicineBatchViewSet)
 router.register('stock-transactions', StockTransactionViewSet)
+router.register('batch-recalls', BatchRecallViewSet)
 router.register('prescriptions', PrescriptionViewSet)
 router.register('prescription-dispenses', PrescriptionDispenseViewSet)
 router.register('operations', OperationViewSet)
@@ -39,10 +43,12 @@ from .auth_views import AdminResetPasswordView
 
 urlpatterns = [
     path('search/', global_search, name='global-search'),
+    path('notifications/stream/', NotificationStreamView.as_view(), name='notification-stream'),
     path('patients/<int:pk>/export-ehr/', ExportPatientEHRView.as_view(), name='export-patient-ehr'),
     path('doctor/patients/<int:pk>/', DoctorPatientProfileView.as_view(), name='doctor-patient-profile'),
     path('admin-dashboard/stats/', AdminDashboardStatsView.as_view(), name='admin-dashboard-stats'),
     path('admin-reset-password/', AdminResetPasswordView.as_view(), name='admin-reset-password'),
     path('patient-auth/<str:action>/', PatientAuthView.as_view(), name='patient-auth'),
     path('visits/auto-book/', AutoBookVisitView.as_view(), name='auto-book-visit'),
+    path('reports/<str:kind>/<int:pk>/', ReportFileView.as_view(), name='report-file'),
 ] + router.urls
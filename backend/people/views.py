@@ -4,21 +4,44 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.views import APIView
 from rest_framework import permissions
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.parsers import MultiPartParser, FormParser
 from django.utils import timezone
-from django.db.models import Sum, Count
+from django.db import transaction
+from django.db.models import Sum, Count, Exists, OuterRef, Subquery, F, DecimalField
+from django.db.models.functions import Coalesce
 from decimal import Decimal
 from django.core.mail import send_mail, EmailMessage
 from django.core.cache import cache
 from django.conf import settings
 import random
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Allergy, Bill, BillItem, InsuranceClaim, Patient, Staff, Visit, Admission, Bed, Vital, ClinicalNote, Order, LabTest, RadiologyTest, Medicine, MedicineBatch, StockTransaction, Prescription, PrescriptionDispense, Operation, Notification
-from .serializers import AllergySerializer, BillSerializer, BillItemSerializer, InsuranceClaimSerializer, PatientSerializer, StaffSerializer, StaffRegistrationSerializer, VisitSerializer, AdmissionSerializer, BedSerializer, VitalSerializer, ClinicalNoteSerializer,OrderSerializer, LabTestSerializer, RadiologyTestSerializer, MedicineSerializer, MedicineBatchSerializer, StockTransactionSerializer, PrescriptionSerializer, PrescriptionDispenseSerializer, OperationSerializer, CreateOrderSerializer, NotificationSerializer
+from .models import Allergy, Bill, BillItem, InsuranceClaim, Patient, Staff, Visit, Admission, Bed, Vital, ClinicalNote, Order, LabTest, RadiologyTest, Medicine, MedicineBatch, StockTransaction, Prescription, PrescriptionDispense, Operation, Notification, PatientChart, OrderSet, BatchRecall, ReorderSuggestion
+from .serializers import AllergySerializer, BillSerializer, BillItemSerializer, InsuranceClaimSerializer, PatientSerializer, StaffSerializer, StaffRegistrationSerializer, VisitSerializer, AdmissionSerializer, BedSerializer, VitalSerializer, ClinicalNoteSerializer,OrderSerializer, LabTestSerializer, RadiologyTestSerializer, MedicineSerializer, MedicineBatchSerializer, StockTransactionSerializer, PrescriptionSerializer, PrescriptionDispenseSerializer, OperationSerializer, CreateOrderSerializer, NotificationSerializer, OrderSetSerializer, BatchRecallSerializer, ReorderSuggestionSerializer, PendingPrescriptionSerializer, GoodsReceiptSerializer
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer
+from django.utils.dateparse import parse_date, parse_datetime
+from .vitals import VITAL_SERIES, downsample_vitals, ingest_readings
+from .news2 import URGENT_RESPONSE_THRESHOLD
+from .chart import build_chart
+from .lab_results import apply_lab_results, collect_files, parse_manifest
+from .scheduling import ot_board
+from .order_sets import clean_items, place_order_set
+from .transitions import MAX_BULK_TRANSITIONS, bulk_transition, parse_transitions
+from .stock_ledger import end_of_day, reconcile_stock, stock_as_of
+from .inventory import MAX_BATCH_DISPENSE, DispenseError, dispense_many, dispense_prescription
+from .expiry import bucket_totals
+from .grn import receive_goods
+from .formulary import substitutes as find_substitutes
+from .reservations import reserve_stock, sync_reservation
+from .outbox import record_event
+from .inbox import audience_for, notifications_read, reset_unread, unread_count
+from .stream_views import TICKET_SECONDS, issue_ticket
+from .pharmacy_queue import cache_page, cached_page, pending_queue, queue_cache_key
+import zipfile
 
 class PatientAuthView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -101,11 +124,22 @@ class PatientAuthView(APIView):
         
         return Response({'error': 'Invalid action'}, status=400)
 
+def created_on(day):
+    """
+    Filter kwargs matching rows created on a calendar day.
+    A half-open created_at range (instead of created_at__date) keeps the
+    created_at indexes usable.
+    """
+    start = timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time()))
+    return {'created_at__gte': start, 'created_at__lt': start + timezone.timedelta(days=1)}
+
+
 class AdminDashboardStatsView(APIView):
     # permission_classes = [permissions.IsAdminUser] # Uncomment if needed
     
     def get(self, request):
-        today = timezone.now().date()
+        today = timezone.localdate()
+        created_today = created_on(today)
         
         # 1. Revenue Metrics
         # Total Revenue (All time PAID bills)
@@ -124,7 +158,7 @@ class AdminDashboardStatsView(APIView):
         # For better accuracy, we'd need a PaymentTransaction model. 
         # Let's use Bill.created_at for bills that are PAID and created today as a simple proxy for "New Revenue Today".
         # OR: All bills with status='PAID' created today.
-        collected_today = Bill.objects.filter(status='PAID', created_at__date=today).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
+        collected_today = Bill.objects.filter(status='PAID', **created_today).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
         
         # Procedure Charges (Operation + Lab + Radiology items in PAID bills)
         # This is expensive to aggregate via BillItem join on large datasets, keep it simple for now. 
@@ -144,7 +178,7 @@ class AdminDashboardStatsView(APIView):
         # Total Patients here represents Total Footfall/Visits to match the breakdown sum
         total_patients = opd_patients + ipd_patients + emergency_patients
         
-        daily_inflow = Visit.objects.filter(created_at__date=today).count()
+        daily_inflow = Visit.objects.filter(**created_today).count()
         
         # 3. Bed Metrics
         total_beds = Bed.objects.count()
@@ -192,10 +226,11 @@ class AdminDashboardStatsView(APIView):
         for i in range(6, -1, -1):
             date_obj = today - timezone.timedelta(days=i)
             day_str = date_obj.strftime('%a')
+            created_that_day = created_on(date_obj)
             
             # Revenue
-            opd_rev = Bill.objects.filter(status='PAID', visit__visit_type='OPD', created_at__date=date_obj).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-            ipd_rev = Bill.objects.filter(status='PAID', visit__visit_type='IPD', created_at__date=date_obj).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
+            opd_rev = Bill.objects.filter(status='PAID', visit__visit_type='OPD', **created_that_day).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
+            ipd_rev = Bill.objects.filter(status='PAID', visit__visit_type='IPD', **created_that_day).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
             
             revenue_trend.append({
                 'name': day_str,
@@ -204,7 +239,7 @@ class AdminDashboardStatsView(APIView):
             })
             
             # Inflow
-            inflow = Visit.objects.filter(created_at__date=date_obj).count()
+            inflow = Visit.objects.filter(**created_that_day).count()
             patient_inflow_trend.append({
                 'name': day_str,
                 'patients': inflow
@@ -357,37 +392,22 @@ class VisitViewSet(ModelViewSet):
 
     def perform_update(self, serializer):
         # Notify if rescheduling
-        instance = self.get_object()
-        old_date = instance.visit_date
-        old_slot = instance.slot_booked
-        
-        # Save updates
+        old_date = serializer.instance.visit_date
+        old_slot = serializer.instance.slot_booked
+
         visit = serializer.save()
-        
-        # Check changes
         new_date = visit.visit_date
         new_slot = visit.slot_booked
-        
+
         if old_date != new_date or old_slot != new_slot:
-            # Create Notification for Reception
-            msg = f"Doctor {visit.doctor.name} rescheduled appointment for {visit.patient.name} from {old_date} {old_slot} to {new_date} {new_slot}."
-            
-            # Find all receptionists
-            receptionists = Staff.objects.filter(role__iexact='RECEPTION')
-            for r in receptionists:
-                Notification.objects.create(
-                    recipient=r,
-                    title="Appointment Rescheduled",
-                    message=msg,
-                    type='RESCHEDULE'
-                )
-            
-            # Also notify Patient (if linked)
-            Notification.objects.create(
-                patient=visit.patient,
+            # One outbox event; a worker fans it out to reception and the patient.
+            record_event(
                 title="Appointment Rescheduled",
-                message=f"Your appointment with Dr. {visit.doctor.name} has been rescheduled to {new_date} at {new_slot}.",
-                type='RESCHEDULE'
+                type='RESCHEDULE',
+                recipient_role='RECEPTION',
+                staff_message=f"Doctor {visit.doctor.name} rescheduled appointment for {visit.patient.name} from {old_date} {old_slot} to {new_date} {new_slot}.",
+                patient=visit.patient,
+                patient_message=f"Your appointment with Dr. {visit.doctor.name} has been rescheduled to {new_date} at {new_slot}.",
             )
 
 class AdmissionViewSet(ModelViewSet):
@@ -425,6 +445,112 @@ class VitalViewSet(ModelViewSet):
         except Staff.DoesNotExist:
              raise serializers.ValidationError({"nurse": "User is not a staff member"})
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Batch ingestion for bedside monitor gateways.
+        Accepts {"readings": [{visit, bp_systolic, bp_diastolic, pulse, temperature, spo2, recorded_at?}, ...]}
+        and reports per-row errors without failing the batch.
+        """
+        readings = request.data.get('readings') if isinstance(request.data, dict) else request.data
+        if not isinstance(readings, list):
+            return Response({'error': 'readings must be a list'}, status=400)
+
+        try:
+            recorder = Staff.objects.get(user_email=request.user.username)
+        except Staff.DoesNotExist:
+            return Response({'error': 'User is not a staff member'}, status=403)
+
+        result = ingest_readings(readings, recorder)
+        result['created'] = len(result['ids'])
+        status_code = 201 if result['created'] or not readings else 400
+        return Response(result, status=status_code)
+
+    @action(detail=False, methods=['get'])
+    def deteriorating(self, request):
+        """
+        Ward feed of active visits whose latest vitals score at or above min_score
+        (default: NEWS2 urgent-response threshold), highest score first.
+        Query params: ward, min_score, hours (look-back window, default 24).
+        """
+        try:
+            min_score = int(request.query_params.get('min_score', URGENT_RESPONSE_THRESHOLD))
+            hours = int(request.query_params.get('hours', 24))
+            ward = int(request.query_params['ward']) if request.query_params.get('ward') else None
+        except ValueError:
+            return Response({'error': 'ward, min_score and hours must be integers'}, status=400)
+
+        latest_for_visit = Vital.objects.filter(visit=OuterRef('visit')).order_by('-recorded_at').values('pk')[:1]
+        queryset = Vital.objects.filter(
+            early_warning_score__gte=min_score,
+            recorded_at__gte=timezone.now() - timezone.timedelta(hours=hours),
+            visit__status='ACTIVE',
+            pk=Subquery(latest_for_visit),
+        )
+        if ward is not None:
+            queryset = queryset.filter(Exists(Admission.objects.filter(
+                visit=OuterRef('visit'), discharge_date__isnull=True, bed__ward=ward
+            )))
+
+        queryset = queryset.select_related('visit__patient').order_by('-early_warning_score', '-recorded_at')
+        return Response([
+            {
+                'visit_id': v.visit_id,
+                'patient_id': v.visit.patient_id,
+                'patient_name': v.visit.patient.name,
+                'uhid': v.visit.patient.uhid,
+                'early_warning_score': v.early_warning_score,
+                'recorded_at': v.recorded_at,
+                'bp': f"{v.bp_systolic}/{v.bp_diastolic}",
+                'pulse': v.pulse,
+                'temperature': v.temperature,
+                'spo2': v.spo2,
+            }
+            for v in queryset
+        ])
+
+    @action(detail=False, methods=['get'])
+    def trend(self, request):
+        """
+        Columnar, downsampled vitals for charting.
+        Query params: visit or patient (one required), points (default 500),
+        optional start / end ISO datetimes bounding recorded_at.
+        """
+        visit_id = request.query_params.get('visit')
+        patient_id = request.query_params.get('patient')
+        if not visit_id and not patient_id:
+            return Response({'error': 'visit or patient is required'}, status=400)
+
+        try:
+            points = int(request.query_params.get('points', 500))
+            visit_id = int(visit_id) if visit_id else None
+            patient_id = int(patient_id) if patient_id else None
+        except ValueError:
+            return Response({'error': 'visit, patient and points must be integers'}, status=400)
+        points = max(1, min(points, 5000))
+
+        queryset = Vital.objects.all()
+        if visit_id:
+            queryset = queryset.filter(visit_id=visit_id)
+        if patient_id:
+            queryset = queryset.filter(visit__patient_id=patient_id)
+
+        for param, lookup in (('start', 'recorded_at__gte'), ('end', 'recorded_at__lte')):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    parsed = parse_datetime(value)
+                except ValueError:  # Well-formed but impossible, e.g. month 13.
+                    parsed = None
+                if parsed is None:
+                    return Response({'error': f'{param} must be an ISO datetime'}, status=400)
+                queryset = queryset.filter(**{lookup: parsed})
+
+        rows = list(queryset.order_by('recorded_at').values_list('recorded_at', *VITAL_SERIES))
+        data = downsample_vitals(rows, points)
+        data['count'] = len(rows)
+        return Response(data)
+
 class ClinicalNoteViewSet(ModelViewSet):
     queryset = ClinicalNote.objects.all()
     serializer_class = ClinicalNoteSerializer
@@ -457,7 +583,33 @@ class ClinicalNoteViewSet(ModelViewSet):
              # Fallback or error? For now allow but won't have created_by
              serializer.save()
 
-class OrderViewSet(ModelViewSet):
+class BulkTransitionMixin:
+    """
+    Adds POST <list>/transition/ for moving many rows between statuses at once.
+    Body: {"ids": [...], "status": "X"} or {"transitions": [{"id": 1, "status": "X"}, ...]}
+    Allowed moves come from the model's ALLOWED_TRANSITIONS.
+    """
+
+    @action(detail=False, methods=['post'])
+    def transition(self, request):
+        try:
+            pairs = parse_transitions(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=http_status.HTTP_400_BAD_REQUEST)
+        if not pairs:
+            return Response({'error': 'Nothing to transition'}, status=http_status.HTTP_400_BAD_REQUEST)
+        if len(pairs) > MAX_BULK_TRANSITIONS:
+            return Response({'error': f'At most {MAX_BULK_TRANSITIONS} rows per request'}, status=http_status.HTTP_400_BAD_REQUEST)
+
+        results = bulk_transition(self.get_queryset().model, pairs)
+        return Response({
+            'updated': sum(1 for r in results if r['ok']),
+            'failed': sum(1 for r in results if not r['ok']),
+            'results': results,
+        })
+
+
+class OrderViewSet(BulkTransitionMixin, ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
 
@@ -488,66 +640,287 @@ class OrderViewSet(ModelViewSet):
         except Staff.DoesNotExist:
             raise serializers.ValidationError({"doctor": "User is not a staff member"})
 
-class LabTestViewSet(ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Place many lab/radiology tests at once.
+        Body: {"visit": id, "order_set": id (optional), "items": [...] (optional)}
+        Items from the order set and ad-hoc items are combined.
+        """
+        try:
+            visit_id = int(request.data.get('visit'))
+            order_set_id = int(request.data['order_set']) if request.data.get('order_set') else None
+        except (TypeError, ValueError):
+            return Response({'error': 'visit and order_set must be integer ids'}, status=http_status.HTTP_400_BAD_REQUEST)
+
+        visit = Visit.objects.filter(pk=visit_id).first()
+        if visit is None:
+            return Response({'error': 'Valid visit is required'}, status=http_status.HTTP_400_BAD_REQUEST)
+
+        doctor = Staff.objects.filter(user_email=request.user.username).first()
+        if doctor is None:
+            return Response({'error': 'User is not a staff member'}, status=http_status.HTTP_403_FORBIDDEN)
+
+        items = []
+        if order_set_id is not None:
+            order_set = OrderSet.objects.filter(pk=order_set_id, is_active=True).first()
+            if order_set is None:
+                return Response({'error': 'Order set not found'}, status=http_status.HTTP_404_NOT_FOUND)
+            items.extend(order_set.items)
+        items.extend(request.data.get('items') or [])
+
+        items, errors = clean_items(items)
+        if errors:
+            return Response({'error': errors}, status=http_status.HTTP_400_BAD_REQUEST)
+
+        return Response(place_order_set(visit, doctor, items), status=http_status.HTTP_201_CREATED)
+
+
+class OrderSetViewSet(ModelViewSet):
+    queryset = OrderSet.objects.all()
+    serializer_class = OrderSetSerializer
+
+    def get_queryset(self):
+        queryset = OrderSet.objects.select_related('created_by').order_by('name')
+        if self.request.query_params.get('active') == 'true':
+            queryset = queryset.filter(is_active=True)
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=Staff.objects.filter(user_email=self.request.user.username).first())
+
+class WorklistPagination(CursorPagination):
+    """Keyset paging for worklists: stable under inserts, no COUNT(*) per page."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = '-id'
+
+
+class WorklistMixin:
+    """
+    Adds GET <list>/worklist/: keyset-paged rows with the full select_related
+    chain plus per-status counts from one grouped aggregate.
+    Subclasses implement get_worklist_queryset() without the status filter.
+    """
+    worklist_related = ('order__visit__patient', 'order__doctor')
+
+    def get_queryset(self):
+        queryset = self.get_worklist_queryset().select_related(*self.worklist_related)
+        status = self.request.query_params.get('status')
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def worklist(self, request):
+        counts = dict(
+            self.get_worklist_queryset().order_by().values_list('status').annotate(total=Count('id'))
+        )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        paginator = WorklistPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+
+        response = paginator.get_paginated_response(serializer.data)
+        response.data['counts'] = counts
+        return response
+
+
+class LabTestViewSet(BulkTransitionMixin, WorklistMixin, ModelViewSet):
     queryset = LabTest.objects.all()
     serializer_class = LabTestSerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ['test_name', 'status']
 
-    def get_queryset(self):
+    def get_worklist_queryset(self):
         queryset = LabTest.objects.all()
         patient_id = self.request.query_params.get('patient')
-        status = self.request.query_params.get('status')
         if patient_id:
             queryset = queryset.filter(order__visit__patient_id=patient_id)
-        if status:
-            queryset = queryset.filter(status=status)
         return queryset
 
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser])
+    def bulk_upload(self, request):
+        """
+        Upload a whole analyzer run at once.
+        Multipart fields: manifest (JSON list of {file, lab_test_id, result?} or
+        {file: lab_test_id}), archive (ZIP) and/or files (repeated), summarize (optional bool).
+        """
+        try:
+            entries = parse_manifest(request.data.get('manifest', ''))
+        except ValueError as e:
+            return Response({'error': f'Invalid manifest: {e}'}, status=400)
+
+        try:
+            files = collect_files(request.FILES.get('archive'), request.FILES.getlist('files'))
+        except zipfile.BadZipFile:
+            return Response({'error': 'archive is not a valid ZIP file'}, status=400)
+        if not files:
+            return Response({'error': 'Upload an archive or one or more files'}, status=400)
+
+        summarize = str(request.data.get('summarize', '')).lower() in ('1', 'true', 'yes')
+        result = apply_lab_results(entries, files, summarize=summarize, user_id=request.user.id)
+        return Response(result, status=200 if result['completed'] else 400)
 
-class RadiologyTestViewSet(ModelViewSet):
+
+class RadiologyTestViewSet(BulkTransitionMixin, WorklistMixin, ModelViewSet):
     queryset = RadiologyTest.objects.all()
     serializer_class = RadiologyTestSerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ['scan_type', 'status']
 
-    def get_queryset(self):
+    def get_worklist_queryset(self):
         queryset = RadiologyTest.objects.all()
         patient_id = self.request.query_params.get('patient')
-        status = self.request.query_params.get('status')
         if patient_id:
             queryset = queryset.filter(order__visit__patient_id=patient_id)
-        if status:
-            queryset = queryset.filter(status=status)
         return queryset
 
 class MedicineBatchViewSet(ModelViewSet):
     queryset = MedicineBatch.objects.all()
     serializer_class = MedicineBatchSerializer
 
+    def get_queryset(self):
+        from rest_framework.exceptions import ValidationError
+
+        queryset = MedicineBatch.objects.all()
+        medicine_id = self.request.query_params.get('medicine')
+        if medicine_id is not None:
+            try:
+                queryset = queryset.filter(medicine_id=int(medicine_id))
+            except ValueError:
+                raise ValidationError({'medicine': 'A medicine id must be an integer.'})
+        if self.request.query_params.get('available', '').lower() in ('1', 'true'):
+            # Only what FEFO dispensing may use, earliest expiry first.
+            queryset = queryset.filter(
+                is_recalled=False, expiry_date__gt=timezone.localdate(), stock_qty__gt=0,
+            ).order_by('expiry_date', 'pk')
+        return queryset
+
+    @action(detail=False, methods=['post'])
+    def grn(self, request):
+        """
+        Book a supplier invoice: {"invoice_number", "supplier", "lines": [{"medicine_name" | "medicine_id",
+        "generic_name", "batch_number", "expiry_date", "quantity", "purchase_price", "unit_price"}, ...]}.
+        All lines are created in one transaction, or none are.
+        """
+        staff = Staff.objects.filter(user_email=request.user.username).first()
+        if staff is None:
+            return Response({'error': 'Staff record not found'}, status=http_status.HTTP_403_FORBIDDEN)
+
+        serializer = GoodsReceiptSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = receive_goods(serializer.validated_data, staff)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=http_status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=http_status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['get'])
     def traceability(self, request, pk=None):
         """Unique HIS Feature: Trace all patients who received this batch"""
         batch = self.get_object()
-        dispenses = PrescriptionDispense.objects.filter(batch=batch).select_related('prescription__visit__patient')
-        
-        patients = []
-        for d in dispenses:
-            patient = d.prescription.visit.patient
-            patients.append({
-                'patient_name': patient.name,
-                'uhid': patient.uhid,
-                'phone': patient.phone,
-                'dispensed_at': d.dispensed_at,
-                'quantity': d.quantity_dispensed
-            })
-        
+        patients = list(
+            PrescriptionDispense.objects.filter(batch=batch)
+            .order_by('dispensed_at')
+            .values(
+                'dispensed_at',
+                patient_name=F('prescription__visit__patient__name'),
+                uhid=F('prescription__visit__patient__uhid'),
+                phone=F('prescription__visit__patient__phone'),
+                quantity=F('quantity_dispensed'),
+            )
+        )
+
         return Response({
             'batch_number': batch.batch_number,
             'medicine': batch.medicine.name,
             'patients_affected': patients
         })
 
+    @action(detail=False, methods=['get'])
+    def as_of(self, request):
+        """
+        Ledger stock per batch at a point in time.
+        Query params: date (YYYY-MM-DD, closing balance) or at (ISO datetime), optional medicine.
+        """
+        try:
+            if request.query_params.get('at'):
+                at = parse_datetime(request.query_params['at'])
+                if at is not None and timezone.is_naive(at):
+                    at = timezone.make_aware(at)
+            else:
+                day = parse_date(request.query_params.get('date', ''))
+                at = end_of_day(day) if day else None
+        except ValueError:
+            at = None
+        if at is None:
+            return Response({'error': 'Provide date=YYYY-MM-DD or at=<ISO datetime>'}, status=http_status.HTTP_400_BAD_REQUEST)
+        try:
+            medicine_id = int(request.query_params['medicine']) if request.query_params.get('medicine') else None
+        except ValueError:
+            return Response({'error': 'medicine must be an integer id'}, status=http_status.HTTP_400_BAD_REQUEST)
+
+        batches = MedicineBatch.objects.order_by('medicine_id', 'expiry_date')
+        if medicine_id:
+            batches = batches.filter(medicine_id=medicine_id)
+        batches = list(batches.values('batch_id', 'batch_number', 'medicine_id', 'medicine__name', 'expiry_date'))
+
+        balances = stock_as_of(at, [b['batch_id'] for b in batches] if medicine_id else None)
+        return Response({
+            'as_of': at,
+            'batches': [
+                {
+                    'batch_id': b['batch_id'],
+                    'batch_number': b['batch_number'],
+                    'medicine_id': b['medicine_id'],
+                    'medicine_name': b['medicine__name'],
+                    'expiry_date': b['expiry_date'],
+                    'stock_qty': balances.get(b['batch_id'], 0),
+                }
+                for b in batches
+            ],
+        })
+
+    @action(detail=False, methods=['get'])
+    def reconciliation(self, request):
+        """Stock-take report: batches where stock_qty and the transaction ledger disagree."""
+        try:
+            medicine_id = int(request.query_params['medicine']) if request.query_params.get('medicine') else None
+        except ValueError:
+            return Response({'error': 'medicine must be an integer id'}, status=http_status.HTTP_400_BAD_REQUEST)
+        return Response(reconcile_stock(medicine_id))
+
+class BatchRecallViewSet(ModelViewSet):
+    """
+    Manufacturer recalls. POST {"batch_ids": [...], "reason": "...", "artifact_format": "csv"|"ndjson"}
+    takes the batches out of circulation at once and queues the traceability job.
+    """
+    queryset = BatchRecall.objects.all()
+    serializer_class = BatchRecallSerializer
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    def get_queryset(self):
+        return BatchRecall.objects.select_related('initiated_by').prefetch_related('batches').order_by('-created_at')
+
+    def perform_create(self, serializer):
+        serializer.save(initiated_by=Staff.objects.filter(user_email=self.request.user.username).first())
+
+    @action(detail=True, methods=['get'])
+    def artifact(self, request, pk=None):
+        """Download the affected-patient list (CSV or NDJSON)."""
+        recall = self.get_object()
+        if not recall.artifact:
+            return Response({'error': 'Recall has not finished yet', 'status': recall.status}, status=http_status.HTTP_404_NOT_FOUND)
+        content_type = 'text/csv' if recall.artifact_format == 'csv' else 'application/x-ndjson'
+        return FileResponse(
+            recall.artifact.open('rb'), as_attachment=True,
+            filename=f"recall-{recall.pk}.{recall.artifact_format}", content_type=content_type,
+        )
+
+
 class StockTransactionViewSet(ModelViewSet):
     queryset = StockTransaction.objects.all()
     serializer_class = StockTransactionSerializer
@@ -556,38 +929,75 @@ class MedicineViewSet(ModelViewSet):
     queryset = Medicine.objects.all()
     serializer_class = MedicineSerializer
 
+    def get_queryset(self):
+        return Medicine.objects.with_stock().prefetch_related('batches')
+
     @action(detail=False, methods=['get'])
     def low_stock(self, request):
         """Get medicines where total stock is less than reorder level"""
-        medicines = Medicine.objects.all()
-        low_stock_list = [m for m in medicines if m.total_stock < m.reorder_level]
+        low_stock_list = self.get_queryset().filter(stock_total__lt=F('reorder_level'))
         serializer = self.get_serializer(low_stock_list, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def substitutes(self, request, pk=None):
+        """In-stock brands with the same generic name and category, nearest expiry first."""
+        try:
+            medicine_id = int(pk)
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid medicine id'}, status=http_status.HTTP_400_BAD_REQUEST)
+        result = find_substitutes(medicine_id)
+        if result is None:
+            return Response({'error': 'Medicine not found'}, status=http_status.HTTP_404_NOT_FOUND)
+        return Response(result)
+
+    @action(detail=False, methods=['get'])
+    def reorder_suggestions(self, request):
+        """
+        Latest nightly purchase suggestions, most urgent (least cover) first.
+        ?all=true also lists medicines that need no order.
+        """
+        latest = ReorderSuggestion.objects.order_by('-computed_on').values_list('computed_on', flat=True).first()
+        suggestions = ReorderSuggestion.objects.filter(computed_on=latest).select_related('medicine')
+        if request.query_params.get('all', '').lower() not in ('1', 'true'):
+            suggestions = suggestions.filter(suggested_qty__gt=0)
+        suggestions = suggestions.order_by(F('days_of_cover').asc(nulls_last=True), 'medicine__name')
+        return Response({
+            'computed_on': latest,
+            'results': ReorderSuggestionSerializer(suggestions, many=True).data,
+        })
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get advanced pharmacy statistics across batches"""
-        from django.utils import timezone
-        today = timezone.now().date()
-        
-        total_medicines = Medicine.objects.count()
-        batches = MedicineBatch.objects.all()
-        
-        low_stock_count = sum(1 for m in Medicine.objects.all() if m.total_stock < m.reorder_level)
-        expired_count = batches.filter(expiry_date__lt=today).count()
-        expiring_soon_count = batches.filter(expiry_date__gte=today, expiry_date__lte=today + timezone.timedelta(days=30)).count()
-        
-        total_value = sum(b.stock_qty * b.unit_price for b in batches)
-        
+        today = timezone.localdate()
+
+        batch_stats = MedicineBatch.objects.aggregate(
+            active_batches=Count('pk'),
+            inventory_valuation=Coalesce(
+                Sum(F('stock_qty') * F('unit_price'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+                Decimal('0'),
+            ),
+        )
+        low_stock_count = Medicine.objects.with_stock().filter(stock_total__lt=F('reorder_level')).count()
+        buckets = bucket_totals(today)
+
         return Response({
-            'total_medicines': total_medicines,
-            'active_batches': batches.count(),
+            'total_medicines': Medicine.objects.count(),
+            'active_batches': batch_stats['active_batches'],
             'low_stock_count': low_stock_count,
-            'expired_count': expired_count,
-            'expiring_soon_count': expiring_soon_count,
-            'inventory_valuation': total_value
+            'expired_count': buckets['EXPIRED'],
+            'expiring_soon_count': buckets['DAYS_30'],
+            'expiry_buckets': buckets,
+            'inventory_valuation': batch_stats['inventory_valuation']
         })
 
+class PrescriptionQueuePagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
 class PrescriptionViewSet(ModelViewSet):
     queryset = Prescription.objects.all()
     serializer_class = PrescriptionSerializer
@@ -595,7 +1005,7 @@ class PrescriptionViewSet(ModelViewSet):
     def get_queryset(self):
         queryset = Prescription.objects.all().select_related(
             'visit__patient', 'visit__doctor', 'medicine', 'dispensed_by'
-        )
+        ).prefetch_related('medicine__batches')
         visit_id = self.request.query_params.get('visit')
         status = self.request.query_params.get('status')
         patient_id = self.request.query_params.get('patient')
@@ -609,107 +1019,98 @@ class PrescriptionViewSet(ModelViewSet):
             
         return queryset
 
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            prescription = serializer.save()
+            reservation = reserve_stock(prescription)
+        data = dict(serializer.data)
+        data['reserved_quantity'] = reservation['reserved']
+        data['reservation_shortfall'] = reservation['shortfall']
+        return Response(data, status=http_status.HTTP_201_CREATED)
+
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        previous = (instance.status, instance.quantity, instance.medicine_id)
+        with transaction.atomic():
+            prescription = serializer.save()
+            sync_reservation(prescription, *previous)
+
     @action(detail=False, methods=['get'])
     def pending(self, request):
-        """Get all pending prescriptions"""
-        pending_prescriptions = self.get_queryset().filter(status='PENDING').order_by('-created_at')
-        serializer = self.get_serializer(pending_prescriptions, many=True)
-        return Response(serializer.data)
+        """
+        Paged pending queue (?page=, ?page_size=, plus the list filters).
+        Rows carry medicine name and available stock; pages are cached for a few seconds.
+        """
+        key = queue_cache_key(request.query_params)
+        data = cached_page(key)
+        if data is None:
+            queryset = pending_queue(self.filter_queryset(self.get_queryset()).prefetch_related(None))
+            paginator = PrescriptionQueuePagination()
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            data = paginator.get_paginated_response(PendingPrescriptionSerializer(page, many=True).data).data
+            cache_page(key, data)
+        return Response(data)
 
     @action(detail=True, methods=['post'])
     def dispense(self, request, pk=None):
-        """Dispense a prescription and update stock"""
+        """
+        Dispense a prescription and update stock.
+        Quantity is split across batches First-Expiry-First-Out unless batch_id is given.
+        """
         prescription = self.get_object()
-        
-        # Validate prescription status
-        if prescription.status == 'DISPENSED':
-            return Response(
-                {'error': 'Prescription has already been dispensed'},
-                status=http_status.HTTP_400_BAD_REQUEST
-            )
-        
-        if prescription.status == 'CANCELLED':
-            return Response(
-                {'error': 'Cannot dispense cancelled prescription'},
-                status=http_status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Get quantity and batch
-        quantity_to_dispense = request.data.get('quantity_dispensed', prescription.quantity)
-        batch_id = request.data.get('batch_id')
-        notes = request.data.get('notes', '')
-        
+
         # Get authenticated pharmacist
         try:
             pharmacist = Staff.objects.get(user_email=request.user.username)
         except Staff.DoesNotExist:
             return Response({'error': 'Pharmacist record not found'}, status=403)
 
-        if batch_id:
-            batch = get_object_or_404(MedicineBatch, pk=batch_id)
-        else:
-            # FEFO Auto-selection if no batch specified
-            batch = MedicineBatch.objects.filter(
-                medicine=prescription.medicine, 
-                stock_qty__gte=quantity_to_dispense,
-                expiry_date__gt=timezone.now().date()
-            ).order_by('expiry_date').first()
-            
-            if not batch:
-                return Response({'error': 'No valid batches available with sufficient stock'}, status=400)
-
-        # Check stock availability
-        if batch.stock_qty < quantity_to_dispense:
-            return Response(
-                {
-                    'error': f'Batch {batch.batch_number} has insufficient stock',
-                    'available': batch.stock_qty,
-                    'required': quantity_to_dispense
-                },
-                status=http_status.HTTP_400_BAD_REQUEST
+        try:
+            prescription = dispense_prescription(
+                prescription.pk,
+                pharmacist,
+                quantity=request.data.get('quantity_dispensed'),
+                batch_id=request.data.get('batch_id'),
+                notes=request.data.get('notes', ''),
             )
-        
-        # 1. Update batch stock
-        batch.stock_qty -= quantity_to_dispense
-        batch.save()
-        
-        # 2. Create Stock Transaction
-        StockTransaction.objects.create(
-            batch=batch,
-            transaction_type='DISPENSE',
-            quantity=-quantity_to_dispense,
-            reference_id=f"Presc-{prescription.prescription_id}",
-            performed_by=pharmacist,
-            notes=notes
-        )
-        
-        # 3. Create dispense record
-        PrescriptionDispense.objects.create(
-            prescription=prescription,
-            medicine=prescription.medicine,
-            batch=batch,
-            quantity_dispensed=quantity_to_dispense,
-            dispensed_by=pharmacist,
-            notes=notes
-        )
-        
-        # 4. Update prescription status
-        if quantity_to_dispense >= (prescription.quantity - sum(d.quantity_dispensed for d in prescription.dispenses.all())):
-            prescription.status = 'DISPENSED'
-        else:
-            prescription.status = 'PARTIALLY_DISPENSED'
-        
-        prescription.dispensed_at = timezone.now()
-        prescription.dispensed_by = pharmacist
-        prescription.save()
-        
+        except DispenseError as e:
+            return Response(e.detail, status=http_status.HTTP_400_BAD_REQUEST)
+
         return Response(self.get_serializer(prescription).data)
 
+    @action(detail=False, methods=['post'])
+    def dispense_batch(self, request):
+        """
+        Dispense many prescriptions (e.g. a discharge) in one locked transaction.
+        Body: {"items": [{"prescription_id", "quantity"?, "batch_id"?}, ...]} or
+        {"prescription_ids": [...]} to dispense each outstanding amount; optional notes.
+        """
+        items = request.data.get('items')
+        if items is None and isinstance(request.data.get('prescription_ids'), list):
+            items = [{'prescription_id': pk} for pk in request.data['prescription_ids']]
+        if not isinstance(items, list) or not items or not all(isinstance(i, dict) for i in items):
+            return Response({'error': 'Provide items or prescription_ids'}, status=http_status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_BATCH_DISPENSE:
+            return Response({'error': f'At most {MAX_BATCH_DISPENSE} prescriptions per request'}, status=http_status.HTTP_400_BAD_REQUEST)
+
+        pharmacist = Staff.objects.filter(user_email=request.user.username).first()
+        if pharmacist is None:
+            return Response({'error': 'Pharmacist record not found'}, status=403)
+
+        results = dispense_many(items, pharmacist, notes=request.data.get('notes', ''))
+        dispensed = sum(1 for r in results if r['ok'])
+        return Response(
+            {'dispensed': dispensed, 'failed': len(results) - dispensed, 'results': results},
+            status=http_status.HTTP_200_OK if dispensed else http_status.HTTP_400_BAD_REQUEST,
+        )
+
 
 from .permissions import IsDoctorOrNurse
 from rest_framework.permissions import IsAuthenticated
 
-class OperationViewSet(ModelViewSet):
+class OperationViewSet(BulkTransitionMixin, ModelViewSet):
     queryset = Operation.objects.all()
     serializer_class = OperationSerializer
     permission_classes = [IsAuthenticated, IsDoctorOrNurse]
@@ -727,6 +1128,22 @@ class OperationViewSet(ModelViewSet):
             
         return queryset
 
+    @action(detail=False, methods=['get'])
+    def board(self, request):
+        """
+        OT board: every room's bookings for ?date=YYYY-MM-DD (default today),
+        with overlapping bookings flagged in conflicts_with.
+        """
+        day = timezone.localdate()
+        if request.query_params.get('date'):
+            try:
+                day = parse_date(request.query_params['date'])
+            except ValueError:
+                day = None
+            if day is None:
+                return Response({'error': 'date must be YYYY-MM-DD'}, status=http_status.HTTP_400_BAD_REQUEST)
+        return Response({'date': day, 'rooms': ot_board(day)})
+
 class PrescriptionDispenseViewSet(ModelViewSet):
     queryset = PrescriptionDispense.objects.all()
     serializer_class = PrescriptionDispenseSerializer
@@ -1033,41 +1450,18 @@ from django.shortcuts import get_object_or_404
 
 class DoctorPatientProfileView(APIView):
     def get(self, request, pk):
-        patient = get_object_or_404(Patient, pk=pk)
-        
-        # Get all visits for history
-        visits = Visit.objects.filter(patient=patient).order_by('-visit_date')
-        
-        visit_history = []
-        for v in visits:
-            # Try to get diagnosis from clinical note
-            note = ClinicalNote.objects.filter(visit=v).first()
-            diagnosis = v.chief_complaint or 'Routine Checkup'
-            if note and hasattr(note, 'diagnosis'):
-                 diagnosis = note.diagnosis
-            
-            visit_history.append({
-                'date': v.visit_date,
-                'diagnosis': diagnosis, 
-                'status': v.status,
-                'visit_id': v.id
-            })
-
-        # Get latest vitals (from any visit, sorted by recorded_at)
-        latest_vital = Vital.objects.filter(visit__patient=patient).order_by('-recorded_at').first()
-        
-        # Construct Vitals object
-        vitals_data = {}
-        if latest_vital:
-            vitals_data = {
-                'bp': f"{latest_vital.bp_systolic}/{latest_vital.bp_diastolic}",
-                'hr': latest_vital.pulse,
-                'temp': latest_vital.temperature,
-                'weight': 'N/A' 
-            }
-        else:
-            vitals_data = { 'bp': 'N/A', 'hr': 'N/A', 'temp': 'N/A', 'weight': 'N/A' }
-
+        chart = PatientChart.objects.select_related('patient').filter(patient_id=pk).first()
+        if chart is None:
+            patient = get_object_or_404(Patient, pk=pk)
+            chart = build_chart(patient.pk)
+            chart.patient = patient
+
+        etag = f'"chart-{chart.patient_id}-{chart.version}"'
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=http_status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        patient = chart.patient
+        allergies = ', '.join(f"{a['allergen']} ({a['severity']})" for a in chart.allergies)
         data = {
             'id': patient.id,
             'name': patient.name,
@@ -1075,13 +1469,15 @@ class DoctorPatientProfileView(APIView):
             'gender': patient.gender,
             'phone': patient.phone,
             'bloodType': patient.blood_group,
-            'allergies': 'None known', 
+            'allergies': allergies or 'None known',
+            'allergyList': chart.allergies,
             'conditions': patient.medical_history or 'No major conditions recorded.',
-            'lastVisit': visits.first().visit_date if visits.exists() else 'N/A',
-            'visitHistory': visit_history,
-            'vitals': vitals_data
+            'lastVisit': chart.visit_history[0]['date'] if chart.visit_history else 'N/A',
+            'visitHistory': chart.visit_history,
+            'vitals': chart.latest_vitals,
+            'activePrescriptions': chart.active_prescriptions,
         }
-        return Response(data)
+        return Response(data, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
 
 class AllergyViewSet(ModelViewSet):
     queryset = Allergy.objects.all()
@@ -1246,39 +1642,64 @@ class ExportPatientEHRView(APIView):
             return Response({'error': 'Patient not found'}, status=404)
             return Response({'error': str(e)}, status=500)
 
+class NotificationPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
 class NotificationViewSet(ModelViewSet):
     queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationPagination
+
+    @property
+    def audience(self):
+        # Recipient (Staff) or Patient filter for the current user, resolved once per request
+        if not hasattr(self, '_audience'):
+            self._audience = audience_for(self.request.user)
+        return self._audience
 
     def get_queryset(self):
-        user = self.request.user
-        queryset = Notification.objects.all()
-        
-        # Filter by recipient (Staff) or Patient
-        try:
-            staff = Staff.objects.get(user_email=user.username)
-            queryset = queryset.filter(recipient=staff)
-        except Staff.DoesNotExist:
-             try:
-                 patient = Patient.objects.filter(email=user.email).first()
-                 if patient:
-                    queryset = queryset.filter(patient=patient)
-                 else:
-                    return Notification.objects.none()
-             except Exception:
-                 return Notification.objects.none()
-                 
-        return queryset
+        if self.audience is None:
+            return Notification.objects.none()
+        return (
+            Notification.objects.filter(**self.audience)
+            .select_related('recipient', 'patient')
+            .order_by('-created_at', '-id')
+        )
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        reset_unread(self.audience)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        reset_unread(self.audience)
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        if self.audience is None:
+            return Response({'unread': 0})
+        return Response({'unread': unread_count(self.audience)})
+
+    @action(detail=False, methods=['post'])
+    def stream_ticket(self, request):
+        """Single-use ticket for GET /api/notifications/stream/?ticket=..., valid for TICKET_SECONDS."""
+        return Response({'ticket': issue_ticket(request.user), 'expires_in': TICKET_SECONDS})
 
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         notification = self.get_object()
-        notification.is_read = True
-        notification.save()
+        updated = Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True)
+        notifications_read(self.audience, updated)
         return Response({'status': 'marked as read'})
     
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
-        self.get_queryset().update(is_read=True)
-        return Response({'status': 'all marked as read'})
+        if self.audience is None:
+            return Response({'status': 'all marked as read', 'updated': 0})
+        updated = Notification.objects.filter(is_read=False, **self.audience).update(is_read=True)
+        notifications_read(self.audience, updated)
+        return Response({'status': 'all marked as read', 'updated': updated})
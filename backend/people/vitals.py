@@ -0,0 +1,202 @@
+"""
+Vitals time-series helpers.
+
+Readings are pulled with a single values_list() query ordered by recorded_at
+and reduced here with NumPy, so long ICU stays come back as a few hundred
+min/max/avg buckets instead of thousands of serialized rows.
+"""
+import math
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Visit, Vital
+from .news2 import early_warning_scores
+from .chart import refresh_chart
+
+# Numeric Vital columns exposed by the trend API, in output order.
+VITAL_SERIES = ('bp_systolic', 'bp_diastolic', 'pulse', 'temperature', 'spo2')
+
+# Accepted (min, max) per reading; temperature is in °F like the nurse form.
+VITAL_LIMITS = {
+    'bp_systolic': (40, 300),
+    'bp_diastolic': (20, 200),
+    'pulse': (20, 300),
+    'temperature': (80, 115),
+    'spo2': (0, 100),
+}
+
+INGEST_CHUNK_SIZE = 1000
+
+
+def downsample_vitals(rows, points):
+    """
+    Bucket (recorded_at, *VITAL_SERIES) rows into at most `points` equal-width
+    time buckets.
+
+    Rows must be ordered by recorded_at. Returns columnar data: bucket start
+    timestamps (epoch milliseconds) and, per series, avg/min/max arrays.
+    Empty buckets are dropped.
+    """
+    n = len(rows)
+    if n == 0:
+        return {
+            'timestamps': [],
+            'series': {name: {'avg': [], 'min': [], 'max': []} for name in VITAL_SERIES},
+        }
+
+    times = np.fromiter((r[0].timestamp() for r in rows), dtype=float, count=n)
+    values = np.array([r[1:] for r in rows], dtype=float)
+
+    span = times[-1] - times[0]
+    width = span / points if span > 0 else 1.0
+    bucket = np.minimum(((times - times[0]) // width).astype(np.int64), points - 1)
+
+    # Rows are time ordered, so each bucket is a contiguous run.
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, n])
+
+    mins = np.minimum.reduceat(values, starts, axis=0)
+    maxs = np.maximum.reduceat(values, starts, axis=0)
+    avgs = np.add.reduceat(values, starts, axis=0) / counts[:, None]
+
+    bucket_starts = times[0] + bucket[starts] * width
+    series = {}
+    for col, name in enumerate(VITAL_SERIES):
+        series[name] = {
+            'avg': np.round(avgs[:, col], 1).tolist(),
+            'min': mins[:, col].tolist(),
+            'max': maxs[:, col].tolist(),
+        }
+
+    return {
+        'timestamps': (bucket_starts * 1000).astype(np.int64).tolist(),
+        'series': series,
+    }
+
+
+def score_vitals(vitals):
+    """Early warning scores for a list of Vital instances, computed in one pass."""
+    columns = np.array(
+        [(v.bp_systolic, v.pulse, float(v.temperature), v.spo2) for v in vitals], dtype=float
+    ).reshape(-1, 4)
+    return early_warning_scores(*columns.T).tolist()
+
+
+def _vital_fields(values):
+    """Map a validated VITAL_SERIES float row onto Vital column types."""
+    fields = {name: int(round(value)) for name, value in zip(VITAL_SERIES, values)}
+    fields['temperature'] = Decimal(str(round(values[VITAL_SERIES.index('temperature')], 1)))
+    return fields
+
+
+def ingest_readings(readings, recorder, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Validate and insert a batch of monitor readings recorded by `recorder`.
+
+    Each reading is a dict with visit, the VITAL_SERIES values and an optional
+    recorded_at. Invalid rows are reported by index and skipped; the rest are
+    inserted with bulk_create in chunks. Returns {'ids': [...], 'errors': [...]}.
+    """
+    errors = {}
+    parsed = []  # (index, visit_id, recorded_at, values)
+    now = timezone.now()
+
+    for index, reading in enumerate(readings):
+        if not isinstance(reading, dict):
+            errors[index] = {'non_field_errors': 'Reading must be an object.'}
+            continue
+
+        row_errors = {}
+        try:
+            visit_id = int(reading.get('visit'))
+        except (TypeError, ValueError):
+            row_errors['visit'] = 'A valid visit id is required.'
+
+        values = []
+        for name in VITAL_SERIES:
+            try:
+                value = float(reading[name])
+            except KeyError:
+                row_errors[name] = 'This field is required.'
+                continue
+            except (TypeError, ValueError):
+                row_errors[name] = 'A number is required.'
+                continue
+            # float() accepts "NaN"/"inf", which slip past the range checks.
+            if not math.isfinite(value):
+                row_errors[name] = 'A finite number is required.'
+            else:
+                values.append(value)
+
+        recorded_at = now
+        if reading.get('recorded_at'):
+            try:
+                # None for a malformed string, ValueError for an impossible date (Feb 30).
+                recorded_at = parse_datetime(str(reading['recorded_at']))
+            except ValueError:
+                recorded_at = None
+            if recorded_at is None:
+                row_errors['recorded_at'] = 'A valid ISO datetime is required.'
+            elif timezone.is_naive(recorded_at):
+                recorded_at = timezone.make_aware(recorded_at)
+
+        if row_errors:
+            errors[index] = row_errors
+        else:
+            parsed.append((index, visit_id, recorded_at, values))
+
+    if parsed:
+        # Range checks for the whole batch at once.
+        matrix = np.array([row[3] for row in parsed], dtype=float)
+        lows = np.array([VITAL_LIMITS[name][0] for name in VITAL_SERIES])
+        highs = np.array([VITAL_LIMITS[name][1] for name in VITAL_SERIES])
+        out_of_range = (matrix < lows) | (matrix > highs)
+
+        visit_patients = dict(
+            Visit.objects.filter(id__in={row[1] for row in parsed}).values_list('id', 'patient_id')
+        )
+
+        valid = []
+        for row, bad in zip(parsed, out_of_range):
+            index, visit_id, recorded_at, values = row
+            row_errors = {}
+            if visit_id not in visit_patients:
+                row_errors['visit'] = f'Visit {visit_id} does not exist.'
+            for col in np.flatnonzero(bad):
+                name = VITAL_SERIES[col]
+                low, high = VITAL_LIMITS[name]
+                row_errors[name] = f'Must be between {low} and {high}.'
+            if row_errors:
+                errors[index] = row_errors
+            else:
+                valid.append(row)
+        parsed = valid
+
+    vitals = [
+        Vital(
+            visit_id=visit_id,
+            nurse=recorder,
+            recorded_at=recorded_at,
+            **_vital_fields(values),
+        )
+        for _, visit_id, recorded_at, values in parsed
+    ]
+    if vitals:
+        # bulk_create skips Vital.save(), so score the batch here.
+        scores = score_vitals(vitals)
+        for vital, score in zip(vitals, scores):
+            vital.early_warning_score = score
+    with transaction.atomic():
+        created = Vital.objects.bulk_create(vitals, batch_size=chunk_size)
+        if created:
+            # bulk_create sends no post_save, so refresh the chart projections here.
+            refresh_chart({visit_patients[v.visit_id] for v in created}, 'latest_vitals')
+
+    return {
+        'ids': [vital.pk for vital in created],
+        'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)],
+    }
@@ -1,6 +1,9 @@
 
 import { useState, useEffect, useRef } from 'react';
-import api from '../services/api';
+import api, { API_BASE_URL } from '../services/api';
+
+// Matches the retry delay the server sends with the stream.
+const STREAM_RECONNECT_MS = 5000;
 
 const NotificationBell = () => {
     const [notifications, setNotifications] = useState([]);
@@ -8,29 +11,75 @@ const NotificationBell = () => {
     const [isOpen, setIsOpen] = useState(false);
     const dropdownRef = useRef(null);
 
-    // Fetch notifications
-    const fetchNotifications = async () => {
+    // The bell only needs the count; the list is loaded when the dropdown opens
+    const fetchUnreadCount = async () => {
         try {
-            const response = await api.get('/notifications/'); // Assuming registered as /api/notifications/
-            const data = response.data.results || response.data; // Handle pagination if any
-
-            // Sort by createdAt desc
-            const sorted = Array.isArray(data) ? data.sort((a, b) => new Date(b.created_at) - new Date(a.created_at)) : [];
-            setNotifications(sorted);
+            const response = await api.get('/notifications/unread_count/');
+            setUnreadCount(response.data.unread);
+        } catch (error) {
+            console.error("Failed to fetch unread count", error);
+        }
+    };
 
-            setUnreadCount(sorted.filter(n => !n.is_read).length);
+    const fetchNotifications = async () => {
+        try {
+            const response = await api.get('/notifications/');
+            setNotifications(response.data.results || response.data); // Newest first
         } catch (error) {
             console.error("Failed to fetch notifications", error);
         }
     };
 
     useEffect(() => {
-        fetchNotifications();
-        // Poll every 30 seconds
-        const interval = setInterval(fetchNotifications, 30000);
-        return () => clearInterval(interval);
+        if (!localStorage.getItem('token')) return undefined;
+
+        let source = null;
+        let retryTimer = null;
+        let stopped = false;
+
+        const reconnectLater = () => {
+            if (!stopped) retryTimer = setTimeout(connect, STREAM_RECONNECT_MS);
+        };
+
+        const connect = async () => {
+            let ticket;
+            try {
+                // EventSource cannot send the Authorization header, so trade the JWT for a single-use ticket
+                ticket = (await api.post('/notifications/stream_ticket/')).data.ticket;
+            } catch (error) {
+                console.error("Failed to open notification stream", error);
+                reconnectLater();
+                return;
+            }
+            if (stopped) return;
+
+            source = new EventSource(`${API_BASE_URL}/notifications/stream/?ticket=${encodeURIComponent(ticket)}`);
+            // 'ready' fires on every (re)connect, so anything sent while disconnected is counted.
+            source.addEventListener('ready', fetchUnreadCount);
+            source.onmessage = (event) => {
+                const notification = JSON.parse(event.data);
+                setNotifications(prev => [notification, ...prev.filter(n => n.id !== notification.id)]);
+                if (!notification.is_read) setUnreadCount(prev => prev + 1);
+            };
+            // The ticket is spent, so the browser's own retry would be refused: reconnect with a fresh one.
+            source.onerror = () => {
+                source.close();
+                reconnectLater();
+            };
+        };
+
+        connect();
+        return () => {
+            stopped = true;
+            clearTimeout(retryTimer);
+            if (source) source.close();
+        };
     }, []);
 
+    useEffect(() => {
+        if (isOpen) fetchNotifications();
+    }, [isOpen]);
+
     // Close on click outside
     useEffect(() => {
         const handleClickOutside = (event) => {
@@ -56,6 +56,8 @@ export default function PatientDetailsModal({ patient: selectedPatient, onClose,
         operation_name: '',
         price: 0
     });
+    const [orderSets, setOrderSets] = useState([]);
+    const [selectedOrderSet, setSelectedOrderSet] = useState('');
 
     // Prescriptions State
     const [medicines, setMedicines] = useState([]);
@@ -113,6 +115,7 @@ export default function PatientDetailsModal({ patient: selectedPatient, onClose,
             if (activeTab === 'notes') fetchNotes();
             if (activeTab === 'progress_notes') fetchProgressNotes();
             if (activeTab === 'orders' || activeTab === 'reports') fetchOrders();
+            if (activeTab === 'orders') fetchOrderSets();
             if (activeTab === 'operations') fetchOperations();
             if (activeTab === 'prescriptions') {
                 fetchPrescriptions();
@@ -184,6 +187,28 @@ export default function PatientDetailsModal({ patient: selectedPatient, onClose,
         }
     };
 
+    const fetchOrderSets = async () => {
+        try {
+            const response = await doctorAPI.getOrderSets();
+            setOrderSets(Array.isArray(response.data) ? response.data : []);
+        } catch (err) {
+            console.error("Failed to fetch order sets", err);
+        }
+    };
+
+    const handleOrderSetSubmit = async (e) => {
+        e.preventDefault();
+        try {
+            await doctorAPI.createOrders({ visit: selectedPatient.id, order_set: selectedOrderSet });
+            alert('Order set placed successfully');
+            setSelectedOrderSet('');
+            fetchOrders();
+        } catch (err) {
+            console.error("Failed to place order set", err);
+            alert('Failed to place order set: ' + JSON.stringify(err.response?.data?.error || err.message));
+        }
+    };
+
     const fetchOperations = async () => {
         try {
             const response = await operationAPI.getAll({ patient: selectedPatient.id });
@@ -1016,6 +1041,37 @@ export default function PatientDetailsModal({ patient: selectedPatient, onClose,
 
                     {activeTab === 'orders' && (
                         <div className="space-y-6">
+                            {/* Order Set */}
+                            {orderSets.length > 0 && (
+                                <div className="bg-gray-50 p-6 rounded-xl border border-gray-200">
+                                    <h3 className="font-semibold text-gray-900 mb-4">Place Order Set</h3>
+                                    <form onSubmit={handleOrderSetSubmit} className="flex gap-4 items-end">
+                                        <div className="flex-1">
+                                            <label className="block text-sm font-medium text-gray-700 mb-1">Order Set</label>
+                                            <select
+                                                required
+                                                value={selectedOrderSet}
+                                                onChange={(e) => setSelectedOrderSet(e.target.value)}
+                                                className="w-full p-2.5 border border-gray-300 rounded-lg focus:ring-2 focus:ring-emerald-500 bg-white"
+                                            >
+                                                <option value="">Select Order Set</option>
+                                                {orderSets.map(set => (
+                                                    <option key={set.id} value={set.id}>
+                                                        {set.name} ({set.items.length} tests)
+                                                    </option>
+                                                ))}
+                                            </select>
+                                        </div>
+                                        <button
+                                            type="submit"
+                                            className="px-6 py-2.5 bg-emerald-600 text-white rounded-lg hover:bg-emerald-700 font-medium transition-colors shadow-sm"
+                                        >
+                                            Place Orders
+                                        </button>
+                                    </form>
+                                </div>
+                            )}
+
                             {/* Order Form */}
                             <div className="bg-gray-50 p-6 rounded-xl border border-gray-200">
                                 <h3 className="font-semibold text-gray-900 mb-4">Create New Order</h3>
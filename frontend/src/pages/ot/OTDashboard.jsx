@@ -20,6 +20,7 @@ export default function OTDashboard() {
         surgeon_id: '',
         ot_room: '',
         scheduled_time: '',
+        duration_minutes: 120,
         price: 0 // Default price
     });
     const [patientPhone, setPatientPhone] = useState('');
@@ -115,6 +116,7 @@ export default function OTDashboard() {
                 details: {
                     operation_name: formData.operation_name,
                     scheduled_time: formData.scheduled_time,
+                    duration_minutes: parseInt(formData.duration_minutes, 10) || 120,
                     ot_room: formData.ot_room,
                     price: parseFloat(formData.price) || 0
                 }
@@ -367,6 +369,17 @@ export default function OTDashboard() {
                                         </div>
                                     </div>
                                 </div>
+                                <div className="col-span-2">
+                                    <label className="block text-sm font-semibold text-gray-700 mb-1.5">Expected Duration (minutes)</label>
+                                    <input
+                                        type="number"
+                                        min="15"
+                                        step="15"
+                                        className="w-full border-gray-300 rounded-lg px-4 py-2.5 focus:ring-2 focus:ring-blue-500 focus:border-blue-500 transition-shadow text-sm"
+                                        value={formData.duration_minutes}
+                                        onChange={e => setFormData({ ...formData, duration_minutes: e.target.value })}
+                                    />
+                                </div>
                                 <div className="col-span-2">
                                     <label className="block text-sm font-semibold text-gray-700 mb-1.5">Surgery Cost (₹)</label>
                                     <input
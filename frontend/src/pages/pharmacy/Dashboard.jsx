@@ -44,13 +44,13 @@ export default function PharmacyDashboard() {
 
                 // Update state
                 setStats({
-                    pendingPrescriptions: pendingPrescriptions.length,
+                    pendingPrescriptions: pendingPrescriptions.count,
                     dispensedToday: dispensedToday,
                     lowStock: statsData.low_stock_count,
                     totalMedicines: statsData.total_medicines
                 });
 
-                setPrescriptions(pendingPrescriptions);
+                setPrescriptions(pendingPrescriptions.results);
                 setLowStockMedicines(lowStock);
 
             } catch (error) {
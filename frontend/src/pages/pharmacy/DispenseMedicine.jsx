@@ -6,6 +6,8 @@ export default function DispenseMedicine() {
     const [prescriptions, setPrescriptions] = useState([]);
     const [selectedPrescription, setSelectedPrescription] = useState(null);
     const [selectedBatch, setSelectedBatch] = useState(null);
+    const [batches, setBatches] = useState([]);
+    const [substitutes, setSubstitutes] = useState([]);
     const [dispensedQty, setDispensedQty] = useState(0);
     const [searchTerm, setSearchTerm] = useState('');
     const [loading, setLoading] = useState(true);
@@ -19,8 +21,8 @@ export default function DispenseMedicine() {
         try {
             setLoading(true);
             const { prescriptionAPI } = await import('../../services/api');
-            const data = await prescriptionAPI.getPending();
-            setPrescriptions(data);
+            const data = await prescriptionAPI.getPending({ page_size: 200 });
+            setPrescriptions(data.results);
         } catch (error) {
             console.error('Error:', error);
             setPrescriptions([]);
@@ -29,12 +31,25 @@ export default function DispenseMedicine() {
         }
     };
 
-    const handleSelectPrescription = (p) => {
+    const handleSelectPrescription = async (p) => {
         setSelectedPrescription(p);
         setDispensedQty(p.quantity);
-        // Auto-select FEFO batch (first in list as backend orders by expiry_date)
-        const fefoBatch = p.medicine.batches?.find(b => b.stock_qty > 0);
-        setSelectedBatch(fefoBatch || null);
+        setBatches([]);
+        setSubstitutes([]);
+        setSelectedBatch(null);
+        try {
+            const { batchAPI, medicineAPI } = await import('../../services/api');
+            const response = await batchAPI.getAll({ medicine: p.medicine_id, available: true });
+            setBatches(response.data);
+            // Auto-select FEFO batch (backend returns usable batches earliest expiry first)
+            setSelectedBatch(response.data[0] || null);
+            if (p.available_stock < p.quantity) {
+                const data = await medicineAPI.getSubstitutes(p.medicine_id);
+                setSubstitutes(data.substitutes);
+            }
+        } catch (error) {
+            console.error('Error loading batches:', error);
+        }
     };
 
     const handleDispense = async () => {
@@ -117,7 +132,7 @@ export default function DispenseMedicine() {
                                                     <p className="text-[10px] font-semibold text-gray-400 uppercase tracking-widest leading-none">PRESC #{p.prescription_id}</p>
                                                 </div>
                                                 <span className={`px-2 py-0.5 rounded text-[10px] font-bold uppercase ${selectedPrescription?.prescription_id === p.prescription_id ? 'bg-blue-200 text-blue-800' : 'bg-gray-100 text-gray-500'}`}>
-                                                    {p.medicine.name}
+                                                    {p.medicine_name}
                                                 </span>
                                             </div>
                                             <div className="flex items-center gap-5">
@@ -146,7 +161,7 @@ export default function DispenseMedicine() {
                                     <div className="bg-white rounded-xl shadow-lg border border-gray-100 overflow-hidden animate-in slide-in-from-right-4 duration-300">
                                         <div className="bg-gradient-to-r from-blue-500 to-indigo-600 p-5 text-white flex justify-between items-center">
                                             <div>
-                                                <h2 className="text-xl font-bold">{selectedPrescription.medicine.name}</h2>
+                                                <h2 className="text-xl font-bold">{selectedPrescription.medicine_name}</h2>
                                                 <p className="text-blue-50 text-xs font-medium opacity-90">Dispensing for {selectedPrescription.patient_name}</p>
                                             </div>
                                             <div className="text-right">
@@ -164,7 +179,7 @@ export default function DispenseMedicine() {
                                                     Select Batch
                                                 </h4>
                                                 <div className="grid grid-cols-1 sm:grid-cols-2 gap-3">
-                                                    {selectedPrescription.medicine.batches?.map(batch => (
+                                                    {batches.map(batch => (
                                                         <div
                                                             key={batch.batch_id}
                                                             onClick={() => setSelectedBatch(batch)}
@@ -186,6 +201,17 @@ export default function DispenseMedicine() {
                                                         </div>
                                                     ))}
                                                 </div>
+                                                {substitutes.length > 0 && (
+                                                    <div className="mt-4 p-3 rounded-lg border border-amber-200 bg-amber-50">
+                                                        <div className="text-[10px] font-bold text-amber-700 uppercase tracking-wider mb-2">Not enough stock - in-stock equivalents</div>
+                                                        {substitutes.map(sub => (
+                                                            <div key={sub.medicine_id} className="flex justify-between text-xs text-gray-800 py-0.5">
+                                                                <span className="font-semibold">{sub.name}{sub.manufacturer ? ` (${sub.manufacturer})` : ''}</span>
+                                                                <span>{sub.available_stock} units - Exp: {sub.nearest_expiry}</span>
+                                                            </div>
+                                                        ))}
+                                                    </div>
+                                                )}
                                             </div>
 
                                             <div className="bg-gray-50 rounded-lg p-5 space-y-4 border border-gray-200/50">
@@ -1,6 +1,6 @@
 import axios from 'axios';
 
-const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://127.0.0.1:8000/api';
+export const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://127.0.0.1:8000/api';
 
 const api = axios.create({
     baseURL: API_BASE_URL,
@@ -123,6 +123,10 @@ export const medicineAPI = {
         const response = await api.get('/medicines/stats/');
         return response.data;
     },
+    getSubstitutes: async (id) => {
+        const response = await api.get(`/medicines/${id}/substitutes/`);
+        return response.data;
+    },
     create: async (data) => {
         const response = await api.post('/medicines/', data);
         return response.data;
@@ -143,8 +147,8 @@ export const prescriptionAPI = {
         const response = await api.get('/prescriptions/', { params });
         return response.data;
     },
-    getPending: async () => {
-        const response = await api.get('/prescriptions/pending/');
+    getPending: async (params) => {
+        const response = await api.get('/prescriptions/pending/', { params });
         return response.data;
     },
     create: async (data) => {
@@ -162,6 +166,10 @@ export const prescriptionAPI = {
             throw error;
         }
     },
+    dispenseBatch: async (items, notes = '') => {
+        const response = await api.post('/prescriptions/dispense_batch/', { items, notes });
+        return response.data;
+    },
     getDispenseHistory: async (prescriptionId) => {
         const params = new URLSearchParams({ prescription: prescriptionId });
         const response = await api.get(`/prescription-dispenses/?${params.toString()}`);
@@ -175,6 +183,7 @@ export const batchAPI = {
     getById: (id) => api.get(`/medicine-batches/${id}/`),
     create: (data) => api.post('/medicine-batches/', data),
     update: (id, data) => api.patch(`/medicine-batches/${id}/`, data),
+    receiveGoods: (invoice) => api.post('/medicine-batches/grn/', invoice),
     getTraceability: (id) => api.get(`/medicine-batches/${id}/traceability/`),
 };
 
@@ -189,6 +198,8 @@ export const doctorAPI = {
     getDashboard: () => api.get('/doctor/dashboard'),
     getOrders: (tab, visitId) => api.get(`/orders/?visit=${visitId}`),
     createOrder: (data) => api.post('/orders/', data),
+    createOrders: (data) => api.post('/orders/bulk/', data),
+    getOrderSets: () => api.get('/order-sets/?active=true'),
     getPatientProfile: (id) => api.get(`/doctor/patients/${id}`),
     saveConsultation: (id, data) => api.post(`/doctor/patients/${id}/consultation`, data),
     getClinicalNotes: (id) => api.get(`/doctor/patients/${id}/notes`),